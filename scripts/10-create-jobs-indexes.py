@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+import json
+import sys
+
+import pymongo
+
+
+CONFIG_PATH = '/etc/elliptics/mastermind.conf'
+
+try:
+
+    with open(CONFIG_PATH, 'r') as config_file:
+        config = json.load(config_file)
+
+except Exception as e:
+    raise ValueError('Failed to load config file %s: %s' % (CONFIG_PATH, e))
+
+
+def get_mongo_client():
+    if not config.get('metadata', {}).get('url', ''):
+        raise ValueError('Mongo db url is not set')
+    return pymongo.mongo_replica_set_client.MongoReplicaSetClient(config['metadata']['url'])
+
+
+def create_indexes(coll):
+    # active jobs are loaded by status
+    coll.ensure_index([
+        ('status', pymongo.ASCENDING),
+    ], background=True)
+    # active jobs index is refreshed incrementally by update timestamp
+    coll.ensure_index([
+        ('update_ts', pymongo.ASCENDING),
+    ], background=True)
+
+
+if __name__ == '__main__':
+
+    if len(sys.argv) < 2 or sys.argv[1] not in ('indexes',):
+        print "Usage: {0} indexes".format(sys.argv[0])
+        sys.exit(1)
+
+    coll_name = 'jobs'
+
+    if sys.argv[1] == 'indexes':
+        mc = get_mongo_client()
+        db_name = config.get('metadata', {}).get('jobs', {}).get('db', '')
+        if not db_name:
+            print 'Jobs database name is not found in config'
+            sys.exit(1)
+
+        coll = mc[db_name][coll_name]
+        create_indexes(coll)
+
+        print 'Successfully created indexes for collection {}'.format(coll_name)
@@ -202,6 +202,8 @@ def init_infrastructure(jf, ghf):
     register_handle(infstruct.recover_group_cmd)
     register_handle(infstruct.defrag_node_backend_cmd)
     register_handle(infstruct.search_history_by_path)
+    register_handle(infstruct.get_cluster_tree_stats)
+    register_handle(infstruct.get_infrastructure_cache_stats)
     b._set_infrastructure(infstruct)
     return infstruct
 
@@ -219,6 +221,7 @@ def init_node_info_updater(jf, crf, statistics):
     register_handle(niu.force_nodes_update)
     register_handle(niu.force_update_namespaces_states)
     register_handle(niu.force_update_flow_stats)
+    register_handle(niu.get_cluster_update_stats)
 
     return niu
 
@@ -235,6 +238,7 @@ def init_minions():
     register_handle(m.get_commands)
     register_handle(m.execute_cmd)
     register_handle(m.terminate_cmd)
+    register_handle(m.get_minion_states_fetch_stats)
     return m
 
 
@@ -243,6 +247,7 @@ def init_planner(job_processor, niu):
     register_handle(planner.restore_group)
     register_handle(planner.move_group)
     register_handle(planner.move_groups_from_host)
+    register_handle(planner.get_planner_stats)
     return planner
 
 
@@ -257,6 +262,7 @@ def init_job_finder():
     register_handle(jf.get_job_list)
     register_handle(jf.get_job_status)
     register_handle(jf.get_jobs_status)
+    register_handle(jf.get_active_jobs_index_stats)
     return jf
 
 
@@ -299,12 +305,15 @@ def init_job_processor(jf, minions, niu):
     register_handle(j.skip_failed_job_task)
     register_handle(j.restart_failed_to_start_job)
     register_handle(j.build_lrc_groups)
+    register_handle(j.get_job_processor_stats)
+    register_handle(j.check_jobs_resources)
     return j
 
 
 def init_manual_locker(manual_locker):
     register_handle(manual_locker.host_acquire_lock)
     register_handle(manual_locker.host_release_lock)
+    register_handle(manual_locker.get_locked_hosts_state)
     return manual_locker
 
 
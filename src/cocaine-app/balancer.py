@@ -21,8 +21,8 @@ import infrastructure
 import inventory
 import jobs.job
 import keys
+import listings
 from mastermind_core.response import CachedGzipResponse
-from mastermind_core.helpers import gzip_compress
 import monitor
 import statistics
 import storage
@@ -48,6 +48,13 @@ class Balancer(object):
     MIN_NS_UNITS = config.get('balancer_config', {}).get('min_units', 1)
     ADD_NS_UNITS = config.get('balancer_config', {}).get('add_units', 1)
 
+    # limits of combinations search performed on every level of cluster tree
+    # when choosing groups for a couple
+    CHOOSE_GROUPS_MAX_VISITED = config.get('balancer_config', {}).get(
+        'choose_groups_max_visited', 100000)
+    CHOOSE_GROUPS_TIME_BUDGET = config.get('balancer_config', {}).get(
+        'choose_groups_time_budget', 2.0)
+
     CLUSTER_CHANGES_LOCK = 'cluster'
 
     MAKE_IOLOOP = 'make_ioloop'
@@ -78,6 +85,16 @@ class Balancer(object):
         else:
             self._keys_db = Collection(meta_db[keys_db_uri], 'keys')
 
+        self._choose_groups_stats = {
+            'calls': 0,
+            'evaluated': 0,
+            'visited': 0,
+            'incomplete': 0,
+            'timeouts': 0,
+            'greedy': 0,
+            'time': 0.0,
+        }
+
         self.__tq = timed_queue.TimedQueue()
         self.__tq.add_task_in(
             self.MAKE_IOLOOP,
@@ -106,8 +123,42 @@ class Balancer(object):
     def _set_infrastructure(self, infrastructure):
         self.infrastructure = infrastructure
 
+    def _listings_snapshot(self):
+        """Get the latest published listings snapshot
+
+        Returns None if no snapshot has been built yet, live storage
+        should be used in this case.
+        """
+        if self.niu is None:
+            return None
+        return self.niu._listings.snapshot
+
+    @staticmethod
+    def _versioned_result(options, snapshot, get_result):
+        """Wrap listing result with listings snapshot version if requested
+
+        Listing is not returned at all if client already has
+        the current version of it ("known_version" option).
+        """
+        if not isinstance(options, dict) or 'known_version' not in options:
+            return get_result()
+        version = snapshot.version if snapshot else None
+        if version is not None and options['known_version'] == version:
+            return {'version': version, 'items': None}
+        return {'version': version, 'items': get_result()}
+
+    @h.concurrent_handler
+    def get_listings_version(self, request):
+        snapshot = self._listings_snapshot()
+        if snapshot is None:
+            return {'version': None, 'timestamp': None}
+        return {'version': snapshot.version, 'timestamp': snapshot.timestamp}
+
     @h.concurrent_handler
     def get_symmetric_groups(self, request):
+        snapshot = self._listings_snapshot()
+        if snapshot:
+            return snapshot.couple_tuples('good')
         result = self._good_couples()
         logger.debug('good_symm_groups: ' + str(result))
         return result
@@ -118,6 +169,9 @@ class Balancer(object):
 
     @h.concurrent_handler
     def get_bad_groups(self, request):
+        snapshot = self._listings_snapshot()
+        if snapshot:
+            return snapshot.couple_tuples('bad')
         # TODO: decide if lrc groupsets should be here
         result = [couple.as_tuple() for couple in storage.replicas_groupsets if couple.status not in storage.NOT_BAD_STATUSES]
         logger.debug('bad_symm_groups: ' + str(result))
@@ -125,6 +179,9 @@ class Balancer(object):
 
     @h.concurrent_handler
     def get_frozen_groups(self, request):
+        snapshot = self._listings_snapshot()
+        if snapshot:
+            return snapshot.couple_tuples('frozen')
         result = self._frozen_couples()
         logger.debug('frozen_couples: ' + str(result))
         return result
@@ -134,6 +191,9 @@ class Balancer(object):
 
     @h.concurrent_handler
     def get_closed_groups(self, request):
+        snapshot = self._listings_snapshot()
+        if snapshot:
+            return snapshot.couple_tuples('closed')
         result = self._closed_couples()
 
         logger.debug('closed couples: ' + str(result))
@@ -164,20 +224,27 @@ class Balancer(object):
             pass
         return []
 
-    COUPLE_STATES = {
-        'good': [storage.Status.OK],
-        'full': [storage.Status.FULL],
-        'frozen': [storage.Status.FROZEN],
-        'bad': [storage.Status.INIT, storage.Status.BAD],
-        'broken': [storage.Status.BROKEN],
-        'service-stalled': [storage.Status.SERVICE_STALLED],
-        'service-active': [storage.Status.SERVICE_ACTIVE],
-    }
+    COUPLE_STATES = listings.COUPLE_STATES
 
     @h.concurrent_handler
     def get_groupsets_list(self, request):
         filter = request.get('filter', {})
-        return self._get_groupsets_list(filter=filter)
+        snapshot = self._listings_snapshot()
+        if snapshot:
+            return self._versioned_result(
+                request,
+                snapshot,
+                lambda: snapshot.groupsets(
+                    namespace=filter.get('namespace'),
+                    type=filter.get('type'),
+                    state=filter.get('state'),
+                )
+            )
+        return self._versioned_result(
+            request,
+            snapshot,
+            lambda: self._get_groupsets_list(filter=filter)
+        )
 
     def _get_groupsets_list(self, filter):
         # TODO: think on checking input filter parameters and
@@ -224,7 +291,21 @@ class Balancer(object):
     @h.concurrent_handler
     def get_couples_list(self, request):
         options = request[0]
-        return self._get_couples_list(options)
+        snapshot = self._listings_snapshot()
+        if snapshot:
+            return self._versioned_result(
+                options,
+                snapshot,
+                lambda: snapshot.couples(
+                    namespace=options.get('namespace'),
+                    state=options.get('state'),
+                )
+            )
+        return self._versioned_result(
+            options,
+            snapshot,
+            lambda: self._get_couples_list(options)
+        )
 
     def _get_couples_list(self, _filter):
         # TODO: think on checking input filter parameters and
@@ -258,19 +339,30 @@ class Balancer(object):
             data.append(c.info().serialize())
         return data
 
-    GROUP_STATES = {
-        'init': [storage.Status.INIT],
-        'good': [storage.Status.COUPLED],
-        'bad': [storage.Status.INIT, storage.Status.BAD],
-        'broken': [storage.Status.BROKEN],
-        'ro': [storage.Status.RO],
-        'migrating': [storage.Status.MIGRATING],
-    }
+    GROUP_STATES = listings.GROUP_STATES
 
     @h.concurrent_handler
     def get_groups_list(self, request):
         options = request[0]
-        return self._get_groups_list(options)
+        snapshot = self._listings_snapshot()
+        if snapshot:
+            def get_result():
+                in_service_group_ids = set()
+                if options.get('in_jobs') is not None and self.infrastructure:
+                    in_service_group_ids = set(self.infrastructure.get_group_ids_in_service())
+                return snapshot.groups(
+                    state=options.get('state'),
+                    type=options.get('type'),
+                    uncoupled=options.get('uncoupled'),
+                    in_jobs=options.get('in_jobs'),
+                    in_service_group_ids=in_service_group_ids,
+                )
+            return self._versioned_result(options, snapshot, get_result)
+        return self._versioned_result(
+            options,
+            snapshot,
+            lambda: self._get_groups_list(options)
+        )
 
     def _get_groups_list(self, _filter):
         data = []
@@ -444,6 +536,7 @@ class Balancer(object):
             rollback_on_error=False,
         )
         groupset.update_status()
+        storage.entities_changed()
 
         return True
 
@@ -503,6 +596,7 @@ class Balancer(object):
             logger.info('Removing node backend {0} from group {1} nodes'.format(node_backend, group))
             group.remove_node_backend(node_backend)
             group.update_status_recursive()
+            storage.entities_changed()
             logger.info('Removed node backend {0} from group {1} nodes'.format(node_backend, group))
 
         logger.info('Removing node backend {0} from group {1} history'.format(node_backend_str, group_id))
@@ -569,6 +663,7 @@ class Balancer(object):
         # with new setting right away and not wait till the end of the next
         # cluster update cycle
         couple.settings = couple_record.settings
+        storage.entities_changed()
 
     @h.concurrent_handler
     def attach_groupset_to_couple(self, request):
@@ -622,6 +717,7 @@ class Balancer(object):
 
         groupset.update_status()
         couple.update_status()
+        storage.entities_changed()
 
     VALID_COUPLE_INIT_STATES = (storage.Status.COUPLED, storage.Status.FROZEN)
 
@@ -798,44 +894,49 @@ class Balancer(object):
             ns_current_state[node_type]['avg'],
             ns_current_state[node_type]['nodes']
         ))
-        choice_list = []
+        choices = []
+        caps = []
         for choice, groups in groups_by_level_units.iteritems():
-            choice_list.extend([choice] * min(count, len(groups)))
+            choices.append(choice)
+            caps.append(min(count, len(groups)))
 
-        logger.info('Nodes type: {0}, choice list: {1}'.format(node_type, choice_list))
+        logger.info('Nodes type: {0}, choices: {1}'.format(node_type, zip(choices, caps)))
 
-        weights = {}
         mandatory_groups_units = []
         for group_id in mandatory_groups:
             level_units = [gp[node_type] for gp in units[group_id]]
             mandatory_groups_units.extend(level_units)
 
-        comb_set = set()
-        for c in itertools.combinations(choice_list, count):
-            comb_set.add(c)
-
-        for comb in comb_set:
-            if config.get('forbidden_dc_sharing_among_groups', False) and node_type == self.DC_NODE_TYPE:
-                comb_units = list(reduce(operator.add, comb))
-                unique_units = set(comb_units) | set(mandatory_groups_units)
-                if (len(comb_units + mandatory_groups_units) != len(unique_units)):
-                    continue
-            weights[comb] = self.__weight_combination(ns_current_state[node_type], comb)
+        start_ts = time.time()
+        search = LeastWeightCombinationSearch(
+            choices=choices,
+            caps=caps,
+            nodes=ns_current_state[node_type]['nodes'],
+            avg=ns_current_state[node_type]['avg'],
+            exclusive=(
+                config.get('forbidden_dc_sharing_among_groups', False) and
+                node_type == self.DC_NODE_TYPE
+            ),
+            excluded_units=mandatory_groups_units,
+            max_visited=self.CHOOSE_GROUPS_MAX_VISITED,
+            deadline=start_ts + self.CHOOSE_GROUPS_TIME_BUDGET,
+        )
+        comb = search.run(count)
+        self._account_choose_groups_search(node_type, search, time.time() - start_ts)
 
-        if not weights:
+        if comb is None:
             logger.warn(
                 'Not enough groups for choosing on level {0}: '
                 'could not find groups satisfying restrictions'.format(node_type)
             )
             return []
 
-        logger.info('Combination weights: {0}'.format(weights))
-        sorted_weights = sorted(weights.items(), key=lambda x: x[1])
-
-        logger.info('Least weight combination: {0}'.format(sorted_weights[0]))
+        logger.info('Least weight combination: {0}'.format(
+            (comb, self.__weight_combination(ns_current_state[node_type], comb))
+        ))
 
         node_counts = {}
-        for node in sorted_weights[0][0]:
+        for node in comb:
             node_counts.setdefault(node, 0)
             node_counts[node] += 1
 
@@ -869,6 +970,43 @@ class Balancer(object):
 
         return groups
 
+    def _account_choose_groups_search(self, node_type, search, elapsed_time):
+        stats = self._choose_groups_stats
+        stats['calls'] += 1
+        stats['evaluated'] += search.evaluated
+        stats['visited'] += search.visited
+        stats['time'] += elapsed_time
+        if not search.complete:
+            stats['incomplete'] += 1
+            if search.timed_out:
+                stats['timeouts'] += 1
+            if search.greedy:
+                stats['greedy'] += 1
+            logger.warn(
+                'Level {0}: combinations search was stopped by {1}, {2} is used'.format(
+                    node_type,
+                    'time budget' if search.timed_out else 'visited nodes limit',
+                    'greedy combination' if search.greedy else 'best found combination',
+                )
+            )
+        logger.info(
+            'Level {node_type}: combinations evaluated: {evaluated}, search nodes '
+            'visited: {visited}, time: {time:.3f}'.format(
+                node_type=node_type,
+                evaluated=search.evaluated,
+                visited=search.visited,
+                time=elapsed_time,
+            )
+        )
+
+    @h.concurrent_handler
+    def get_choose_groups_stats(self, request):
+        return self._choose_groups_stats
+
+    @h.concurrent_handler
+    def get_scheduler_stats(self, request):
+        return timed_queue.scheduler.dump_stats()
+
     def _build_couple(self,
                       ns_current_state,
                       units,
@@ -1098,7 +1236,11 @@ class Balancer(object):
 
             logger.info('groups by total space: {0}'.format(groups_by_total_space))
 
-            res = self.__couple_groups(size, couples, options, ns, groups_by_total_space)
+            try:
+                res = self.__couple_groups(size, couples, options, ns, groups_by_total_space)
+            finally:
+                # couples can be partially built on error
+                storage.entities_changed()
 
         return res
 
@@ -1141,6 +1283,7 @@ class Balancer(object):
 
             kill_symm_group(self.node, self.node.meta_session, couple)
             couple.destroy()
+            storage.entities_changed()
 
             return True
 
@@ -1512,6 +1655,7 @@ class Balancer(object):
 
         self.__do_set_meta_freeze(couple, freeze=True)
         couple.update_status()
+        storage.entities_changed()
 
         return True
 
@@ -1525,6 +1669,7 @@ class Balancer(object):
 
         self.__do_set_meta_freeze(couple, freeze=False)
         couple.update_status()
+        storage.entities_changed()
 
         return True
 
@@ -1597,24 +1742,10 @@ class Balancer(object):
         request = request or {}
         namespaces = request.get('namespaces', [])
 
-        if namespaces:
-            # TODO: optimize this case or drop 'namespaces' parameter support
-            res = {}
-            namespaces_states = self.niu._namespaces_states.get_result(
-                compressed=False
-            )
-            for ns in namespaces:
-                if ns not in namespaces_states:
-                    continue
-                res[ns] = namespaces_states[ns]
-            if request.get('gzip', False):
-                res = gzip_compress(json.dumps(res))
-        else:
-            res = self.niu._namespaces_states.get_result(
-                compressed=request.get('gzip', False)
-            )
-
-        return res
+        return self.niu._namespaces_states.get_result(
+            compressed=request.get('gzip', False),
+            keys=namespaces or None,
+        )
 
     # @h.concurrent_handler
     @h.handler_wne
@@ -1745,6 +1876,235 @@ class Balancer(object):
         )
 
 
+class LeastWeightCombinationSearch(object):
+    """Search for a combination of choices with the least weight
+
+    Combination is a multiset of @count choices, each choice is a tuple of
+    units that gain a group when the choice is selected. Weight of a combination
+    is the sum of squared deviations of units' groups count from the average
+    value @avg (see Balancer.__weight_combination), @nodes is the current
+    groups count of units.
+
+    Branch and bound search is used instead of enumeration of all possible
+    combinations: choices are tried in the order of their cost,
+    and a branch is pruned if its weight even with the least possible
+    cost of remaining choices cannot beat the best found combination.
+    Since the cost of adding a group to a unit does not decrease with the
+    number of unit's groups, the cost of a choice at the moment of
+    selection is a lower bound of its cost in any extended combination,
+    so pruning does not affect the result.
+
+    Search is stopped when @max_visited search nodes are visited or
+    @deadline is reached and the best found combination is returned
+    in this case. If no combination has been found by then, a combination
+    is built greedily by selecting the choice of the least cost @count
+    times (the greedy choice can fail to satisfy restrictions even when
+    some combination does).
+
+    Parameters:
+        choices - list of choices;
+        caps - maximum number of times each choice can be selected;
+        nodes - current groups count of units;
+        avg - average groups count of a unit;
+        exclusive - each unit can be selected only once, including
+            @excluded_units;
+        excluded_units - units that are already selected;
+        max_visited - maximum number of search nodes to visit;
+        deadline - search deadline timestamp;
+    """
+
+    def __init__(self,
+                 choices,
+                 caps,
+                 nodes,
+                 avg,
+                 exclusive=False,
+                 excluded_units=(),
+                 max_visited=None,
+                 deadline=None):
+        self.avg = avg
+        self.exclusive = exclusive
+        self.max_visited = max_visited
+        self.deadline = deadline
+
+        self._nodes = nodes
+        self._counts = dict(nodes)
+        self._used_units = set(excluded_units)
+
+        candidates = []
+        if exclusive and len(self._used_units) != len(excluded_units):
+            # excluded units already violate restrictions
+            choices = []
+        for choice, cap in itertools.izip(choices, caps):
+            if exclusive:
+                if len(set(choice)) != len(choice) or self._used_units.intersection(choice):
+                    continue
+                cap = min(cap, 1)
+            candidates.append((self._cost(choice), choice, cap))
+        candidates.sort()
+
+        self._choices = [choice for _, choice, _ in candidates]
+        self._caps = [cap for _, _, cap in candidates]
+        self._taken = [0] * len(self._choices)
+
+        self.evaluated = 0
+        self.visited = 0
+        self.complete = True
+        self.timed_out = False
+        self.greedy = False
+        self._best = None
+        self._best_weight = None
+        self._selected = []
+
+    def run(self, count):
+        """Find the least weight combination of @count choices
+
+        Returns a tuple of choices or None if no combination satisfies
+        restrictions.
+        """
+        if count > 0:
+            self._search(0, count, 0.0)
+        if self._best is None and not self.complete:
+            self.greedy = True
+            self._best = self._greedy(count)
+        if self._best is None:
+            return None
+        return tuple(self._best)
+
+    def _cost(self, choice, lower_bound=False):
+        """Weight increase caused by selection of @choice
+
+        If @lower_bound is True, the lower bound of weight increase caused
+        by selection of @choice in any extension of the current combination
+        is returned.
+        """
+        cost = 0.0
+        added = {}
+        for unit in choice:
+            if unit not in self._counts and unit not in added:
+                # unit is not accounted in weight yet
+                cost_new = (1 - self.avg) ** 2
+                if lower_bound:
+                    # cost of the first group of an already accounted unit
+                    # can be lower
+                    cost_new = min(cost_new, 2 * (1 - self.avg) + 1)
+                cost += cost_new
+            else:
+                c = self._counts.get(unit, 0) + added.get(unit, 0)
+                cost += 2 * (c - self.avg) + 1
+            added[unit] = added.get(unit, 0) + 1
+        return cost
+
+    def _select(self, idx):
+        choice = self._choices[idx]
+        cost = self._cost(choice)
+        for unit in choice:
+            self._counts[unit] = self._counts.get(unit, 0) + 1
+        if self.exclusive:
+            self._used_units.update(choice)
+        self._taken[idx] += 1
+        self._selected.append(choice)
+        return cost
+
+    def _unselect(self, idx):
+        choice = self._choices[idx]
+        for unit in choice:
+            self._counts[unit] -= 1
+            if not self._counts[unit] and unit not in self._nodes:
+                del self._counts[unit]
+        if self.exclusive:
+            self._used_units.difference_update(choice)
+        self._taken[idx] -= 1
+        self._selected.pop()
+
+    def _available(self, idx):
+        if self._taken[idx] >= self._caps[idx]:
+            return False
+        if self.exclusive and self._used_units.intersection(self._choices[idx]):
+            return False
+        return True
+
+    def _stopped(self):
+        if self.max_visited is not None and self.visited >= self.max_visited:
+            return True
+        if self.deadline is not None and time.time() >= self.deadline:
+            self.timed_out = True
+            return True
+        return False
+
+    def _greedy(self, count):
+        """Build a combination of @count choices selecting the least cost choice
+        on every step
+
+        Returns a list of choices or None if no choice is available on some step.
+        """
+        selected = []
+        try:
+            for _ in xrange(count):
+                costs = [
+                    (self._cost(choice), idx)
+                    for idx, choice in enumerate(self._choices)
+                    if self._available(idx)
+                ]
+                if not costs:
+                    return None
+                _, idx = min(costs)
+                self._select(idx)
+                selected.append(idx)
+            return list(self._selected)
+        finally:
+            for idx in reversed(selected):
+                self._unselect(idx)
+
+    def _search(self, start, remaining, weight):
+        if remaining == 0:
+            self.evaluated += 1
+            if self._best is None or weight < self._best_weight:
+                self._best = list(self._selected)
+                self._best_weight = weight
+            return
+
+        costs = [
+            (idx, self._cost(self._choices[idx]))
+            for idx in xrange(start, len(self._choices))
+            if self._available(idx)
+        ]
+        if not costs:
+            return
+
+        # lower bound of cost of a choice with index not less than the given one,
+        # only such choices can be selected in a branch
+        min_costs = {}
+        min_cost = None
+        for idx, _ in reversed(costs):
+            cost = self._cost(self._choices[idx], lower_bound=True)
+            if min_cost is None or cost < min_cost:
+                min_cost = cost
+            min_costs[idx] = min_cost
+
+        if self._best is not None and weight + min_cost * remaining >= self._best_weight:
+            return
+
+        costs.sort(key=lambda (idx, cost): cost)
+        for idx, cost in costs:
+            if (self._best is not None and
+                    weight + cost + min_costs[idx] * (remaining - 1) >= self._best_weight):
+                continue
+            self.visited += 1
+            if self._stopped():
+                self.complete = False
+                return
+            cost = self._select(idx)
+            try:
+                # choices with lower indexes are not selected anymore in this
+                # branch, this enumerates every multiset of choices only once
+                self._search(idx, remaining - 1, weight + cost)
+            finally:
+                self._unselect(idx)
+            if not self.complete:
+                return
+
+
 def handlers(b):
     handlers = []
     try:
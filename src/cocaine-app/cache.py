@@ -547,6 +547,7 @@ class CacheManager(object):
             try:
                 group.parse_meta(packed)
                 group.update_status()
+                storage.entities_changed()
             except Exception as e:
                 logger.error(
                     'Failed to update status for group {0}: {1}\n{2}'.format(
@@ -103,6 +103,22 @@ class Infrastructure(object):
         self._groups_to_update = set()
         self._groups_to_update_lock = threading.Lock()
 
+        # materialized cluster trees, see 'cluster_tree' and 'filtered_cluster_tree'
+        self._cluster_trees = {}
+        self._filtered_cluster_trees = {}
+        self._cluster_trees_version = 0
+        self._cluster_tree_lock = threading.Lock()
+        self._cluster_tree_stats = {
+            'rebuilds': 0,
+            'rebuild_time': 0.0,
+            'last_rebuild_time': None,
+            'hits': 0,
+            'filtered_rebuilds': 0,
+            'filtered_rebuild_time': 0.0,
+            'last_filtered_rebuild_time': None,
+            'filtered_hits': 0,
+        }
+
         self.__tq = timed_queue.TimedQueue()
 
     def init(self, node, job_finder, group_history_finder):
@@ -232,6 +248,7 @@ class Infrastructure(object):
                         )
                         group.remove_node_backend(nb)
                         group.update_status_recursive()
+                        storage.entities_changed()
         self._sync_ts = new_ts
 
     def update_group_history(self, group):
@@ -842,26 +859,78 @@ class Infrastructure(object):
         return result
 
     def cluster_tree(self, namespace=None):
-        nodes = {}
-        root = {}
-        hosts = []
+        """Get cluster tree of hosts (of the namespace, if @namespace is set)
 
+        Returns a tuple of the tree root and a mapping of tree node types to
+        tree nodes by their full paths.
+
+        Tree is materialized and rebuilt only when the set of hosts or
+        their positions in the host hierarchy change. Each call returns
+        a private copy of the tree, so the caller is free to modify it.
+        """
+        tree, nodes, _ = self._materialized_cluster_tree(namespace)
+        return self._copy_cluster_tree(tree, nodes)
+
+    def _materialized_cluster_tree(self, namespace):
+        hosts_parents = self._hosts_parents(self._cluster_tree_hosts(namespace))
+
+        with self._cluster_tree_lock:
+            cached = self._cluster_trees.get(namespace)
+            if cached is not None and cached['hosts_parents'] == hosts_parents:
+                self._cluster_tree_stats['hits'] += 1
+                return cached['tree'], cached['nodes'], cached['version']
+
+            start_ts = time.time()
+            tree, nodes = self._build_cluster_tree(hosts_parents)
+            self._cluster_trees_version += 1
+            self._cluster_trees[namespace] = {
+                'hosts_parents': hosts_parents,
+                'tree': tree,
+                'nodes': nodes,
+                'version': self._cluster_trees_version,
+            }
+            self._account_cluster_tree_rebuild('', namespace, time.time() - start_ts)
+            return tree, nodes, self._cluster_trees_version
+
+    def _account_cluster_tree_rebuild(self, prefix, namespace, elapsed_time):
+        stats = self._cluster_tree_stats
+        stats[prefix + 'rebuilds'] += 1
+        stats[prefix + 'rebuild_time'] += elapsed_time
+        stats['last_' + prefix + 'rebuild_time'] = elapsed_time
+        logger.info('Cluster tree{filtered} for namespace {ns} is rebuilt, time: {time:.3f}'.format(
+            filtered=' filtered view' if prefix else '',
+            ns=namespace,
+            time=elapsed_time,
+        ))
+
+    @staticmethod
+    def _cluster_tree_hosts(namespace):
         if namespace:
+            hosts = []
             if namespace in storage.namespaces:
                 for couple in storage.namespaces[namespace].couples:
                     hosts.extend(nb.node.host for g in couple for nb in g.node_backends)
-            else:
-                hosts = []
-            hosts = list(set(hosts))
-        else:
-            hosts = storage.hosts.keys()
+            return set(hosts)
+        return storage.hosts.keys()
 
+    @staticmethod
+    def _hosts_parents(hosts):
+        hosts_parents = {}
         for host in hosts:
             try:
-                tree_node = deepcopy(host.parents)
+                hosts_parents[host] = host.parents
             except CacheUpstreamError:
                 logger.warn('Skipping {} because of cache failure'.format(host))
                 continue
+        return hosts_parents
+
+    @staticmethod
+    def _build_cluster_tree(hosts_parents):
+        nodes = {}
+        root = {}
+
+        for host, parents in hosts_parents.iteritems():
+            tree_node = deepcopy(parents)
             new_child = None
             while True:
                 parts = [tree_node['name']]
@@ -895,8 +964,81 @@ class Infrastructure(object):
                 'children': root.values()}
         return tree, nodes
 
+    @staticmethod
+    def _copy_cluster_tree(tree, nodes):
+        """Copy tree structure along with the mapping of its nodes"""
+        copies = {}
+
+        def copy_node(node):
+            node_copy = dict(node)
+            if 'children' in node:
+                node_copy['children'] = [copy_node(child) for child in node['children']]
+            copies[id(node)] = node_copy
+            return node_copy
+
+        tree_copy = copy_node(tree)
+        nodes_copy = {}
+        for node_type, type_nodes in nodes.iteritems():
+            nodes_copy[node_type] = dict(
+                (full_path, copies[id(node)])
+                for full_path, node in type_nodes.iteritems()
+            )
+        return tree_copy, nodes_copy
+
     def filtered_cluster_tree(self, types, namespace=None):
-        tree, nodes = self.cluster_tree(namespace=namespace)
+        """Get cluster tree that consists only of nodes of @types
+
+        Tree nodes of other types are removed and their children are moved
+        to the closest allowed ancestor. Host nodes are supplemented with
+        children 'hdd' nodes of node backends' filesystems.
+
+        Filtered view is rebuilt only when the underlying cluster tree or
+        the set of filesystems change. Each call returns a private copy
+        of the tree.
+        """
+        base_tree, base_nodes, base_version = self._materialized_cluster_tree(namespace)
+
+        hdds = set()
+        for nb in storage.node_backends:
+
+            try:
+                full_path = nb.node.host.full_path
+            except CacheUpstreamError:
+                logger.warn('Skipping {} because of cache failure'.format(
+                    nb.node.host))
+                continue
+
+            if full_path not in base_nodes.get('host', {}):
+                logger.warn('Host {0} is not found in cluster tree'.format(full_path))
+                continue
+            if nb.stat is None:
+                continue
+
+            hdds.add((full_path, str(nb.stat.fsid)))
+
+        key = (tuple(types), namespace)
+        with self._cluster_tree_lock:
+            cached = self._filtered_cluster_trees.get(key)
+            if (cached is not None and
+                    cached['version'] == base_version and
+                    cached['hdds'] == hdds):
+                self._cluster_tree_stats['filtered_hits'] += 1
+                return self._copy_cluster_tree(cached['tree'], cached['nodes'])
+
+            start_ts = time.time()
+            tree, nodes = self._copy_cluster_tree(base_tree, base_nodes)
+            self._filter_cluster_tree(tree, nodes, types, hdds)
+            self._filtered_cluster_trees[key] = {
+                'version': base_version,
+                'hdds': hdds,
+                'tree': tree,
+                'nodes': nodes,
+            }
+            self._account_cluster_tree_rebuild('filtered_', namespace, time.time() - start_ts)
+            return self._copy_cluster_tree(tree, nodes)
+
+    @staticmethod
+    def _filter_cluster_tree(tree, nodes, types, hdds):
 
         def move_allowed_children(node, dest):
             for child in node.get('children', []):
@@ -921,33 +1063,23 @@ class Infrastructure(object):
 
         nodes['hdd'] = {}
 
-        for nb in storage.node_backends:
-
-            try:
-                full_path = nb.node.host.full_path
-            except CacheUpstreamError:
-                logger.warn('Skipping {} because of cache failure'.format(
-                    nb.node.host))
-                continue
-
-            if full_path not in nodes['host']:
-                logger.warn('Host {0} is not found in cluster tree'.format(full_path))
-                continue
-            if nb.stat is None:
-                continue
-
-            fsid = str(nb.stat.fsid)
+        for full_path, fsid in hdds:
             fsid_full_path = full_path + '|' + fsid
-            if fsid_full_path not in nodes['hdd']:
-                hdd_node = {
-                    'type': 'hdd',
-                    'name': fsid,
-                    'full_path': fsid_full_path,
-                }
-                nodes['hdd'][fsid_full_path] = hdd_node
-                nodes['host'][full_path].setdefault('children', []).append(hdd_node)
+            hdd_node = {
+                'type': 'hdd',
+                'name': fsid,
+                'full_path': fsid_full_path,
+            }
+            nodes['hdd'][fsid_full_path] = hdd_node
+            nodes['host'][full_path].setdefault('children', []).append(hdd_node)
 
-        return tree, nodes
+    @h.concurrent_handler
+    def get_cluster_tree_stats(self, request):
+        return self._cluster_tree_stats
+
+    @h.concurrent_handler
+    def get_infrastructure_cache_stats(self, request):
+        return cache.stats()
 
     def update_groups_list(self, root):
         if 'children' not in root:
@@ -1078,34 +1210,42 @@ class Infrastructure(object):
 
     def groups_units(self, groups, types):
         units = {}
+        # hosts usually serve several node backends, their units are
+        # calculated only once
+        hosts_units = {}
 
         for group in groups:
             if group.group_id in units:
                 continue
             for nb in group.node_backends:
 
-                try:
-                    parent = nb.node.host.parents
-                except CacheUpstreamError:
-                    logger.warn('Skipping {} because of cache failure'.format(
-                        nb.node.host))
-                    continue
+                host = nb.node.host
+                if host not in hosts_units:
+                    try:
+                        parent = host.parents
+                    except CacheUpstreamError:
+                        logger.warn('Skipping {} because of cache failure'.format(host))
+                        continue
 
-                nb_units = {'root': 'root'}
-                units.setdefault(group.group_id, [])
+                    host_units = {'root': 'root'}
+
+                    parts = []
+                    cur_node = parent
+                    while cur_node:
+                        parts.insert(0, cur_node['name'])
+                        cur_node = cur_node.get('parent')
 
-                parts = []
-                cur_node = parent
-                while cur_node:
-                    parts.insert(0, cur_node['name'])
-                    cur_node = cur_node.get('parent')
+                    while parent:
+                        if parent['type'] in types:
+                            host_units[parent['type']] = '|'.join(parts)
+                        parts.pop()
+                        parent = parent.get('parent')
 
-                while parent:
-                    if parent['type'] in types:
-                        nb_units[parent['type']] = '|'.join(parts)
-                    parts.pop()
-                    parent = parent.get('parent')
+                    hosts_units[host] = host_units
+
+                units.setdefault(group.group_id, [])
 
+                nb_units = dict(hosts_units[host])
                 nb_units['hdd'] = nb_units['host'] + '|' + str(nb.stat.fsid)
 
                 units[group.group_id].append(nb_units)
@@ -1,5 +1,7 @@
+from collections import OrderedDict
 import logging
 import socket
+import threading
 import time
 
 import msgpack
@@ -65,6 +67,14 @@ class InfrastructureCache(object):
     def get_host_tree(self, hostname, strict=True):
         return self.strictable(self.hosttree_cache, hostname, strict)
 
+    def stats(self):
+        return {
+            'dc': self.dc_cache.stats(),
+            'hostname': self.hostname_cache.stats(),
+            'hosttree': self.hosttree_cache.stats(),
+            'ip_addresses': self.ip_addresses_cache.stats(),
+        }
+
     def get_ip_address_by_host(self, host, strict=True):
         addresses = self.strictable(
             cache=self.ip_addresses_cache,
@@ -100,14 +110,36 @@ class InfrastructureCacheManager(object):
 
 
 class CacheItem(object):
+    """Cache of values fetched from upstream (e.g., inventory)
+
+    Cache holds at most 'max_size' values, least recently used values are
+    evicted first. Values older than 'key_expire_time' are considered stale:
+    stale value is still returned while a fresh one is being fetched
+    in background. Failed upstream fetches are remembered for
+    NEGATIVE_CACHE_TTL seconds, requests for the key fail right away
+    during this period instead of querying upstream again.
+    """
+
+    NEGATIVE_CACHE_TTL = config.get('infrastructure_cache_negative_ttl', 30)
 
     def __init__(self, meta_session, idx_key, key_tpl, task_queue):
         self.meta_session = meta_session.clone()
         self.idx = indexes.SecondaryIndex(idx_key, key_tpl, self.meta_session)
         self.__tq = task_queue
-        self.cache = {}
-
-        for attr in ['taskname', 'logprefix', 'sync_period', 'key_expire_time']:
+        self.cache = OrderedDict()
+        self._negative_cache = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'stale': 0,
+            'negative_hits': 0,
+            'evictions': 0,
+            'upstream_errors': 0,
+        }
+
+        for attr in ['taskname', 'logprefix', 'sync_period', 'key_expire_time', 'max_size']:
             if getattr(self, attr) is None:
                 raise AttributeError('Set "{0}" attribute explicitly in your '
                                  'class instance'.format(attr))
@@ -116,6 +148,13 @@ class CacheItem(object):
         raise NotImplemented('Method "get_value" should be implemented in '
                              'derived class')
 
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self.cache)
+            stats['negative_size'] = len(self._negative_cache)
+        return stats
+
     def _sync_cache(self):
         start_ts = time.time()
         try:
@@ -124,7 +163,7 @@ class CacheItem(object):
                 data = msgpack.unpackb(data)
 
                 try:
-                    self.cache[data['key']] = data
+                    self._sync_cache_item(data['key'], data)
                 except KeyError:
                     pass
 
@@ -137,41 +176,120 @@ class CacheItem(object):
             self.__tq.add_task_in(self.taskname,
                 self.sync_period, self._sync_cache)
 
+    def _set_cache_item(self, key, cache_item):
+        with self._lock:
+            # existing key keeps its position in LRU order
+            self.cache[key] = cache_item
+            self._negative_cache.pop(key, None)
+            while len(self.cache) > self.max_size:
+                self.cache.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def _sync_cache_item(self, key, cache_item):
+        """Set cache item read from index without affecting LRU order
+
+        Keys already present in cache are refreshed in place, new keys are
+        added only while cache has free room, so syncing an index with more
+        than 'max_size' keys does not evict recently used values.
+        """
+        with self._lock:
+            if key not in self.cache and len(self.cache) >= self.max_size:
+                return
+            self.cache[key] = cache_item
+            self._negative_cache.pop(key, None)
+
     def _update_cache_item(self, key, val):
         cache_item = {'key': key,
                       'val': val,
                       'ts': time.time()}
         try:
             self.idx[key] = msgpack.packb(cache_item)
-            self.cache[key] = cache_item
         except Exception:
             logger.exception(self.logprefix + 'Updating cache for key {} '
                 'failed'.format(key))
             pass
+        self._set_cache_item(key, cache_item)
 
-    def __getitem__(self, key):
+    def _fetch(self, key):
         try:
-            cache_item = self.cache[key]
-            if cache_item['ts'] + self.key_expire_time < time.time():
-                logger.debug(self.logprefix + 'Value for key {} expired'.format(key))
-                raise KeyError
-            val = cache_item['val']
-        except KeyError:
-            try:
-                req_start = time.time()
-                val = self.get_value(key)
-                logger.info(self.logprefix + 'Fetched value for key {} '
-                    'from upstream: {}'.format(key, val))
-            except Exception as e:
-                req_time = time.time() - req_start
-                logger.exception(self.logprefix + 'Failed to fetch value '
-                    'for key {} from upstream (time: {:.5f}s)'.format(
-                    key, req_time))
-                raise
-            self._update_cache_item(key, val)
-
+            req_start = time.time()
+            val = self.get_value(key)
+            logger.info(self.logprefix + 'Fetched value for key {} '
+                'from upstream: {}'.format(key, val))
+        except Exception as e:
+            req_time = time.time() - req_start
+            logger.exception(self.logprefix + 'Failed to fetch value '
+                'for key {} from upstream (time: {:.5f}s)'.format(
+                key, req_time))
+            with self._lock:
+                self._stats['upstream_errors'] += 1
+                self._negative_cache[key] = (time.time(), str(e))
+            raise
+        self._update_cache_item(key, val)
         return val
 
+    def _refresh(self, key):
+        try:
+            self._fetch(key)
+        except Exception:
+            # stale value will be used until the next refresh attempt
+            pass
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _schedule_refresh(self, key):
+        """Schedule background fetch of the key's value
+
+        Should be called under the lock.
+        """
+        if key in self._refreshing:
+            return
+        failed = self._negative_cache.get(key)
+        if failed and failed[0] + self.NEGATIVE_CACHE_TTL > time.time():
+            return
+        self._refreshing.add(key)
+        try:
+            self.__tq.add_task_in(
+                '{}_refresh_{}'.format(self.taskname, key),
+                0,
+                self._refresh,
+                key
+            )
+        except Exception:
+            self._refreshing.discard(key)
+            logger.exception(self.logprefix + 'Failed to schedule refresh '
+                'for key {}'.format(key))
+
+    def __getitem__(self, key):
+        with self._lock:
+            cache_item = self.cache.get(key)
+            if cache_item is not None:
+                # move to the end of LRU order
+                del self.cache[key]
+                self.cache[key] = cache_item
+                if cache_item['ts'] + self.key_expire_time < time.time():
+                    logger.debug(self.logprefix + 'Value for key {} expired'.format(key))
+                    self._stats['stale'] += 1
+                    self._schedule_refresh(key)
+                else:
+                    self._stats['hits'] += 1
+                return cache_item['val']
+
+            failed = self._negative_cache.get(key)
+            if failed:
+                if failed[0] + self.NEGATIVE_CACHE_TTL > time.time():
+                    self._stats['negative_hits'] += 1
+                    raise CacheUpstreamError(
+                        'Value for key {} recently failed to be fetched '
+                        'from upstream: {}'.format(key, failed[1])
+                    )
+                del self._negative_cache[key]
+
+            self._stats['misses'] += 1
+
+        return self._fetch(key)
+
 
 class DcCacheItem(CacheItem):
     def __init__(self, *args, **kwargs):
@@ -179,6 +297,7 @@ class DcCacheItem(CacheItem):
         self.logprefix = 'dc cache: '
         self.sync_period = config.get('infrastructure_dc_cache_update_period', 150)
         self.key_expire_time = config.get('infrastructure_dc_cache_valid_time', 604800)
+        self.max_size = config.get('infrastructure_dc_cache_max_size', 100000)
         super(DcCacheItem, self).__init__(*args, **kwargs)
 
         self.fallback_value = 'unknown'
@@ -193,6 +312,7 @@ class HostnameCacheItem(CacheItem):
         self.logprefix = 'hostname cache: '
         self.sync_period = config.get('infrastructure_hostname_cache_update_period', 600)
         self.key_expire_time = config.get('infrastructure_hostname_cache_valid_time', 604800)
+        self.max_size = config.get('infrastructure_hostname_cache_max_size', 100000)
         super(HostnameCacheItem, self).__init__(*args, **kwargs)
 
         self.fallback_value = 'unknown'
@@ -207,6 +327,7 @@ class HostTreeCacheItem(CacheItem):
         self.logprefix = 'hosttree cache: '
         self.sync_period = config.get('infrastructure_hosttree_cache_update_period', 600)
         self.key_expire_time = config.get('infrastructure_hosttree_cache_valid_time', 604800)
+        self.max_size = config.get('infrastructure_hosttree_cache_max_size', 100000)
         super(HostTreeCacheItem, self).__init__(*args, **kwargs)
 
     def get_value(self, key):
@@ -219,6 +340,7 @@ class IpAddressesCacheItem(CacheItem):
         self.logprefix = 'ipaddresses cache: '
         self.sync_period = config.get('infrastructure_ipaddresses_cache_update_period', 600)
         self.key_expire_time = config.get('infrastructure_ipaddresses_cache_valid_time', 604800)
+        self.max_size = config.get('infrastructure_ipaddresses_cache_max_size', 100000)
         super(IpAddressesCacheItem, self).__init__(*args, **kwargs)
 
         self.fallback_value = {}
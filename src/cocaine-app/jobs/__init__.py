@@ -1,6 +1,5 @@
-from collections import defaultdict
-import itertools
 import logging
+from multiprocessing.pool import ThreadPool
 import time
 import traceback
 
@@ -18,6 +17,8 @@ from move import MoveJob
 from recover_dc import RecoverDcJob
 from make_lrc_groups import MakeLrcGroupsJob
 from job_factory import JobFactory
+from job_index import ActiveJobsIndex
+from resource_ledger import unfold_resources
 from restore_group import RestoreGroupJob
 from tasks import Task, MinionCmdTask
 import timed_queue
@@ -76,6 +77,12 @@ class JobProcessor(object):
 
         self.__tq = timed_queue.TimedQueue()
 
+        # ready jobs are independent (they hold persistent locks of
+        # their groups and couples), so they are processed concurrently
+        self.execute_workers = JOB_CONFIG.get('execute_workers', 10)
+        self.__pool = ThreadPool(processes=self.execute_workers)
+        self._execute_stats = {}
+
         self.jobs_timer = periodic_timer(seconds=JOB_CONFIG.get('execute_period', 60))
         self.downtimes = Collection(db[config['metadata']['jobs']['db']], 'downtimes')
         self.__tq.add_task_at(
@@ -86,54 +93,39 @@ class JobProcessor(object):
     def _start_tq(self):
         self.__tq.start()
 
-    @staticmethod
-    def _unfold_resources(d):
-        if d is None:
-            raise StopIteration
-        for res_type, res_val in itertools.chain(*[itertools.product([k], v)
-                                                   for k, v in d.iteritems()]):
-            if isinstance(res_val, list):
-                res_val = tuple(res_val)
-            yield res_type, res_val
+    _unfold_resources = staticmethod(unfold_resources)
 
     def _ready_jobs(self):
 
-        active_jobs = self.job_finder.jobs(statuses=Job.ACTIVE_STATUSES)
+        active_jobs_index = self.job_finder.active_jobs
+        # processor always works with up-to-date private copies of active jobs
+        active_jobs_index.refresh(max_lag=0)
+        if JOB_CONFIG.get('active_jobs_index', {}).get('check_resources', False):
+            self._check_resources()
 
         ready_jobs = []
         new_jobs = []
 
-        def default_res_counter():
-            return {
-                Job.RESOURCE_FS: {},
-                Job.RESOURCE_HOST_IN: {},
-                Job.RESOURCE_HOST_OUT: {},
-            }
+        # resources used by started jobs are accounted by the ledger,
+        # resources of jobs selected during this cycle are counted separately
+        ledger = active_jobs_index.resources
+        selected_resources = {}
+        selected_jobs_count = {}
 
-        resources = defaultdict(default_res_counter)
+        def res_usage(job_type, res_type, res_val):
+            return (ledger.usage(job_type, res_type, res_val) +
+                    selected_resources.get((job_type, res_type, res_val), 0))
 
-        # global job counter by type, accounts only executing jobs
-        type_jobs_count = {}
-
-        # counting current resource usage
-        for job in active_jobs:
-            if job.status == Job.STATUS_NOT_APPROVED:
-                continue
+        for job in self.job_finder.jobs(statuses=(Job.STATUS_NEW, Job.STATUS_EXECUTING),
+                                        for_update=True):
             if job.status == Job.STATUS_NEW:
                 if job.type in self.SUPPORTED_JOBS:
                     new_jobs.append(job)
             else:
-                type_res = resources[job.type]
-                for res_type, res_val in self._unfold_resources(job.resources):
-                    type_res[res_type].setdefault(res_val, 0)
-                    type_res[res_type][res_val] += 1
+                ready_jobs.append(job)
 
-                if job.status == Job.STATUS_EXECUTING:
-                    ready_jobs.append(job)
-                    type_jobs_count.setdefault(job.type, 0)
-                    type_jobs_count[job.type] += 1
-
-        logger.debug('Resources usage: {}; by type {}'.format(dict(resources), type_jobs_count))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Resources usage: {}'.format(active_jobs_index.dump_resources()))
 
         # selecting jobs to start processing
         for job in new_jobs:
@@ -148,7 +140,7 @@ class JobProcessor(object):
             for res_type, res_val in self._unfold_resources(job.resources):
 
                 for job_type in check_types:
-                    if resources[job_type][res_type].get(res_val, 0) > 0:
+                    if res_usage(job_type, res_type, res_val) > 0:
                         # job of higher priority is using the resource
                         logger.debug(
                             'Job {}: will be skipped, resource {} / {} '
@@ -160,7 +152,7 @@ class JobProcessor(object):
                 if no_slots:
                     break
 
-                cur_usage = resources[job.type][res_type].get(res_val, 0)
+                cur_usage = res_usage(job.type, res_type, res_val)
                 max_usage = JOB_CONFIG.get(job.type, {}).get(
                     'resources_limits', {}).get(res_type, float('inf'))
                 if cur_usage >= max_usage:
@@ -185,7 +177,7 @@ class JobProcessor(object):
             if no_slots:
                 continue
 
-            type_cur_usage = type_jobs_count.get(job.type, 0)
+            type_cur_usage = ledger.executing(job.type) + selected_jobs_count.get(job.type, 0)
             type_max_usage = JOB_CONFIG.get(job.type, {}).get('max_executing_jobs', 50)
             if type_cur_usage >= type_max_usage:
                 logger.debug(
@@ -198,11 +190,10 @@ class JobProcessor(object):
                 logger.debug(
                     'Job {}: will use resource {} / {} counter {} / {}'.format(
                         job.id, res_type, res_val, cur_usage, max_usage))
-                resources[job.type][res_type].setdefault(res_val, 0)
-                resources[job.type][res_type][res_val] += 1
+                key = (job.type, res_type, res_val)
+                selected_resources[key] = selected_resources.get(key, 0) + 1
 
-            type_jobs_count.setdefault(job.type, 0)
-            type_jobs_count[job.type] += 1
+            selected_jobs_count[job.type] = selected_jobs_count.get(job.type, 0) + 1
 
             ready_jobs.append(job)
 
@@ -210,6 +201,23 @@ class JobProcessor(object):
 
         return ready_jobs
 
+    def _check_resources(self):
+        mismatches = self.job_finder.active_jobs.check_resources()
+        for job_type, resource, counter, recounted in mismatches:
+            logger.error(
+                'Resource ledger mismatch: job type {}, resource {}: '
+                'counter {} != recounted {}'.format(job_type, resource, counter, recounted)
+            )
+        return mismatches
+
+    @h.concurrent_handler
+    def check_jobs_resources(self, request):
+        """Checks resource ledger of active jobs against a full recount"""
+        return {
+            'mismatches': self._check_resources(),
+            'usage': self.job_finder.active_jobs.dump_resources(),
+        }
+
     def _execute_jobs(self):
 
         logger.info('Jobs execution started')
@@ -218,18 +226,13 @@ class JobProcessor(object):
             with sync_manager.lock(self.JOBS_LOCK, blocking=False):
                 logger.debug('Lock acquired')
 
+                start_ts = time.time()
                 ready_jobs = self._ready_jobs()
+                ready_jobs_time = time.time() - start_ts
 
-                for job in ready_jobs:
-                    try:
-                        self.__process_job(job)
-                        job.save()
-                    except LockError:
-                        pass
-                    except Exception as e:
-                        logger.error('Failed to process job {0}: '
-                            '{1}\n{2}'.format(job.id, e, traceback.format_exc()))
-                        continue
+                jobs_stats = self.__pool.map(self._process_ready_job, ready_jobs, chunksize=1)
+
+                self._account_execution(start_ts, ready_jobs_time, jobs_stats)
 
         except LockFailedError as e:
             pass
@@ -242,6 +245,58 @@ class JobProcessor(object):
                 self.jobs_timer.next(),
                 self._execute_jobs)
 
+    def _process_ready_job(self, job):
+        """Process ready job in a worker thread
+
+        Returns job processing stats, job processing errors are not raised.
+        """
+        start_ts = time.time()
+        result = 'ok'
+        try:
+            self.__process_job(job)
+            job.save()
+        except LockError:
+            result = 'lock_error'
+        except Exception as e:
+            result = 'failed'
+            logger.error('Failed to process job {0}: '
+                '{1}\n{2}'.format(job.id, e, traceback.format_exc()))
+        return {
+            'id': job.id,
+            'type': job.type,
+            'status': job.status,
+            'result': result,
+            'time': time.time() - start_ts,
+        }
+
+    def _account_execution(self, start_ts, ready_jobs_time, jobs_stats):
+        total_time = time.time() - start_ts
+        jobs_time = sum(stats['time'] for stats in jobs_stats)
+        self._execute_stats = {
+            'ts': start_ts,
+            'workers': self.execute_workers,
+            'jobs': len(jobs_stats),
+            'failed_jobs': sum(1 for stats in jobs_stats if stats['result'] == 'failed'),
+            'time': total_time,
+            'ready_jobs_time': ready_jobs_time,
+            # sum of jobs processing time, compared to 'time' shows
+            # the effect of concurrent processing
+            'jobs_time': jobs_time,
+            'max_job_time': max([stats['time'] for stats in jobs_stats] or [0.0]),
+            'jobs_stats': jobs_stats,
+        }
+        logger.info(
+            'Jobs execution: {jobs} jobs processed by {workers} workers, '
+            'time: {time:.3f}s (ready jobs: {ready_jobs_time:.3f}s, '
+            'jobs total: {jobs_time:.3f}s, max job: {max_job_time:.3f}s)'.format(
+                **self._execute_stats
+            )
+        )
+
+    @h.concurrent_handler
+    def get_job_processor_stats(self, request):
+        return self._execute_stats
+
     def __process_job(self, job):
 
         logger.debug('Job {0}, processing started: {1}'.format(job.id, job.dump()))
@@ -519,6 +574,7 @@ class JobProcessor(object):
                 group = storage.groups[group_id]
                 group.set_active_job(job)
                 group.update_status_recursive()
+                self.node_info_updater.invalidate_listings()
 
         return job
 
@@ -784,6 +840,7 @@ class JobFinder(object):
 
     def __init__(self, db):
         self.collection = Collection(db[config['metadata']['jobs']['db']], 'jobs')
+        self.active_jobs = ActiveJobsIndex(self.collection)
 
     @h.concurrent_handler
     def get_job_list(self, request):
@@ -841,12 +898,43 @@ class JobFinder(object):
         job.collection = self.collection
         return job
 
+    @h.concurrent_handler
+    def get_active_jobs_index_stats(self, request):
+        return self.active_jobs.dump_stats()
+
+    @staticmethod
+    def _active_only(statuses):
+        """Checks if requested statuses can be served by active jobs index"""
+        if not JOB_CONFIG.get('active_jobs_index', {}).get('enabled', True):
+            return False
+        if statuses is None:
+            return False
+        if not isinstance(statuses, (list, tuple, set, frozenset)):
+            statuses = [statuses]
+        return all(status in Job.ACTIVE_STATUSES for status in statuses)
+
     def jobs_count(self, types=None, statuses=None):
+        if self._active_only(statuses):
+            return len(self.active_jobs.jobs(types=types, statuses=statuses))
         return Job.list(self.collection,
             status=statuses,
             type=types).count()
 
-    def jobs(self, types=None, statuses=None, ids=None, groups=None):
+    def jobs(self, types=None, statuses=None, ids=None, groups=None, for_update=False):
+        """Get jobs filtered by types, statuses, ids and groups
+
+        Active jobs are served by in-memory index. Such jobs are shared
+        between callers and should not be modified unless 'for_update'
+        is set.
+        """
+        if self._active_only(statuses):
+            return self.active_jobs.jobs(
+                types=types,
+                statuses=statuses,
+                ids=ids,
+                groups=groups,
+                for_update=for_update,
+            )
         jobs = [JobFactory.make_job(j) for j in Job.list(self.collection,
                                                          status=statuses,
                                                          type=types,
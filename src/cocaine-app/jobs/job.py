@@ -223,6 +223,13 @@ class Job(MongoObject):
         data['tasks'] = [task.human_dump() for task in self.tasks]
         return data
 
+    def save(self):
+        if self._dirty:
+            # active jobs index is refreshed by update timestamp,
+            # every saved change should be visible to it
+            self.update_ts = time.time()
+        super(Job, self).save()
+
     def node_backend(self, host, port, backend_id):
         return '{0}:{1}/{2}'.format(host, port, backend_id)
 
@@ -0,0 +1,233 @@
+import copy
+import logging
+import threading
+import time
+
+from config import config
+from job import Job
+from job_factory import JobFactory
+from resource_ledger import ResourceLedger
+
+
+logger = logging.getLogger('mm.jobs')
+
+INDEX_CONFIG = config.get('jobs', {}).get('active_jobs_index', {})
+
+
+def _as_list(value):
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return list(value)
+    return [value]
+
+
+class ActiveJobsIndex(object):
+    """In-memory view of active jobs
+
+    Active jobs are loaded from jobs collection once and then refreshed
+    incrementally: only documents with update timestamp not older than the
+    start of the previous refresh are fetched. Update timestamps are stored
+    with one second precision and are written by several hosts, so the lower
+    bound is shifted back by 'refresh_overlap' seconds; documents fetched
+    again without changes are not materialized. Complete reload is performed
+    every 'full_refresh_period' seconds.
+
+    Jobs are indexed by id and group, resources used by started jobs
+    are accounted by resource ledger. Job objects returned by
+    'jobs' are shared between readers and should not be modified, 'for_update'
+    flag provides private copies of jobs materialized from cached documents.
+    """
+
+    def __init__(self,
+                 collection,
+                 refresh_period=INDEX_CONFIG.get('refresh_period', 1),
+                 refresh_overlap=INDEX_CONFIG.get('refresh_overlap', 10),
+                 full_refresh_period=INDEX_CONFIG.get('full_refresh_period', 600)):
+        self.collection = collection
+        self.refresh_period = refresh_period
+        self.refresh_overlap = refresh_overlap
+        self.full_refresh_period = full_refresh_period
+
+        self._lock = threading.Lock()
+        self._docs = {}
+        self._jobs = {}
+        self._job_groups = {}
+        self._by_group = {}
+        self.resources = ResourceLedger()
+
+        self._refresh_ts = None
+        self._full_refresh_ts = None
+
+        self.stats = {
+            'full_refreshes': 0,
+            'incremental_refreshes': 0,
+            'docs_fetched': 0,
+            'docs_fetched_total': 0,
+            'jobs_materialized': 0,
+            'jobs_materialized_total': 0,
+            'jobs_removed': 0,
+            'refresh_time': 0.0,
+        }
+
+    def refresh(self, max_lag=None):
+        """Refresh active jobs if the view is older than 'max_lag' seconds
+        (refresh period by default)
+        """
+        if max_lag is None:
+            max_lag = self.refresh_period
+        with self._lock:
+            self._refresh(max_lag)
+
+    def _refresh(self, max_lag):
+        start_ts = time.time()
+        if self._refresh_ts is not None and start_ts - self._refresh_ts < max_lag:
+            return
+
+        fetched, materialized, removed = 0, 0, 0
+        full = (
+            self._full_refresh_ts is None or
+            start_ts - self._full_refresh_ts >= self.full_refresh_period
+        )
+        if full:
+            seen = set()
+            for doc in Job.list(self.collection, status=list(Job.ACTIVE_STATUSES)):
+                fetched += 1
+                seen.add(doc['id'])
+                materialized += self._update(doc)
+            for job_id in self._docs.keys():
+                if job_id not in seen:
+                    removed += self._remove(job_id)
+            self._full_refresh_ts = start_ts
+            self.stats['full_refreshes'] += 1
+        else:
+            since = int(self._refresh_ts - self.refresh_overlap)
+            for doc in self.collection.find({'update_ts': {'$gte': since}}):
+                fetched += 1
+                if doc['status'] in Job.ACTIVE_STATUSES:
+                    materialized += self._update(doc)
+                else:
+                    removed += self._remove(doc['id'])
+            self.stats['incremental_refreshes'] += 1
+
+        self._refresh_ts = start_ts
+
+        self.stats['docs_fetched'] = fetched
+        self.stats['docs_fetched_total'] += fetched
+        self.stats['jobs_materialized'] = materialized
+        self.stats['jobs_materialized_total'] += materialized
+        self.stats['jobs_removed'] = removed
+        self.stats['refresh_time'] = time.time() - start_ts
+
+        logger.debug(
+            'Active jobs {refresh} refresh: {fetched} documents fetched, '
+            '{materialized} jobs materialized, {removed} jobs removed, '
+            'time: {time:.3f}s'.format(
+                refresh='full' if full else 'incremental',
+                fetched=fetched,
+                materialized=materialized,
+                removed=removed,
+                time=self.stats['refresh_time'],
+            )
+        )
+
+    def _update(self, doc):
+        job_id = doc['id']
+        if self._docs.get(job_id) == doc:
+            return 0
+
+        self._remove(job_id)
+        try:
+            job = JobFactory.make_job(copy.deepcopy(doc))
+        except Exception:
+            logger.exception('Job {}: failed to load job'.format(job_id))
+            return 0
+        job.collection = self.collection
+        job._dirty = False
+
+        group = doc.get('group')
+        self._docs[job_id] = doc
+        self._jobs[job_id] = job
+        self._job_groups[job_id] = group
+        if group is not None:
+            self._by_group.setdefault(group, set()).add(job_id)
+        self.resources.add(job)
+        return 1
+
+    def _remove(self, job_id):
+        if job_id not in self._docs:
+            return 0
+        del self._docs[job_id]
+        del self._jobs[job_id]
+        group = self._job_groups.pop(job_id)
+        if group is not None:
+            self._discard(self._by_group, group, job_id)
+        self.resources.remove(job_id)
+        return 1
+
+    @staticmethod
+    def _discard(index, key, job_id):
+        job_ids = index[key]
+        job_ids.discard(job_id)
+        if not job_ids:
+            del index[key]
+
+    def jobs(self, types=None, statuses=None, ids=None, groups=None, for_update=False):
+        """Get active jobs filtered in the same way as 'Job.list' does
+
+        Jobs are sorted by creation time in descending order.
+        """
+        types = _as_list(types)
+        statuses = _as_list(statuses)
+        ids = _as_list(ids)
+        groups = _as_list(groups)
+
+        self.refresh()
+        with self._lock:
+            job_ids = None
+            if ids is not None:
+                job_ids = set(job_id for job_id in ids if job_id in self._jobs)
+            if groups is not None:
+                group_job_ids = set()
+                for group in groups:
+                    group_job_ids.update(self._by_group.get(group, ()))
+                job_ids = group_job_ids if job_ids is None else job_ids & group_job_ids
+            if job_ids is None:
+                job_ids = self._jobs.iterkeys()
+
+            jobs = []
+            for job_id in job_ids:
+                job = self._jobs[job_id]
+                if types is not None and job.type not in types:
+                    continue
+                if statuses is not None and job.status not in statuses:
+                    continue
+                if for_update:
+                    job = JobFactory.make_job(copy.deepcopy(self._docs[job_id]))
+                    job.collection = self.collection
+                    job._dirty = False
+                jobs.append(job)
+
+        jobs.sort(key=lambda j: j.create_ts, reverse=True)
+        return jobs
+
+    def check_resources(self):
+        """Checks resource ledger against a full recount of active jobs"""
+        with self._lock:
+            return self.resources.check(self._jobs.itervalues())
+
+    def dump_resources(self):
+        with self._lock:
+            return self.resources.dump()
+
+    def dump_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['active_jobs'] = len(self._jobs)
+            stats['groups'] = len(self._by_group)
+            stats['lag'] = (
+                time.time() - self._refresh_ts
+                if self._refresh_ts is not None else
+                None
+            )
+        return stats
@@ -0,0 +1,112 @@
+import itertools
+
+from job import Job
+
+
+def unfold_resources(d):
+    """Yields (resource type, resource value) pairs of job resources dict"""
+    if d is None:
+        raise StopIteration
+    for res_type, res_val in itertools.chain(*[itertools.product([k], v)
+                                               for k, v in d.iteritems()]):
+        if isinstance(res_val, list):
+            res_val = tuple(res_val)
+        yield res_type, res_val
+
+
+class ResourceLedger(object):
+    """Running counters of resources used by active jobs
+
+    Jobs that are started (executing, pending or broken) hold their
+    resources, counters are kept by job type and resource. Number of
+    executing jobs is counted by job type. Counters are updated when
+    a job is added with a new state or removed, so that usage of a single
+    resource is available without recounting all active jobs.
+    """
+
+    HOLDING_STATUSES = (
+        Job.STATUS_EXECUTING,
+        Job.STATUS_PENDING,
+        Job.STATUS_BROKEN,
+    )
+
+    def __init__(self):
+        self._usage = {}
+        self._executing = {}
+        self._accounted = {}
+
+    def add(self, job):
+        self.remove(job.id)
+        if job.status not in self.HOLDING_STATUSES:
+            return
+        resources = list(unfold_resources(getattr(job, 'resources', None)))
+        executing = job.status == Job.STATUS_EXECUTING
+        self._accounted[job.id] = (job.type, resources, executing)
+
+        type_usage = self._usage.setdefault(job.type, {})
+        for resource in resources:
+            type_usage[resource] = type_usage.get(resource, 0) + 1
+        if executing:
+            self._executing[job.type] = self._executing.get(job.type, 0) + 1
+
+    def remove(self, job_id):
+        if job_id not in self._accounted:
+            return
+        job_type, resources, executing = self._accounted.pop(job_id)
+
+        type_usage = self._usage[job_type]
+        for resource in resources:
+            type_usage[resource] -= 1
+            if not type_usage[resource]:
+                del type_usage[resource]
+        if not type_usage:
+            del self._usage[job_type]
+        if executing:
+            self._executing[job_type] -= 1
+            if not self._executing[job_type]:
+                del self._executing[job_type]
+
+    def usage(self, job_type, res_type, res_val):
+        return self._usage.get(job_type, {}).get((res_type, res_val), 0)
+
+    def executing(self, job_type):
+        return self._executing.get(job_type, 0)
+
+    def check(self, jobs):
+        """Compares counters with a full recount of resources used by 'jobs'
+
+        Returns list of mismatches as (job type, resource, counter, recounted
+        value) tuples, number of executing jobs is reported with 'executing'
+        resource.
+        """
+        recount = ResourceLedger()
+        for job in jobs:
+            recount.add(job)
+
+        mismatches = []
+        for job_type in set(self._usage) | set(recount._usage):
+            usage = self._usage.get(job_type, {})
+            recounted = recount._usage.get(job_type, {})
+            for resource in set(usage) | set(recounted):
+                if usage.get(resource, 0) != recounted.get(resource, 0):
+                    mismatches.append(
+                        (job_type, resource, usage.get(resource, 0), recounted.get(resource, 0))
+                    )
+        for job_type in set(self._executing) | set(recount._executing):
+            if self.executing(job_type) != recount.executing(job_type):
+                mismatches.append(
+                    (job_type, 'executing', self.executing(job_type), recount.executing(job_type))
+                )
+        return mismatches
+
+    def dump(self):
+        res = {}
+        for job_type, type_usage in self._usage.iteritems():
+            type_res = res.setdefault(job_type, {'resources': {}})
+            for (res_type, res_val), count in type_usage.iteritems():
+                if isinstance(res_val, tuple):
+                    res_val = ':'.join(str(v) for v in res_val)
+                type_res['resources'].setdefault(res_type, {})[res_val] = count
+        for job_type, count in self._executing.iteritems():
+            res.setdefault(job_type, {'resources': {}})['executing'] = count
+        return res
@@ -70,6 +70,7 @@ class HistoryRemoveNodeTask(Task):
                     self.parent_job.id, self.id, node_backend, group))
             group.remove_node_backend(node_backend)
             group.update_status_recursive()
+            storage.entities_changed()
             logger.info('Job {0}, task {1}: removed node backend {2} '
                 'from group {3} node backends'.format(
                     self.parent_job.id, self.id, node_backend, group))
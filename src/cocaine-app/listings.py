@@ -0,0 +1,244 @@
+import logging
+import threading
+import time
+
+import storage
+
+
+logger = logging.getLogger('mm.balancer')
+
+
+COUPLE_STATES = {
+    'good': [storage.Status.OK],
+    'full': [storage.Status.FULL],
+    'frozen': [storage.Status.FROZEN],
+    'bad': [storage.Status.INIT, storage.Status.BAD],
+    'broken': [storage.Status.BROKEN],
+    'service-stalled': [storage.Status.SERVICE_STALLED],
+    'service-active': [storage.Status.SERVICE_ACTIVE],
+}
+
+GROUP_STATES = {
+    'init': [storage.Status.INIT],
+    'good': [storage.Status.COUPLED],
+    'bad': [storage.Status.INIT, storage.Status.BAD],
+    'broken': [storage.Status.BROKEN],
+    'ro': [storage.Status.RO],
+    'migrating': [storage.Status.MIGRATING],
+}
+
+
+def _matching_states(status, states):
+    return [None] + [state for state, statuses in states.iteritems() if status in statuses]
+
+
+class ListingsSnapshot(object):
+    """Immutable snapshot of couples, groupsets and groups listings
+
+    Snapshot is built from storage on cluster updates. Entities are
+    serialized during the build and indexed by supported filters, so
+    listing requests are served without touching storage objects.
+    Serialized entities are shared between listings and responses and
+    should never be modified.
+    """
+    def __init__(self, version):
+        self.version = version
+        self.timestamp = time.time()
+        # (namespace, state) -> list of serialized couples
+        self._couples = {}
+        # (namespace, type, state) -> list of serialized groupsets
+        self._groupsets = {}
+        # (state, type) -> list of (group id, coupled flag, serialized group)
+        self._groups = {}
+        # state -> list of couples' group ids tuples
+        self._couple_tuples = {
+            'good': [],
+            'bad': [],
+            'frozen': [],
+            'closed': [],
+        }
+        self._namespaces = set()
+
+    @staticmethod
+    def build(version):
+        snapshot = ListingsSnapshot(version)
+        snapshot._namespaces = set(ns.id for ns in storage.namespaces.keys())
+        snapshot._build_couples()
+        snapshot._build_groupsets()
+        snapshot._build_groups()
+        return snapshot
+
+    @staticmethod
+    def _serialize(entities):
+        infos = {}
+        for entity in entities:
+            try:
+                infos[entity] = entity.info().serialize()
+            except Exception:
+                logger.exception('Failed to serialize {}'.format(entity))
+                continue
+        return infos
+
+    def _build_couples(self):
+        # TODO: decide if lrc groupsets should be here
+        couples = storage.replicas_groupsets.keys()
+        infos = self._serialize(couples)
+
+        scopes = [(None, couples)]
+        for ns in storage.namespaces.keys():
+            scopes.append((ns.id, ns.couples.keys()))
+
+        for ns_id, ns_couples in scopes:
+            for couple in ns_couples:
+                if couple not in infos:
+                    continue
+                for state in _matching_states(couple.status, COUPLE_STATES):
+                    self._couples.setdefault((ns_id, state), []).append(infos[couple])
+
+        for couple in couples:
+            couple_tuple = couple.as_tuple()
+            if couple.status == storage.Status.OK:
+                self._couple_tuples['good'].append(couple_tuple)
+            elif couple.status == storage.Status.FROZEN:
+                self._couple_tuples['frozen'].append(couple_tuple)
+            elif couple.status == storage.Status.FULL:
+                self._couple_tuples['closed'].append(couple_tuple)
+            if couple.status not in storage.NOT_BAD_STATUSES:
+                self._couple_tuples['bad'].append(couple_tuple)
+
+    def _build_groupsets(self):
+        infos = self._serialize(storage.groupsets)
+
+        scopes = [(None, storage.groupsets)]
+        for ns in storage.namespaces.keys():
+            scopes.append((ns.id, ns.groupsets))
+
+        for ns_id, groupsets in scopes:
+            for groupset_type, typed_groupsets in groupsets.types.iteritems():
+                for groupset in typed_groupsets.keys():
+                    if groupset not in infos:
+                        continue
+                    for state in _matching_states(groupset.status, COUPLE_STATES):
+                        for key in ((ns_id, None, state), (ns_id, groupset_type, state)):
+                            self._groupsets.setdefault(key, []).append(infos[groupset])
+
+    def _build_groups(self):
+        groups = storage.groups.keys()
+        infos = self._serialize(groups)
+
+        for group in groups:
+            if group not in infos:
+                continue
+            entry = (group.group_id, bool(group.couple), infos[group])
+            for state in _matching_states(group.status, GROUP_STATES):
+                for key in ((state, None), (state, group.type)):
+                    self._groups.setdefault(key, []).append(entry)
+
+    def same_content(self, other):
+        return (
+            self._namespaces == other._namespaces and
+            self._couple_tuples == other._couple_tuples and
+            self._couples == other._couples and
+            self._groupsets == other._groupsets and
+            self._groups == other._groups
+        )
+
+    def couples(self, namespace=None, state=None):
+        if state is not None and state not in COUPLE_STATES:
+            raise ValueError('Invalid state: {0}'.format(state))
+        return self._couples.get((namespace, state), [])
+
+    def groupsets(self, namespace=None, type=None, state=None):
+        if state is not None and state not in COUPLE_STATES:
+            raise ValueError('Invalid state: {0}'.format(state))
+        if namespace is not None and namespace not in self._namespaces:
+            return []
+        if type is not None and type not in storage.groupsets.types:
+            raise ValueError('Unexpected groupsets type: "{}"'.format(type))
+        return self._groupsets.get((namespace, type, state), [])
+
+    def groups(self, state=None, type=None, uncoupled=None, in_jobs=None, in_service_group_ids=()):
+        """Get serialized groups list
+
+        Parameters:
+            state - groups state (see GROUP_STATES);
+            type - groups type;
+            uncoupled - filter groups by participation in couples, deprecated,
+                ignored if @type is set;
+            in_jobs - filter groups by participation in jobs, @in_service_group_ids
+                should contain ids of groups participating in jobs;
+        """
+        if state is not None and state not in GROUP_STATES:
+            raise ValueError('Invalid state: {0}'.format(state))
+
+        entries = self._groups.get((state, type), [])
+        if type is not None:
+            uncoupled = None
+        if uncoupled is None and in_jobs is None:
+            return [info for _, _, info in entries]
+
+        return [
+            info
+            for group_id, coupled, info in entries
+            if (uncoupled is None or coupled != bool(uncoupled)) and
+            (in_jobs is None or (group_id in in_service_group_ids) == in_jobs)
+        ]
+
+    def couple_tuples(self, state):
+        return self._couple_tuples[state]
+
+
+class Listings(object):
+    """Publisher of listings snapshots
+
+    Full snapshot is rebuilt on every cluster update. Changes of storage
+    entities made by targeted status updates, handlers and tasks bump
+    storage changes version (see storage.entities_changed), snapshot built
+    for an older version is rebuilt lazily on the next read, so several
+    changes in a row cost a single rebuild. Readers always get the latest
+    snapshot, or None if no snapshot has been built yet. Snapshot version
+    is bumped only when listings content changes.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = 0
+        self._snapshot = None
+        # storage changes version the published snapshot is built for
+        self._changes_version = None
+
+    @property
+    def snapshot(self):
+        if self._snapshot is not None and self._changes_version != storage.changes_version:
+            with self._lock:
+                if self._changes_version != storage.changes_version:
+                    try:
+                        self._rebuild()
+                    except Exception:
+                        logger.exception('Failed to rebuild listings snapshot')
+        return self._snapshot
+
+    def invalidate(self):
+        storage.entities_changed()
+
+    def update(self):
+        with self._lock:
+            self._rebuild()
+
+    def _rebuild(self):
+        start_ts = time.time()
+        # entities changed during the build will invalidate snapshot again
+        changes_version = storage.changes_version
+        snapshot = ListingsSnapshot.build(self._version + 1)
+        self._changes_version = changes_version
+        if self._snapshot is not None and self._snapshot.same_content(snapshot):
+            logger.info('Listings snapshot version {version} is not changed, time: {time:.3f}'.format(
+                version=self._version,
+                time=time.time() - start_ts,
+            ))
+            return
+        self._version = snapshot.version
+        self._snapshot = snapshot
+        logger.info('Listings snapshot version {version} is published, time: {time:.3f}'.format(
+            version=snapshot.version,
+            time=time.time() - start_ts,
+        ))
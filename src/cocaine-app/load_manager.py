@@ -1,4 +1,15 @@
+import time
+
+
 class LoadManager(object):
+    """Load model of cluster entities
+
+    Load objects are kept between updates and are updated in place.
+    Full update walks the whole namespaces -> couples -> groups -> node backends
+    tree reusing load objects of the entities that are still present,
+    incremental update recalculates only the loads affected by the node
+    backends that reported new statistics.
+    """
     def __init__(self):
         self.namespaces = {}
         self.couples = {}
@@ -7,39 +18,181 @@ class LoadManager(object):
         self.disks = {}
         self.net = {}
 
-    def update(self, storage):
+        # node backend -> (net key, disk key, group)
+        self._nb_keys = {}
+        # net key -> node backend which node statistics is used for net load
+        self._net_node_backends = {}
+        # disk key -> node backends sharing the disk
+        self._disk_node_backends = {}
+        # group -> couple, couple -> namespace
+        self._group_couples = {}
+        self._couple_namespaces = {}
+
+    def update(self, storage, node_backends=None, groups=None):
+        """Update load model
+
+        If @node_backends is set, only loads depending on statistics of these
+        node backends are recalculated. @groups are the groups which node
+        backends set has changed, full update is performed if any of these
+        groups is accounted in the load model.
+        """
+        start_ts = time.time()
+        counters = {
+            'allocated': 0,
+            'reused': 0,
+            'recalculated': 0,
+        }
+        incremental = (
+            node_backends is not None and
+            self._can_update_incrementally(node_backends, groups or ())
+        )
+        if incremental:
+            self._update_incremental(node_backends, counters)
+        else:
+            self._update_full(storage, counters)
+
+        counters['incremental'] = incremental
+        counters['time'] = time.time() - start_ts
+        return counters
+
+    def _can_update_incrementally(self, node_backends, groups):
+        if not self.namespaces:
+            return False
+        if any(group in self.groups for group in groups):
+            # node backends set of an accounted group has changed
+            return False
+        for nb in node_backends:
+            if nb not in self.node_backends and nb.group in self.groups:
+                return False
+        return True
+
+    @staticmethod
+    def _get_load(loads, key, load_type, counters):
+        load = loads.get(key)
+        if load is None:
+            counters['allocated'] += 1
+            return load_type()
+        counters['reused'] += 1
+        return load
+
+    def _update_full(self, storage, counters):
         namespaces = {}
         couples = {}
         groups = {}
         node_backends = {}
         disks = {}
         net = {}
+        nb_keys = {}
+        net_node_backends = {}
+        disk_node_backends = {}
+        group_couples = {}
+        couple_namespaces = {}
         for ns in storage.namespaces:
-            namespaces[ns] = nsl = NamespaceLoad()
+            namespaces[ns] = nsl = self._get_load(self.namespaces, ns, NamespaceLoad, counters)
+            nsl.reset()
             for couple in ns.couples:
-                couples[couple] = cl = CoupleLoad()
+                couples[couple] = cl = self._get_load(self.couples, couple, CoupleLoad, counters)
+                cl.reset()
+                couple_namespaces[couple] = ns
                 for group in couple.groups:
-                    groups[group] = gl = GroupLoad()
+                    groups[group] = gl = self._get_load(self.groups, group, GroupLoad, counters)
+                    gl.reset()
+                    group_couples[group] = couple
                     for nb in group.node_backends:
-                        node_backends[nb] = nbl = NodeBackendLoad()
+                        node_backends[nb] = nbl = self._get_load(
+                            self.node_backends, nb, NodeBackendLoad, counters)
 
                         nb_hostname = nb.node.host.hostname
+                        disk_key = (nb_hostname, nb.fs.fsid)
                         if nb_hostname not in net:
-                            net[nb_hostname] = NetLoad(nb.node.stat)
-                        if (nb_hostname, nb.fs.fsid) not in disks:
-                            disks[(nb_hostname, nb.fs.fsid)] = DiskLoad(nb.fs.stat)
+                            net[nb_hostname] = netl = self._get_load(
+                                self.net, nb_hostname, NetLoad, counters)
+                            netl.set(nb.node.stat)
+                            net_node_backends[nb_hostname] = nb
+                        if disk_key not in disks:
+                            disks[disk_key] = diskl = self._get_load(
+                                self.disks, disk_key, DiskLoad, counters)
+                            diskl.set(nb.fs.stat)
+                        nb_keys[nb] = (nb_hostname, disk_key, group)
+                        disk_node_backends.setdefault(disk_key, []).append(nb)
 
-                        nbl.set(nb.stat, disks[(nb_hostname, nb.fs.fsid)])
+                        nbl.set(nb.stat, disks[disk_key])
                         gl.add_backend(nbl)
 
                     cl.add_group(gl)
                 nsl.add_couple(cl)
+        counters['recalculated'] = (
+            len(namespaces) + len(couples) + len(groups) +
+            len(node_backends) + len(disks) + len(net)
+        )
         self.namespaces = namespaces
         self.couples = couples
         self.groups = groups
         self.node_backends = node_backends
         self.disks = disks
         self.net = net
+        self._nb_keys = nb_keys
+        self._net_node_backends = net_node_backends
+        self._disk_node_backends = disk_node_backends
+        self._group_couples = group_couples
+        self._couple_namespaces = couple_namespaces
+
+    def _update_incremental(self, node_backends, counters):
+        nets = set()
+        disks = {}
+        for nb in node_backends:
+            if nb not in self._nb_keys:
+                continue
+            net_key, disk_key, _ = self._nb_keys[nb]
+            nets.add(net_key)
+            disks.setdefault(disk_key, nb)
+
+        for net_key in nets:
+            self.net[net_key].set(self._net_node_backends[net_key].node.stat)
+        for disk_key, nb in disks.iteritems():
+            self.disks[disk_key].set(nb.fs.stat)
+
+        # node backend load depends on its disk load, so all node backends
+        # sharing the disk are recalculated
+        groups = set()
+        nbs_count = 0
+        for disk_key in disks:
+            disk_load = self.disks[disk_key]
+            for nb in self._disk_node_backends[disk_key]:
+                self.node_backends[nb].set(nb.stat, disk_load)
+                groups.add(self._nb_keys[nb][2])
+                nbs_count += 1
+
+        couples = set()
+        for group in groups:
+            gl = self.groups[group]
+            gl.reset()
+            for nb in group.node_backends:
+                gl.add_backend(self.node_backends[nb])
+            couples.add(self._group_couples[group])
+
+        namespaces = set()
+        for couple in couples:
+            cl = self.couples[couple]
+            cl.reset()
+            for group in couple.groups:
+                cl.add_group(self.groups[group])
+            namespaces.add(self._couple_namespaces[couple])
+
+        for ns in namespaces:
+            nsl = self.namespaces[ns]
+            nsl.reset()
+            for couple in ns.couples:
+                nsl.add_couple(self.couples[couple])
+
+        counters['reused'] = (
+            len(self.namespaces) + len(self.couples) + len(self.groups) +
+            len(self.node_backends) + len(self.disks) + len(self.net)
+        )
+        counters['recalculated'] = (
+            len(namespaces) + len(couples) + len(groups) +
+            nbs_count + len(disks) + len(nets)
+        )
 
 
 load_manager = LoadManager()
@@ -47,6 +200,9 @@ load_manager = LoadManager()
 
 class EllipticsLoad(object):
     def __init__(self):
+        self.reset()
+
+    def reset(self):
         self.io_blocking_queue_size = 0
         self.io_nonblocking_queue_size = 0
 
@@ -142,7 +298,11 @@ class NodeBackendLoad(EllipticsLoad):
 
 
 class NetLoad(object):
-    def __init__(self, node_stat):
+    def __init__(self, node_stat=None):
+        if node_stat is not None:
+            self.set(node_stat)
+
+    def set(self, node_stat):
         self.read_rate = max(node_stat.tx_rate,
                              node_stat.commands_stat.ell_net_read_rate)
         self.ell_read_rate = min(node_stat.tx_rate,
@@ -156,7 +316,11 @@ class NetLoad(object):
 
 
 class DiskLoad(object):
-    def __init__(self, fs_stat):
+    def __init__(self, fs_stat=None):
+        if fs_stat is not None:
+            self.set(fs_stat)
+
+    def set(self, fs_stat):
         self.disk_util = fs_stat.disk_util
         self.disk_util_read = fs_stat.disk_util_read
         self.disk_util_write = fs_stat.disk_util_write
@@ -1,5 +1,7 @@
 import logging
 import socket
+import threading
+import time
 
 from errors import CacheUpstreamError
 import helpers as h
@@ -46,17 +48,112 @@ class ManualLocker(object):
 
         return lock_id
 
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._watch_started = False
+        self._watch_starting = False
+        # locked hostnames as reported by the last children locks watch event
+        self._hostnames = None
+        self._hostnames_version = 0
+        self._hostnames_update_ts = None
+        # (hostnames version, number of storage hosts) -> resolved locked hosts
+        self._hosts_key = None
+        self._hosts = None
+
+    def _ensure_watch(self):
+        if self._watch_started:
+            return True
+        if not hasattr(sync_manager, 'watch_children_locks'):
+            return False
+        with self._lock:
+            if self._watch_started or self._watch_starting:
+                return self._watch_started
+            self._watch_starting = True
+        # watch is set outside of the lock since sync manager can call
+        # the callback synchronously on registration
+        try:
+            sync_manager.watch_children_locks(self.HOST_LOCK_PREFIX, self._on_locks)
+        except Exception:
+            logger.exception('Failed to set watch for manual host locks')
+            with self._lock:
+                self._watch_starting = False
+            return False
+        with self._lock:
+            self._watch_started = True
+            self._watch_starting = False
+        return True
+
+    def _on_locks(self, locks):
+        hostnames = set(lock[len(self.HOST_LOCK_PREFIX):] for lock in locks)
+        logger.info('Manual host locks updated: {0}'.format(hostnames))
+        with self._lock:
+            self._hostnames = hostnames
+            self._hostnames_version += 1
+            self._hostnames_update_ts = time.time()
+
+    def is_stale(self):
+        """Check if cached locked hosts can be outdated
+
+        Cached locked hosts are stale until watch is set up
+        and while connection to sync service is lost.
+        """
+        if not self._watch_started or self._hostnames is None:
+            return True
+        return not sync_manager.is_connected()
+
+    @h.concurrent_handler
+    def get_locked_hosts_state(self, request):
+        return {
+            'hostnames': sorted(self._hostnames or ()),
+            'stale': self.is_stale(),
+            'update_ts': self._hostnames_update_ts,
+        }
+
     def get_locked_hosts(self):
+        if not self._ensure_watch():
+            return self._resolve_hosts(self._fetch_hostnames())
+
+        with self._lock:
+            hostnames, version = self._hostnames, self._hostnames_version
+            hosts_key = (version, len(storage.hosts))
+            if self._hosts_key == hosts_key:
+                return self._hosts
+
+        if hostnames is None:
+            hostnames = self._fetch_hostnames()
+
+        if self.is_stale():
+            logger.warn('Manual host locks can be stale, last update: {0}'.format(
+                self._hostnames_update_ts))
+
+        hosts, complete = self._resolve_hosts(hostnames, return_complete=True)
+        # resolved hosts are shared between readers
+        hosts = frozenset(hosts)
+        if complete:
+            with self._lock:
+                if self._hostnames_version == version:
+                    self._hosts_key = hosts_key
+                    self._hosts = hosts
+        return hosts
+
+    def _fetch_hostnames(self):
         locks = sync_manager.get_children_locks(self.HOST_LOCK_PREFIX)
-        hostnames = set(lock[len(self.HOST_LOCK_PREFIX):] for lock in locks)
+        return set(lock[len(self.HOST_LOCK_PREFIX):] for lock in locks)
+
+    def _resolve_hosts(self, hostnames, return_complete=False):
         hosts = set()
+        complete = True
         logger.debug('hostnames: {0}'.format(hostnames))
-        for host in storage.hosts:
-            try:
-                if host.hostname in hostnames:
-                    hosts.add(host)
-            except CacheUpstreamError:
-                continue
+        if hostnames:
+            for host in storage.hosts:
+                try:
+                    if host.hostname in hostnames:
+                        hosts.add(host)
+                except CacheUpstreamError:
+                    complete = False
+                    continue
+        if return_complete:
+            return hosts, complete
         return hosts
 
 
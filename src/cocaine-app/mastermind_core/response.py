@@ -116,3 +116,126 @@ class CachedGzipResponse(CachedResponse):
                 'that cannot be dumped to json'
             )
         return helpers.gzip_compress(data, compression_level=self._compression_level)
+
+
+class CachedGzipKeyedResponse(CachedGzipResponse):
+    """Mastermind cached response for dict results that can be requested by keys
+
+    Besides the whole result, serialized and compressed versions of
+    a single-key dict {key: value} are stored for every key of the result,
+    so that a response for one key requires neither serialization nor
+    compression. Responses for several keys are built from serialized
+    parts and compressed ones are cached until the next result is set.
+    """
+
+    MAX_CACHED_SUBSETS = 64
+
+    def __init__(self, compression_level=DEFAULT_GZIP_COMPRESSION_LEVEL):
+        super(CachedGzipKeyedResponse, self).__init__(compression_level=compression_level)
+        self._key_parts = {}
+        self._key_compressed_results = {}
+        self._subset_compressed_results = {}
+        self._empty_compressed_result = self._compress({})
+
+    def set_result(self, result):
+        """Set result for cached response and prepare responses for every key
+        """
+        key_parts = {}
+        key_compressed_results = {}
+        for key, value in result.iteritems():
+            data = self._dumps({key: value})
+            # serialized "key": value pair without enclosing braces
+            key_parts[key] = data[1:-1]
+            key_compressed_results[key] = helpers.gzip_compress(
+                data,
+                compression_level=self._compression_level
+            )
+        compressed_result = self._compress_parts(key_parts.itervalues())
+
+        with self.lock:
+            super(CachedGzipResponse, self).set_result(result)
+            self._compressed_result = compressed_result
+            self._key_parts = key_parts
+            self._key_compressed_results = key_compressed_results
+            self._subset_compressed_results = {}
+
+    def set_exception(self, exception):
+        """Set exception that will be thrown on 'get_result' call
+
+        Parameters:
+            exception - exception to throw;
+        """
+        with self.lock:
+            super(CachedGzipKeyedResponse, self).set_exception(exception)
+            self._key_parts = {}
+            self._key_compressed_results = {}
+            self._subset_compressed_results = {}
+
+    def get_result(self, compressed=True, keys=None):
+        """Get cached result or raise stored exception
+
+        Parameters:
+            compressed - boolean flag which determines if compressed version
+            of cached response should be returned;
+            keys - if not None, only these keys of the result are returned,
+            unknown keys are skipped;
+        """
+        with self.lock:
+            result = super(CachedGzipKeyedResponse, self).get_result(compressed=False)
+            if keys is None:
+                if compressed:
+                    return self._compressed_result
+                return result
+
+            keys = frozenset(key for key in keys if key in self._key_parts)
+
+            if not compressed:
+                return dict((key, result[key]) for key in keys)
+
+            if not keys:
+                return self._empty_compressed_result
+            if len(keys) == 1:
+                key, = keys
+                return self._key_compressed_results[key]
+
+            compressed_result = self._subset_compressed_results.get(keys)
+            if compressed_result is None:
+                compressed_result = self._compress_parts(
+                    self._key_parts[key] for key in keys
+                )
+                if len(self._subset_compressed_results) < self.MAX_CACHED_SUBSETS:
+                    self._subset_compressed_results[keys] = compressed_result
+            return compressed_result
+
+    def memory_usage(self):
+        """Get size in bytes of serialized and compressed data held by response
+        """
+        with self.lock:
+            usage = {
+                'compressed_result': len(self._compressed_result or ''),
+                'key_parts': sum(len(part) for part in self._key_parts.itervalues()),
+                'key_compressed_results': sum(
+                    len(data) for data in self._key_compressed_results.itervalues()
+                ),
+                'subset_compressed_results': sum(
+                    len(data) for data in self._subset_compressed_results.itervalues()
+                ),
+            }
+        usage['total'] = sum(usage.itervalues())
+        return usage
+
+    def _compress_parts(self, parts):
+        return helpers.gzip_compress(
+            '{' + ', '.join(parts) + '}',
+            compression_level=self._compression_level
+        )
+
+    @staticmethod
+    def _dumps(result):
+        try:
+            return json.dumps(result)
+        except (TypeError, ValueError):
+            raise TypeError(
+                'Cached gzip response does not support objects '
+                'that cannot be dumped to json'
+            )
@@ -2,6 +2,9 @@ import datetime
 import functools
 import json
 import logging
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+import Queue
 import random
 import socket
 import threading
@@ -12,8 +15,9 @@ import urllib
 import elliptics
 import msgpack
 import requests
+from requests.adapters import HTTPAdapter
 from requests.exceptions import RequestException
-from tornado.httpclient import AsyncHTTPClient, HTTPError
+from tornado.httpclient import HTTPError
 from tornado.simple_httpclient import SimpleAsyncHTTPClient
 from tornado.ioloop import IOLoop
 
@@ -36,7 +40,6 @@ class Minions(object):
     STATE_FETCH_ACTIVE = 'state_fetch_active'
     CMD_ENTRY_FETCH = 'cmd_entry_%s_fetch'
 
-    MAKE_IOLOOP = 'make_ioloop'
     STATE_URL_TPL = 'http://{host}:{port}/rsync/list/?finish_ts_gte={finish_ts_gte}'
     START_URL_TPL = 'http://{host}:{port}/rsync/start/'
     TERMINATE_URL_TPL = 'http://{host}:{port}/command/terminate/'
@@ -57,9 +60,6 @@ class Minions(object):
 
         self.__tq = timed_queue.TimedQueue()
 
-        self.__tq.add_task_in(self.MAKE_IOLOOP, 0,
-            self._make_tq_thread_ioloop)
-
         self.__tq.add_task_in(self.STATE_FETCH,
             5, self._fetch_states)
 
@@ -71,18 +71,39 @@ class Minions(object):
         self.__commands_lock = threading.Lock()
         self.__active_hosts_lock = threading.Lock()
 
+        # minion states are fetched over keep-alive connections
+        # by a bounded number of workers, every worker takes a session
+        # from the pool of idle sessions for a single host request
+        # (sessions are not shared between threads)
+        fetch_concurrency = MINIONS_CFG.get('commands_fetch_concurrency', 50)
+        self.__fetch_sessions = Queue.Queue()
+        for _ in xrange(fetch_concurrency):
+            self.__fetch_sessions.put(self._make_fetch_session())
+        self.__fetch_pool = ThreadPool(processes=fetch_concurrency)
+        # finish ts of the latest finished command received from a host,
+        # only commands finished since then (or unfinished) are fetched
+        self._hosts_finish_ts = {}
+        self._fetch_stats = {}
+
     def _start_tq(self):
         self.__tq.start()
 
-    def _make_tq_thread_ioloop(self):
-        logger.debug('Minion states, creating thread ioloop')
-        io_loop = IOLoop()
-        io_loop.make_current()
+    @staticmethod
+    def _make_fetch_session():
+        session = requests.Session()
+        # a single connection is kept for every host since each host's
+        # minion is requested once per fetch round
+        adapter = HTTPAdapter(
+            pool_connections=MINIONS_CFG.get('commands_fetch_pool_hosts', 4096),
+            pool_maxsize=1,
+        )
+        session.mount('http://', adapter)
+        return session
 
     def _fetch_states(self, active_hosts=False):
         logger.info('Fetching minion states task started')
         try:
-            states = {}
+            start_ts = time.time()
 
             if not active_hosts:
                 hosts = storage.hosts.keys()
@@ -90,40 +111,48 @@ class Minions(object):
                 if not self.active_hosts:
                     return
                 with self.__active_hosts_lock:
-                    hosts = self.active_hosts
+                    hosts = list(set(self.active_hosts))
                     self.active_hosts = []
 
             random.shuffle(hosts)
 
-            # fetch tasks finished in last 24 hours or not finished at all
-            min_finish_ts = int(time.time()) - 24 * 60 * 60
-            for host in hosts:
-                url = self.STATE_URL_TPL.format(host=self._wrap_host(host.addr),
-                                                port=self.minion_port,
-                                                finish_ts_gte=min_finish_ts)
-                states[url] = host
-            logger.debug('Starting async batch')
-            responses = AsyncHTTPBatch(states.keys(),
-                headers=self.minion_headers,
-                timeout=MINIONS_CFG.get('commands_fetch_timeout', 15)).get()
-
-            successful_hosts = set()
-            for url, response in responses.iteritems():
-                host = states[url]
-
-                try:
-                    data = self._get_response(host, response)
-                except HTTPError as e:
-                    logger.error('Minion tasks fetch error: {0}'.format(e))
+            logger.debug('Fetching minion states from {} hosts'.format(len(hosts)))
+            deadline = start_ts + MINIONS_CFG.get('commands_fetch_round_timeout', 60)
+            responses = self._fetch_hosts_states(hosts, deadline)
+
+            stats = {
+                'ts': start_ts,
+                'hosts': len(hosts),
+                'failed_hosts': len(hosts) - len(responses),
+                'missed_deadline': len(hosts) - len(responses),
+                'commands': 0,
+                'bytes': 0,
+                'hosts_latency': {},
+            }
+            for host, finish_ts_gte, data, latency in responses:
+                stats['hosts_latency'][host.addr] = latency
+                if data is None:
+                    stats['failed_hosts'] += 1
                     continue
+                stats['bytes'] += len(data)
+
                 try:
-                    self._process_state(host.addr, data)
+                    states = self._process_state(host.addr, data)
                 except errors.MinionApiError:
+                    stats['failed_hosts'] += 1
                     continue
 
-                successful_hosts.add(host.addr)
+                stats['commands'] += len(states)
+                self._update_host_finish_ts(host.addr, finish_ts_gte, states)
+
+            stats['time'] = time.time() - start_ts
+            self._fetch_stats['active' if active_hosts else 'all'] = stats
 
-            logger.info('Finished fetching minion states task')
+            logger.info(
+                'Finished fetching minion states task: {hosts} hosts ({failed_hosts} failed, '
+                '{missed_deadline} missed deadline), {commands} commands, {bytes} bytes, '
+                'time: {time:.3f}s'.format(**stats)
+            )
         except errors.NotReadyError as e:
             logger.warn('Failed to sync minions state: '
                 'minions history is not fetched')
@@ -131,9 +160,96 @@ class Minions(object):
             logger.error('Failed to sync minions state: %s\n%s' %
                          (e, traceback.format_exc()))
         finally:
-            self.__tq.add_task_in(self.STATE_FETCH,
-                MINIONS_CFG.get('commands_fetch_period', 120),
-                self._fetch_states)
+            if not active_hosts:
+                self.__tq.add_task_in(self.STATE_FETCH,
+                    MINIONS_CFG.get('commands_fetch_period', 120),
+                    self._fetch_states)
+
+    def _fetch_hosts_states(self, hosts, deadline):
+        """Fetches states of hosts' commands via fetch pool
+
+        Hosts are requested by pool workers as soon as any of the workers is
+        free, so a slow host does not delay requests to other hosts.
+        Responses are awaited until @deadline, responses of the hosts
+        that have not answered by then are dropped.
+        """
+        results = self.__fetch_pool.imap_unordered(
+            lambda host: self._fetch_host_state(host, deadline),
+            hosts,
+        )
+        responses = []
+        while len(responses) < len(hosts):
+            try:
+                responses.append(results.next(timeout=max(deadline - time.time(), 0)))
+            except (StopIteration, TimeoutError):
+                break
+        if len(responses) < len(hosts):
+            logger.error(
+                'Minion states fetch deadline is exceeded, {} hosts have not '
+                'answered'.format(len(hosts) - len(responses))
+            )
+        return responses
+
+    def _fetch_host_state(self, host, deadline):
+        """Fetches states of host's commands using an idle session
+
+        Called from fetch pool workers, hosts that were not requested
+        before the round @deadline are skipped.
+        """
+        if time.time() >= deadline:
+            return host, None, None, 0.0
+        session = self.__fetch_sessions.get()
+        try:
+            return self._fetch_state(session, host)
+        finally:
+            self.__fetch_sessions.put(session)
+
+    def _fetch_state(self, session, host):
+        """Fetches states of host's commands changed since the last fetch
+
+        Returns (host, finish_ts_gte, response body, latency) tuple,
+        response body is None if request failed.
+        """
+        # fetch tasks finished in last 24 hours or not finished at all
+        min_finish_ts = int(time.time()) - 24 * 60 * 60
+        finish_ts_gte = max(self._hosts_finish_ts.get(host.addr, min_finish_ts), min_finish_ts)
+        start_ts = time.time()
+        try:
+            url = self.STATE_URL_TPL.format(host=self._wrap_host(host.addr),
+                                            port=self.minion_port,
+                                            finish_ts_gte=finish_ts_gte)
+            response = session.get(
+                url,
+                headers=self.minion_headers,
+                timeout=MINIONS_CFG.get('commands_fetch_timeout', 15),
+            )
+        except RequestException as e:
+            logger.error('Failed to connect to minion on host {0} ({1})'.format(host, e))
+            return host, finish_ts_gte, None, time.time() - start_ts
+        except Exception:
+            # a single host should not fail the whole fetch round
+            logger.exception('Failed to fetch minion states from host {0}'.format(host))
+            return host, finish_ts_gte, None, time.time() - start_ts
+        latency = time.time() - start_ts
+
+        if response.status_code != 200:
+            logger.error('Minion http error on host {0}, code {1} ({2})'.format(
+                host, response.status_code, response.reason))
+            return host, finish_ts_gte, None, latency
+
+        return host, finish_ts_gte, response.content, latency
+
+    def _update_host_finish_ts(self, addr, finish_ts_gte, states):
+        finish_ts = finish_ts_gte
+        for state in states.itervalues():
+            if state['progress'] < 1.0 or not state.get('finish_ts'):
+                continue
+            finish_ts = max(finish_ts, int(state['finish_ts']))
+        self._hosts_finish_ts[addr] = finish_ts
+
+    @h.concurrent_handler
+    def get_minion_states_fetch_stats(self, request):
+        return self._fetch_stats
 
     def _process_state(self, addr, response, sync=False):
 
@@ -479,43 +595,3 @@ class Minions(object):
         if not addr.startswith('[') and ':' in addr:
             return '[' + addr + ']'
         return addr
-
-
-class AsyncHTTPBatch(object):
-
-    def __init__(self, urls, headers=None, timeout=3):
-        self.left = len(urls)
-        self.urls = urls
-        self.timeout = timeout
-        self.headers = headers
-        self.ioloop = IOLoop.current()
-        logger.debug('Minion states, ioloop fetched: {0}'.format(self.ioloop))
-        self.responses = {}
-
-    def get(self, emergency_timeout=None):
-        logger.debug('Minion states, creating async http clients')
-        if not self.urls:
-            logger.warn('Empty url list for async http batch')
-            return self.responses
-        max_clients = len(self.urls)
-        [AsyncHTTPClient(max_clients=max_clients).fetch(url, callback=self._process,
-            request_timeout=self.timeout, headers=self.headers, allow_ipv6=True)
-         for url in self.urls]
-        logger.debug('Minion states, starting ioloop')
-        self.ioloop.start()
-        return self.responses
-
-    def _process(self, response):
-        logger.debug('Minion states, received response from {0} '
-                     '({1:.4f}s)'.format(response.request.url, response.request_time))
-        self.responses[response.request.url] = response
-        self.left -= 1
-        if not self.left:
-            logger.debug('Minion states, stopping loop')
-            self.ioloop.stop()
-
-    def _emergency_halt(self):
-        logger.warn('Minion states, emergency exit. '
-                    'Unprocessed requests: {0}'.format(self.left))
-        self.ioloop.stop()
-
@@ -1,8 +1,11 @@
 import atexit
+import re
+
 import elliptics
 
 from mastermind.pool import Pool
 from mastermind.monitor_pool import MonitorStatParseWorker
+from mastermind.utils.json_stream import ANY_KEY
 
 from config import config
 
@@ -17,6 +20,46 @@ MONITOR_STAT_CATEGORIES = (
     elliptics.monitor_stat_categories.commands
 )
 
+# Monitor stat fields that are used by node info updater on processing
+# node and node backends statistics (see NodeInfoUpdater.update_statistics),
+# other fields are dropped while response is being decoded
+MONITOR_STAT_FIELDS = {
+    'timestamp': True,
+    'procfs': {
+        'vm': {
+            'la': True,
+        },
+        'net': {
+            'net_interfaces': True,
+        },
+    },
+    'stats': {
+        re.compile(r'^eblob\.\d+\.disk\.stat_commit\.errors\.'): {
+            'count': True,
+        },
+    },
+    'backends': {
+        ANY_KEY: {
+            'backend_id': True,
+            'config': True,
+            'status': True,
+            'backend': {
+                'config': True,
+                'vfs': True,
+                'dstat': True,
+                'summary_stats': True,
+                'base_stats': {
+                    ANY_KEY: {
+                        'base_size': True,
+                    },
+                },
+            },
+            'io': True,
+            'commands': True,
+        },
+    },
+}
+
 monitor_pool = Pool(
     worker=MonitorStatParseWorker,
     w_initkwds={
@@ -25,8 +68,14 @@ monitor_pool = Pool(
         'monitor_port': config.get('elliptics', {}).get('monitor_port', 10025),
         'connect_timeout': MONITOR_CFG.get('connect_timeout', 5.0),
         'request_timeout': MONITOR_CFG.get('request_timeout', 5.0),
+        'extract_fields': (
+            MONITOR_STAT_FIELDS
+            if MONITOR_CFG.get('stream_parse', True) else
+            None
+        ),
     },
     processes=MONITOR_CFG.get('pool_size', 5),
+    shm_results=MONITOR_CFG.get('shm_results', False),
 )
 
 
@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
 from collections import defaultdict
+import itertools
 import logging
+from multiprocessing import TimeoutError
+import Queue
 import re
 import threading
 import time
@@ -15,10 +18,12 @@ import helpers as h
 from infrastructure import infrastructure
 from jobs import Job
 import keys
+import listings
 from load_manager import load_manager
 from mastermind import helpers as mh
 from mastermind.pool import skip_exceptions
-from mastermind_core.response import CachedGzipResponse
+from mastermind.utils.histogram import Histogram
+from mastermind_core.response import CachedGzipKeyedResponse
 from mastermind_core import errors
 from monitor_pool import monitor_pool
 import timed_queue
@@ -32,6 +37,34 @@ GROUPS_META_UPDATE_TASK_ID = 'groups_meta_update'
 COUPLES_META_UPDATE_TASK_ID = 'couples_meta_update'
 
 
+class ClusterChanges(object):
+    """Storage entities affected during a single statistics collection round
+
+    Node backends that reported new statistics and groups that gained or lost
+    node backends are recorded here so that only their statuses (and statuses
+    of dependent entities) are recalculated afterwards.
+    """
+    def __init__(self):
+        self.node_backends = set()
+        self.groups = set()
+
+
+class MonitorStatsRound(object):
+    """Monitor stat requests issued during a single statistics collection round
+
+    Keeps track of the hosts that have not answered yet, so that responses
+    that missed the round deadline can be processed during the next round.
+    """
+    def __init__(self, results, host_addrs, deadline=None):
+        self.results = results
+        self.deadline = deadline
+        self.pending = set(
+            '{host}:{port}'.format(host=ha.host, port=ha.port)
+            for ha in host_addrs
+        )
+        self.request_times = {}
+
+
 class NodeInfoUpdater(object):
     def __init__(self,
                  node,
@@ -45,8 +78,11 @@ class NodeInfoUpdater(object):
         self.statistics = statistics
         self.job_finder = job_finder
         self.couple_record_finder = couple_record_finder
-        self._namespaces_states = CachedGzipResponse()
+        self._namespaces_states = CachedGzipKeyedResponse()
         self._flow_stats = {}
+        self._cluster_update_stats = {}
+        self._listings = listings.Listings()
+        self._late_monitor_stats = None
         self.__tq = timed_queue.TimedQueue()
         self.__session = elliptics.Session(self.__node)
         wait_timeout = config.get('elliptics', {}).get('wait_timeout') or config.get('wait_timeout', 5)
@@ -76,6 +112,7 @@ class NodeInfoUpdater(object):
                 start_ts = time.time()
                 logger.info('Cluster updating: node statistics collecting started')
                 self.monitor_stats()
+                self._update_listings()
 
                 try:
                     max_group = int(self.__node.meta_session.read_data(
@@ -109,6 +146,7 @@ class NodeInfoUpdater(object):
                 start_ts = time.time()
                 logger.info('Cluster updating: updating group coupling info started')
                 self.update_symm_groups_async()
+                self._update_listings()
 
             if self._prepare_namespaces_states:
                 logger.info('Recalculating namespace states')
@@ -150,13 +188,35 @@ class NodeInfoUpdater(object):
     def update_status(self, groups):
         self.monitor_stats(groups=groups)
         self.update_symm_groups_async(groups=groups)
+        self.invalidate_listings()
+
+    def invalidate_listings(self):
+        """Mark listings snapshot as outdated after targeted entities changes
+
+        Snapshot is rebuilt on the next listings request.
+        """
+        self._listings.invalidate()
+
+    def _update_listings(self):
+        try:
+            self._listings.update()
+        except Exception:
+            logger.exception('Failed to update listings snapshot')
 
     @staticmethod
     def log_monitor_stat_exc(e):
         logger.error('Malformed monitor stat response: {}'.format(e))
 
     @staticmethod
-    def _do_get_monitor_stats(host_addrs):
+    def _request_monitor_stats(host_addrs, deadline=None):
+        results = monitor_pool.imap_unordered(
+            None,
+            ((ha.host, ha.port, ha.family) for ha in host_addrs)
+        )
+        return MonitorStatsRound(results, host_addrs, deadline=deadline)
+
+    @staticmethod
+    def _do_get_monitor_stats(stats_round):
         """Execute monitor stat requests via pool and return successful responses
 
         Sends requests to monitor pool and processes responses.
@@ -170,16 +230,29 @@ class NodeInfoUpdater(object):
 
         In case of any of these events we should log it and
         skip to the next monitor stat response.
+
+        Responses are awaited until the round deadline, hosts that have not
+        answered by then are left in @stats_round pending set.
         """
-        results = monitor_pool.imap_unordered(
-            None,
-            ((ha.host, ha.port, ha.family) for ha in host_addrs)
-        )
         logger.info('Waiting for monitor stats results')
 
-        # TODO: set timeout!!!
-        for packed_result in skip_exceptions(results,
-                                             on_exc=NodeInfoUpdater.log_monitor_stat_exc):
+        results = skip_exceptions(
+            stats_round.results,
+            on_exc=NodeInfoUpdater.log_monitor_stat_exc,
+            deadline=stats_round.deadline,
+        )
+        while True:
+            try:
+                packed_result = next(results)
+            except StopIteration:
+                break
+            except TimeoutError:
+                logger.error(
+                    'Monitor stats round deadline is exceeded, {} hosts have not '
+                    'answered yet'.format(len(stats_round.pending))
+                )
+                break
+
             try:
                 result = msgpack.unpackb(packed_result)
             except Exception:
@@ -195,6 +268,9 @@ class NodeInfoUpdater(object):
                 logger.error('Malformed monitor stat result: host and port are required')
                 continue
 
+            stats_round.pending.discard(node_addr)
+            stats_round.request_times[node_addr] = result.get('request_time')
+
             try:
                 node = storage.nodes[node_addr]
             except KeyError:
@@ -228,6 +304,85 @@ class NodeInfoUpdater(object):
                 )
                 continue
 
+    def _process_late_monitor_stats(self, changes):
+        """Process monitor stat responses that missed the previous round deadline
+
+        Only responses that are already available are processed, responses
+        that are still missing are dropped since the hosts are requested
+        once again in the current round.
+        """
+        stats_round = self._late_monitor_stats
+        self._late_monitor_stats = None
+        if stats_round is None:
+            return 0
+
+        stats_round.deadline = time.time()
+        responses_collected = 0
+        for node, result in self._do_get_monitor_stats(stats_round):
+            responses_collected += 1
+            self.update_statistics(
+                node,
+                result['content'],
+                elapsed_time=result['request_time'],
+                changes=changes,
+            )
+        logger.info(
+            'Late monitor stats responses processed: {}, still missing: {}'.format(
+                responses_collected,
+                len(stats_round.pending),
+            )
+        )
+        return responses_collected
+
+    SLOWEST_HOSTS_REPORT_SIZE = 10
+
+    def _report_monitor_stats_round(self, stats_round, late_responses, elapsed_time):
+        slowest_hosts = sorted(
+            ((node_addr, request_time)
+             for node_addr, request_time in stats_round.request_times.iteritems()
+             if request_time is not None),
+            key=lambda item: item[1],
+            reverse=True,
+        )[:self.SLOWEST_HOSTS_REPORT_SIZE]
+
+        report = {
+            'hosts': len(stats_round.pending) + len(stats_round.request_times),
+            'responses': len(stats_round.request_times),
+            'late_responses': late_responses,
+            'missed_deadline': sorted(stats_round.pending),
+            'slowest_hosts': [
+                {'node': node_addr, 'request_time': request_time}
+                for node_addr, request_time in slowest_hosts
+            ],
+            'time': elapsed_time,
+        }
+        self._cluster_update_stats['monitor_stats'] = report
+
+        logger.info(
+            'Monitor stats round: {responses}/{hosts} hosts answered, {late} late responses '
+            'from the previous round processed, time: {time:.3f}'.format(
+                responses=report['responses'],
+                hosts=report['hosts'],
+                late=report['late_responses'],
+                time=report['time'],
+            )
+        )
+        if report['missed_deadline']:
+            logger.warn(
+                'Monitor stats round: hosts missed the deadline: {}'.format(
+                    ', '.join(report['missed_deadline'])
+                )
+            )
+        if slowest_hosts:
+            logger.info(
+                'Monitor stats round: slowest hosts: {}'.format(
+                    ', '.join(
+                        '{}: {:.3f}'.format(node_addr, request_time)
+                        for node_addr, request_time in slowest_hosts
+                    )
+                )
+            )
+
     def monitor_stats(self, groups=None):
         if groups:
             hosts = set((nb.node.host.addr, nb.node.port, nb.node.family)
@@ -252,13 +407,26 @@ class NodeInfoUpdater(object):
                 logger.debug('Adding node {}'.format(node_addr))
                 storage.nodes.add(host, ha.port, ha.family)
 
+        start_ts = time.time()
+        changes = ClusterChanges()
+
+        late_responses = 0
+        if not groups:
+            late_responses = self._process_late_monitor_stats(changes)
+
+        cycle_timeout = config.get('monitor', {}).get('cycle_timeout', 30)
+        stats_round = self._request_monitor_stats(
+            host_addrs,
+            deadline=start_ts + cycle_timeout if cycle_timeout else None,
+        )
         responses_collected = 0
-        for node, result in self._do_get_monitor_stats(host_addrs):
+        for node, result in self._do_get_monitor_stats(stats_round):
             responses_collected += 1
             self.update_statistics(
                 node,
                 result['content'],
-                elapsed_time=result['request_time']
+                elapsed_time=result['request_time'],
+                changes=changes,
             )
 
         logger.info(
@@ -268,26 +436,140 @@ class NodeInfoUpdater(object):
             )
         )
 
-        # TODO: can we use iterkeys?
-        nbs = (groups and
-               [nb for g in groups for nb in g.node_backends] or
-               storage.node_backends.keys())
-        for nb in nbs:
+        if stats_round.pending and not groups:
+            # hosts that missed the deadline keep their previous statistics
+            # for this round, their responses will be processed in the next one
+            self._late_monitor_stats = stats_round
+        self._report_monitor_stats_round(
+            stats_round,
+            late_responses,
+            elapsed_time=time.time() - start_ts,
+        )
+
+        if groups:
+            nbs = [nb for g in groups for nb in g.node_backends]
+            for nb in nbs:
+                nb.update_statistics_status()
+                nb.update_status()
+
+            for fs in set(nb.fs for nb in nbs):
+                fs.update_status()
+
+            for group in groups:
+                logger.info('Updating status for group {0}'.format(group.group_id))
+                group.update_status()
+        else:
+            self._update_changed_statuses(changes)
+
+            storage.dc_host_view.update()
+            self._update_load(
+                node_backends=changes.node_backends,
+                groups=changes.groups,
+            )
+
+    def _update_changed_statuses(self, changes):
+        """Recalculate statuses of entities affected by the statistics round
+
+        Node backend status depends on statistics presence and staleness,
+        enabled and read-only flags and its fs status. Group own status depends
+        only on its node backends' statuses, so groups are recalculated
+        (along with their groupsets) only when any of these has changed.
+        """
+        start_ts = time.time()
+
+        nbs = changes.node_backends
+        # staleness depends on the current time, so it should be checked
+        # for node backends that did not report anything in this round as well
+        for nb in storage.node_backends.keys():
+            stalled = nb.stalled
             nb.update_statistics_status()
+            if nb.stalled != stalled:
+                nbs.add(nb)
+
+        changed_nbs = set()
+        for nb in nbs:
+            status = nb.status
             nb.update_status()
+            if nb.status != status:
+                changed_nbs.add(nb)
 
-        # TODO: can we use iterkeys?
-        fss = (groups and set(nb.fs for nb in nbs) or storage.fs.keys())
+        fss = set(nb.fs for nb in nbs if nb.fs)
         for fs in fss:
+            status = fs.status
             fs.update_status()
-
-        for group in groups or storage.groups.keys():
+            if fs.status != status:
+                # fs status change has already updated its node backends' statuses
+                changed_nbs.update(fs.node_backends)
+
+        groups = changes.groups | set(nb.group for nb in changed_nbs if nb.group)
+        groupsets = set()
+        for group in groups:
+            if group.couple and group.couple in groupsets:
+                # already updated along with its groupset
+                continue
             logger.info('Updating status for group {0}'.format(group.group_id))
-            group.update_status()
+            try:
+                group.update_status_recursive()
+                if group.couple:
+                    groupsets.add(group.couple)
+            except Exception:
+                logger.exception('Failed to update group {} status'.format(group))
+                continue
 
-        if groups is None:
-            storage.dc_host_view.update()
-            load_manager.update(storage)
+        stats = {
+            'node_backends': {
+                'touched': len(nbs),
+                'skipped': len(storage.node_backends) - len(nbs),
+            },
+            'fs': {
+                'touched': len(fss),
+                'skipped': len(storage.fs) - len(fss),
+            },
+            'groups': {
+                'touched': len(groups),
+                'skipped': len(storage.groups) - len(groups),
+            },
+            'groupsets': {
+                'touched': len(groupsets),
+                'skipped': len(storage.groupsets) - len(groupsets),
+            },
+            'time': time.time() - start_ts,
+        }
+        self._cluster_update_stats['status_update'] = stats
+        logger.info(
+            'Cluster updating: statuses recalculated for {nbs} node backends '
+            '({nbs_skipped} skipped), {fss} fs ({fss_skipped} skipped), {groups} groups '
+            '({groups_skipped} skipped), {groupsets} groupsets ({groupsets_skipped} skipped), '
+            'time: {time:.3f}'.format(
+                nbs=stats['node_backends']['touched'],
+                nbs_skipped=stats['node_backends']['skipped'],
+                fss=stats['fs']['touched'],
+                fss_skipped=stats['fs']['skipped'],
+                groups=stats['groups']['touched'],
+                groups_skipped=stats['groups']['skipped'],
+                groupsets=stats['groupsets']['touched'],
+                groupsets_skipped=stats['groupsets']['skipped'],
+                time=stats['time'],
+            )
+        )
+
+    def _update_load(self, node_backends=None, groups=None):
+        stats = load_manager.update(storage, node_backends=node_backends, groups=groups)
+        self._cluster_update_stats['load_update'] = stats
+        logger.info(
+            'Cluster updating: load model {mode} update, {recalculated} loads recalculated, '
+            '{allocated} allocated, {reused} reused, time: {time:.3f}'.format(
+                mode='incremental' if stats['incremental'] else 'full',
+                recalculated=stats['recalculated'],
+                allocated=stats['allocated'],
+                reused=stats['reused'],
+                time=stats['time'],
+            )
+        )
+
+    @h.concurrent_handler
+    def get_cluster_update_stats(self, request):
+        return self._cluster_update_stats
 
     STAT_COMMIT_RE = re.compile('^eblob\.(\d+)\.disk.stat_commit.errors\.(.*)')
 
@@ -320,7 +602,8 @@ class NodeInfoUpdater(object):
                                     backend_stats,
                                     collect_ts,
                                     processed_fss,
-                                    processed_node_backends):
+                                    processed_node_backends,
+                                    changes=None):
 
         backend_id = b_stat['backend_id']
 
@@ -344,6 +627,9 @@ class NodeInfoUpdater(object):
         else:
             node_backend = storage.node_backends[node_backend_addr]
 
+        if changes is not None:
+            changes.node_backends.add(node_backend)
+
         if b_stat['status']['state'] != 1:
             logger.info('Node backend {0} is not enabled: state {1}'.format(
                 str(node_backend), b_stat['status']['state']))
@@ -396,6 +682,10 @@ class NodeInfoUpdater(object):
                 node_backend, group.group_id,
                 ' (moved from group {0})'.format(node_backend.group.group_id)
                 if node_backend.group else ''))
+            if changes is not None:
+                changes.groups.add(group)
+                if node_backend.group:
+                    changes.groups.add(node_backend.group)
             group.add_node_backend(node_backend)
             update_group_history = True
 
@@ -408,7 +698,7 @@ class NodeInfoUpdater(object):
             infrastructure.update_group_history(group)
 
     @staticmethod
-    def update_statistics(node, stat, elapsed_time=None):
+    def update_statistics(node, stat, elapsed_time=None, changes=None):
 
         logger.debug(
             'Cluster updating: node {0} statistics time: {1:03f}'.format(
@@ -438,7 +728,8 @@ class NodeInfoUpdater(object):
                         backend_stats,
                         collect_ts,
                         fss,
-                        good_node_backends
+                        good_node_backends,
+                        changes=changes,
                     )
                 except Exception:
                     backend_id = b_stat['backend_id']
@@ -461,8 +752,6 @@ class NodeInfoUpdater(object):
 
     def update_symm_groups_async(self, groups=None):
 
-        _queue = set()
-
         def _get_data_groups(group):
             return group.meta['couple']
 
@@ -508,9 +797,9 @@ class NodeInfoUpdater(object):
                 ns.add_couple(c)
             return storage.groupsets[groupset_str]
 
-        def _process_group_metadata(response, group, elapsed_time=None, end_time=None):
-            logger.debug('Cluster updating: group {0} meta key read time: {1}.{2}'.format(
-                group.group_id, elapsed_time.tsec, elapsed_time.tnsec))
+        def _process_group_metadata(response, group, elapsed_time=None):
+            logger.debug('Cluster updating: group {0} meta key read time: {1:.3f}'.format(
+                group.group_id, elapsed_time))
 
             if response.error.code:
                 if response.error.code == errors.ELLIPTICS_NOT_FOUND:
@@ -570,11 +859,6 @@ class NodeInfoUpdater(object):
 
             logger.info('Read symmetric groups from group {}: {}'.format(group.group_id, groups))
 
-            for gid in groups:
-                if gid != group.group_id:
-                    logger.info('Scheduling update for group {}'.format(gid))
-                    _queue.add(gid)
-
             groupset = _create_groupset_if_needed(groups, group.type, ns_id)
 
             if group.type == storage.Group.TYPE_LRC_8_2_2_V1:
@@ -592,19 +876,9 @@ class NodeInfoUpdater(object):
             return
 
         try:
+            start_ts = time.time()
             check_groups = groups or storage.groups.keys()
 
-            results = {}
-            for group in check_groups:
-                session = self.__session.clone()
-                session.set_exceptions_policy(elliptics.exceptions_policy.no_exceptions)
-                session.set_filter(elliptics.filters.all_with_ack)
-                session.add_groups([group.group_id])
-
-                logger.debug('Request to read {0} for group {1}'.format(
-                    keys.SYMMETRIC_GROUPS_KEY.replace('\0', '\\0'), group.group_id))
-                results[group.group_id] = session.read_data(keys.SYMMETRIC_GROUPS_KEY)
-
             jobs = {}
             if self.job_finder:
                 try:
@@ -619,24 +893,67 @@ class NodeInfoUpdater(object):
                     logger.exception('Failed to fetch pending jobs: {0}'.format(e))
                     pass
 
-            while results:
-                # TODO: Think on queue, it does not work well with lrc couples
-                if _queue:
-                    group_id = _queue.pop()
-                    if group_id not in results:
-                        continue
-                    result = results.pop(group_id)
-                else:
-                    group_id, result = results.popitem()
+            max_in_flight = config.get('symm_groups_reads_in_flight', 1000)
+            update_timeout = config.get('symm_groups_update_timeout', 60)
+            deadline = start_ts + update_timeout
+
+            # metakey read results are processed in completion order,
+            # elliptics result handlers pass received entries via this queue
+            # (entries are not stored in async result once handler is connected)
+            completed = Queue.Queue()
+            not_requested = iter(check_groups)
+            in_flight = {}
+
+            read_times = Histogram()
+            process_times = Histogram()
+
+            def _request_metakeys():
+                for group in itertools.islice(not_requested, max(max_in_flight - len(in_flight), 0)):
+                    session = self.__session.clone()
+                    session.set_exceptions_policy(elliptics.exceptions_policy.no_exceptions)
+                    session.set_filter(elliptics.filters.all_with_ack)
+                    session.add_groups([group.group_id])
+
+                    logger.debug('Request to read {0} for group {1}'.format(
+                        keys.SYMMETRIC_GROUPS_KEY.replace('\0', '\\0'), group.group_id))
+                    request_ts = time.time()
+                    result = session.read_data(keys.SYMMETRIC_GROUPS_KEY)
+                    # async result is referenced until its handler is called
+                    in_flight[group.group_id] = (request_ts, result)
+                    result.connect(
+                        lambda results, error, group_id=group.group_id: completed.put(
+                            (group_id, results, error, time.time())
+                        )
+                    )
+
+            processed = 0
+            _request_metakeys()
+            while in_flight:
+                try:
+                    group_id, results, error, end_ts = completed.get(
+                        timeout=max(deadline - time.time(), 0)
+                    )
+                except Queue.Empty:
+                    break
+
+                request_ts, _ = in_flight.pop(group_id)
+                _request_metakeys()
 
                 group = storage.groups[group_id]
 
+                process_start_ts = time.time()
                 try:
-                    h.process_elliptics_async_result(
-                        result,
-                        _process_group_metadata,
+                    elapsed_time = end_ts - request_ts
+                    read_times.add(elapsed_time)
+                    if not results:
+                        if error.code:
+                            raise RuntimeError(error.message)
+                        raise ValueError('empty response')
+                    # errors of the entry are handled by the processor itself
+                    _process_group_metadata(
+                        results[0],
                         group,
-                        raise_on_error=False,
+                        elapsed_time=elapsed_time,
                     )
                 except Exception as e:
                     logger.exception(
@@ -654,17 +971,73 @@ class NodeInfoUpdater(object):
                     except Exception as e:
                         logger.exception('Failed to update group {0} status: {1}'.format(group, e))
                         pass
+                    processed += 1
+                    process_times.add(time.time() - process_start_ts)
+
+            missed_deadline = len(check_groups) - processed
+            if missed_deadline:
+                # groups keep their previous metadata until the next round
+                logger.error(
+                    'Symmetric groups update deadline is exceeded, metakeys of {} groups '
+                    'were not processed'.format(missed_deadline)
+                )
+
+            self._report_metakey_reads(
+                groups=len(check_groups),
+                processed=processed,
+                missed_deadline=missed_deadline,
+                read_times=read_times,
+                process_times=process_times,
+                elapsed_time=time.time() - start_ts,
+            )
 
             if groups is None:
                 self.update_couple_settings()
-                load_manager.update(storage)
+                self._update_load()
                 weight_manager.update(storage)
+                self._cluster_update_stats['weights'] = weight_manager.stats
 
                 infrastructure.schedule_history_update()
 
         except Exception as e:
             logger.exception('Critical error during symmetric group update')
 
+    def _report_metakey_reads(self,
+                              groups,
+                              processed,
+                              missed_deadline,
+                              read_times,
+                              process_times,
+                              elapsed_time):
+        report = {
+            'groups': groups,
+            'processed': processed,
+            'missed_deadline': missed_deadline,
+            'read_time': read_times.dump(),
+            'process_time': process_times.dump(),
+            'time': elapsed_time,
+        }
+        self._cluster_update_stats['metakey_reads'] = report
+
+        logger.info(
+            'Symmetric groups update: {processed}/{groups} groups processed, '
+            'read time p50/p90/p99/max: {read_p50}/{read_p90}/{read_p99}/{read_max}, '
+            'processing time p50/p90/p99/max: {proc_p50}/{proc_p90}/{proc_p99}/{proc_max}, '
+            'time: {time:.3f}'.format(
+                processed=processed,
+                groups=groups,
+                read_p50=report['read_time']['p50'],
+                read_p90=report['read_time']['p90'],
+                read_p99=report['read_time']['p99'],
+                read_max=report['read_time']['max'],
+                proc_p50=report['process_time']['p50'],
+                proc_p90=report['process_time']['p90'],
+                proc_p99=report['process_time']['p99'],
+                proc_max=report['process_time']['max'],
+                time=elapsed_time,
+            )
+        )
+
     def update_couple_settings(self):
         if not self.couple_record_finder:
             # case for side worker that don't need access to couple settings
@@ -764,6 +1137,17 @@ class NodeInfoUpdater(object):
 
         self._namespaces_states.set_result(dict(res))
 
+        memory_usage = self._namespaces_states.memory_usage()
+        self._cluster_update_stats['namespaces_states_cache'] = memory_usage
+        logger.info(
+            'Namespaces states: {namespaces} namespaces cached, memory usage: {total} bytes '
+            '(compressed result: {compressed_result}, per namespace serialized: {key_parts}, '
+            'per namespace compressed: {key_compressed_results})'.format(
+                namespaces=len(res),
+                **memory_usage
+            )
+        )
+
     @h.concurrent_handler
     def force_update_flow_stats(self, request):
         start_ts = time.time()
@@ -1,3 +1,4 @@
+from contextlib import contextmanager
 from copy import copy, deepcopy
 import heapq
 from logging import getLogger
@@ -18,6 +19,7 @@ from infrastructure_cache import cache
 import inventory
 import jobs
 from manual_locks import manual_locker
+from mastermind.utils.time_slicer import TimeSlicer
 from sync import sync_manager
 from sync.error import LockFailedError, LockAlreadyAcquiredError
 from timer import periodic_timer
@@ -50,6 +52,11 @@ class Planner(object):
         self.__max_plan_length = self.params.get('move', {}).get('max_plan_length', 5)
         self.__tq = timed_queue.TimedQueue()
 
+        # duration of the last move candidates planning pass by phase
+        self._move_phases = {}
+        self._move_stats = {}
+        self._recover_dc_stats = {}
+
         self.node_info_updater = niu
 
         self.recover_dc_timer = periodic_timer(
@@ -87,18 +94,21 @@ class Planner(object):
         self.__tq.start()
 
     def _move_candidates(self):
+        start_ts = time.time()
+        self._move_phases = {}
         try:
             logger.info('Starting move candidates planner')
 
             max_move_jobs = config.get('jobs', {}).get('move_job', {}).get('max_executing_jobs', 3)
 
             # prechecking for new or pending tasks
-            count = self.job_processor.job_finder.jobs_count(
-                types=jobs.JobTypes.TYPE_MOVE_JOB,
-                statuses=[jobs.Job.STATUS_NOT_APPROVED,
-                          jobs.Job.STATUS_NEW,
-                          jobs.Job.STATUS_EXECUTING,
-                          jobs.Job.STATUS_PENDING])
+            with self._move_phase('jobs_count'):
+                count = self.job_processor.job_finder.jobs_count(
+                    types=jobs.JobTypes.TYPE_MOVE_JOB,
+                    statuses=[jobs.Job.STATUS_NOT_APPROVED,
+                              jobs.Job.STATUS_NEW,
+                              jobs.Job.STATUS_EXECUTING,
+                              jobs.Job.STATUS_PENDING])
 
             if count >= max_move_jobs:
                 logger.info('Found {0} unfinished move jobs (>= {1})'.format(count, max_move_jobs))
@@ -112,12 +122,45 @@ class Planner(object):
         except Exception as e:
             logger.error('{0}: {1}'.format(e, traceback.format_exc()))
         finally:
+            self._report_move_pass(time.time() - start_ts)
             logger.info('Move candidates planner finished')
             self.__tq.add_task_in(
                 self.MOVE_CANDIDATES,
                 self.params.get('move', {}).get('generate_plan_period', 1800),
                 self._move_candidates)
 
+    @contextmanager
+    def _move_phase(self, phase):
+        start_ts = time.time()
+        try:
+            yield
+        finally:
+            self._account_move_phase(phase, time.time() - start_ts)
+
+    def _account_move_phase(self, phase, duration):
+        self._move_phases[phase] = self._move_phases.get(phase, 0.0) + duration
+
+    def _report_move_pass(self, duration):
+        self._move_stats = {
+            'ts': time.time(),
+            'time': duration,
+            'phases': self._move_phases,
+        }
+        logger.info('Move candidates planning pass time: {time:.3f}, phases: {phases}'.format(
+            time=duration,
+            phases=', '.join(
+                '{}: {:.3f}'.format(phase, phase_time)
+                for phase, phase_time in sorted(self._move_phases.iteritems())
+            ),
+        ))
+
+    @h.concurrent_handler
+    def get_planner_stats(self, request):
+        return {
+            'move_candidates': self._move_stats,
+            'recover_dc': self._recover_dc_stats,
+        }
+
     def __busy_hosts(self, job_type):
         not_finished_jobs = self.job_processor.job_finder.jobs(types=job_type, statuses=(
             jobs.Job.STATUS_NOT_APPROVED,
@@ -246,18 +289,24 @@ class Planner(object):
 
     def _do_move_candidates(self, max_plan_length, step=0, busy_hosts=None, busy_group_ids=None):
         if step == 0:
-            self.candidates = [[StorageState.current()]]
+            with self._move_phase('storage_state'):
+                self.candidates = [[StorageState.current()]]
         if busy_hosts is None:
-            busy_hosts = self.__busy_hosts([jobs.JobTypes.TYPE_MOVE_JOB,
-                                            jobs.JobTypes.TYPE_RESTORE_GROUP_JOB])
+            with self._move_phase('busy_hosts'):
+                busy_hosts = self.__busy_hosts([jobs.JobTypes.TYPE_MOVE_JOB,
+                                                jobs.JobTypes.TYPE_RESTORE_GROUP_JOB])
             logger.debug('Busy hosts from executing jobs: {0}'.format(list(busy_hosts)))
         if busy_group_ids is None:
-            busy_group_ids = set(self.job_processor.job_finder.get_uncoupled_groups_in_service())
+            with self._move_phase('busy_group_ids'):
+                busy_group_ids = set(
+                    self.job_processor.job_finder.get_uncoupled_groups_in_service()
+                )
             logger.debug('Busy uncoupled groups from executing jobs: {0}'.format(
                 list(busy_group_ids)))
 
         if step >= min(self.__max_plan_length, max_plan_length):
-            self.__apply_plan()
+            with self._move_phase('apply_plan'):
+                self.__apply_plan()
             return
 
         logger.info('Candidates: {0}, step {1}'.format(len(self.candidates[-1]), step))
@@ -266,7 +315,8 @@ class Planner(object):
             self.candidates[-1][0], busy_hosts, busy_group_ids)
 
         if not tmp_candidates:
-            self.__apply_plan()
+            with self._move_phase('apply_plan'):
+                self.__apply_plan()
             return
 
         max_error_candidate = max(tmp_candidates, key=lambda c: c.delta.weight)
@@ -304,7 +354,17 @@ class Planner(object):
 
         base_ms = candidate.state_ms_error
 
-        uncoupled_groups = infrastructure.get_good_uncoupled_groups(max_node_backends=1)
+        with self._move_phase('uncoupled_groups'):
+            uncoupled_groups = infrastructure.get_good_uncoupled_groups(max_node_backends=1)
+
+        # candidates search is cpu-bound, it is paused regularly
+        # to let other threads run
+        move_params = self.params.get('move', {})
+        slicer = TimeSlicer(
+            time_slice=move_params.get('time_slice', 0.1),
+            pause=move_params.get('time_slice_pause', 0.01),
+        )
+        start_ts = time.time()
 
         for c in candidate.iteritems():
             src_dc, src_dc_state = c
@@ -390,8 +450,10 @@ class Planner(object):
                         logger.debug('New candidate aftere moving:')
                         new_candidate._debug()
 
-                    time.sleep(0.1)
-            time.sleep(3)
+                    slicer.tick()
+
+        self._account_move_phase('candidates_search', time.time() - start_ts - slicer.paused_time)
+        self._account_move_phase('paused', slicer.paused_time)
 
         return _candidates
 
@@ -561,9 +623,20 @@ class Planner(object):
             offset += res['nRemoved']
 
     def _recover_top_weight_couples(self, count, active_jobs):
-        keys_diffs_sorted = []
+        """Select @count couples with the highest recovery weight
+
+        Couple's weight depends on its keys diff and the time passed since
+        its last recovery. Recover data records are scanned in order of their
+        recovery timestamps, so the time component of the weight is decreasing
+        during the scan. The scan is stopped as soon as no unscanned couple
+        can outweigh the selected ones even with the maximum keys diff
+        among unscanned couples.
+        """
+        if count <= 0:
+            return []
+
+        start_ts = time.time()
         keys_diffs = {}
-        ts_diffs = {}
 
         busy_group_ids = self._busy_group_ids(active_jobs)
 
@@ -572,18 +645,20 @@ class Planner(object):
                 continue
             if not _recovery_applicable_couple(couple):
                 continue
-            c_diff = couple.keys_diff
-            keys_diffs_sorted.append((str(couple), c_diff))
-            keys_diffs[str(couple)] = c_diff
-        keys_diffs_sorted.sort(key=lambda x: x[1])
+            keys_diffs[str(couple)] = couple.keys_diff
 
-        cursor = self.collection.find().sort('recover_ts', pymongo.ASCENDING)
-        if cursor.count() < len(storage.replicas_groupsets):
+        records_count = self.collection.find().count()
+        if records_count < len(storage.replicas_groupsets):
             logger.info('Sync recover data is required: {0} records/{1} couples'.format(
-                cursor.count(), len(storage.replicas_groupsets)))
+                records_count, len(storage.replicas_groupsets)))
             self.sync_recover_data()
-            cursor = self.collection.find().sort('recover_ts',
-                                                 pymongo.ASCENDING)
+
+        # couples that are not applicable for recovery are filtered out by the query
+        cursor = self.collection.find(
+            spec={'couple': {'$in': keys_diffs.keys()}},
+            fields=['couple', 'recover_ts'],
+            sort=[('recover_ts', pymongo.ASCENDING)],
+        ).batch_size(self.RECOVERY_OP_CHUNK)
 
         ts = int(time.time())
 
@@ -594,62 +669,61 @@ class Planner(object):
         def weight(keys_diff, ts_diff):
             return keys_diff * keys_cf + ts_diff * ts_cf
 
-        weights = {}
-        candidates = []
-        for i in xrange(cursor.count() / self.RECOVERY_OP_CHUNK + 1):
-            couples_data = cursor[i * self.RECOVERY_OP_CHUNK:
-                                  (i + 1) * self.RECOVERY_OP_CHUNK]
-            max_recover_ts_diff = None
-            for couple_data in couples_data:
-                c = couple_data['couple']
-                ts_diff = ts - couple_data['recover_ts']
-                ts_diffs[c] = ts_diff
-                if c not in keys_diffs:
-                    # couple was not applicable for recovery, skip
-                    continue
-                weights[c] = weight(keys_diffs[c], ts_diffs[c])
-                max_recover_ts_diff = ts_diff
-
-            cursor.rewind()
-
-            top_candidates_len = min(count, len(weights))
-
-            if not top_candidates_len:
-                continue
+        # unscanned couple with the maximum keys diff is looked up
+        # in this list, scanned couples are skipped
+        keys_diffs_sorted = sorted(
+            ((keys_diff, c) for c, keys_diff in keys_diffs.iteritems()),
+            reverse=True,
+        )
+        max_keys_diff_idx = 0
+        scanned = set()
 
-            # TODO: Optimize this
-            candidates = sorted(weights.iteritems(), key=lambda x: x[1])
-            min_weight_candidate = candidates[-top_candidates_len]
-            min_keys_diff = min(
-                keys_diffs[candidate[0]]
-                for candidate in candidates[-top_candidates_len:])
-
-            missed_candidate = None
-            idx = len(keys_diffs_sorted) - 1
-            while idx >= 0 and keys_diffs_sorted[idx] >= min_keys_diff:
-                c, keys_diff = keys_diffs_sorted[idx]
-                idx -= 1
-                if c in ts_diffs:
-                    continue
-                if weight(keys_diff, max_recover_ts_diff) > min_weight_candidate[1]:
-                    # found possible candidate
-                    missed_candidate = c
+        # min-heap of (weight, couple id) of the selected couples
+        candidates = []
+        for couple_data in cursor:
+            c = couple_data['couple']
+            ts_diff = ts - couple_data['recover_ts']
+
+            if len(candidates) >= count:
+                while (max_keys_diff_idx < len(keys_diffs_sorted) and
+                        keys_diffs_sorted[max_keys_diff_idx][1] in scanned):
+                    max_keys_diff_idx += 1
+                if max_keys_diff_idx == len(keys_diffs_sorted):
+                    break
+                max_keys_diff = keys_diffs_sorted[max_keys_diff_idx][0]
+                if weight(max_keys_diff, ts_diff) <= candidates[0][0]:
+                    # none of the remaining couples can outweigh selected ones
                     break
 
-            logger.debug(
-                'Current round: {0}, current min weight candidate '
-                '{1}, weight: {2}, possible missed candidate is couple '
-                '{3}, keys diff: {4} (max recover ts diff = {5})'.format(
-                    i, min_weight_candidate[0], min_weight_candidate[1],
-                    missed_candidate, keys_diffs.get(missed_candidate),
-                    max_recover_ts_diff))
-
-            if missed_candidate is None:
-                break
-
-        logger.info('Top candidates: {0}'.format(candidates[-count:]))
+            scanned.add(c)
+            if c not in keys_diffs:
+                continue
+            candidate = (weight(keys_diffs[c], ts_diff), c)
+            if len(candidates) < count:
+                heapq.heappush(candidates, candidate)
+            elif candidate > candidates[0]:
+                heapq.heapreplace(candidates, candidate)
+
+        candidates.sort()
+
+        self._recover_dc_stats = {
+            'ts': time.time(),
+            'applicable_couples': len(keys_diffs),
+            'scanned': len(scanned),
+            'selected': len(candidates),
+            'time': time.time() - start_ts,
+        }
+        logger.info(
+            'Top candidates: {candidates}, recover data records scanned: {scanned}, '
+            'applicable couples: {applicable}, time: {time:.3f}'.format(
+                candidates=[(c, w) for w, c in candidates],
+                scanned=len(scanned),
+                applicable=len(keys_diffs),
+                time=self._recover_dc_stats['time'],
+            )
+        )
 
-        return [candidate[0] for candidate in candidates[-count:]]
+        return [c for _, c in candidates]
 
     def update_recover_ts(self, couple_id, ts):
         ts = int(ts)
@@ -1412,7 +1486,7 @@ class DcState(object):
         self.storage_state = storage_state
         self.couples = set()
         self.uncoupled_keys = []
-        self.uncoupled_groups = SortedCollection(key=lambda x: storage_state.stats(x).total_space)
+        self.uncoupled_groups = SortedCollection(key=storage_state.group_total_space)
 
     def add_group(self, group):
         self.groups.append(group)
@@ -1428,9 +1502,10 @@ class DcState(object):
         obj.groups = copy(self.groups)
         obj.total_space, obj.uncoupled_space = self.total_space, self.uncoupled_space
         obj.couples = copy(self.couples)
-        obj.uncoupled_groups = SortedCollection(
-            iterable=self.uncoupled_groups._items,
-            key=lambda x: storage_state.stats(x).total_space)
+        # groups stats are shared between storage states,
+        # so items are already sorted by the same keys
+        obj.uncoupled_groups._keys = copy(self.uncoupled_groups._keys)
+        obj.uncoupled_groups._items = copy(self.uncoupled_groups._items)
         return obj
 
     def apply_stat(self, stat):
@@ -1442,13 +1517,22 @@ class DcState(object):
 
 
 class StorageState(object):
-    def __init__(self):
+    """State of groups distribution among dcs used for move candidates search
+
+    Storage states are copied on write: a copy shares dc states and groups
+    stats with its origin, and a dc state is copied only when it is modified
+    by a candidate move. Groups stats are never modified once the state
+    is built.
+    """
+    def __init__(self, dcs=None):
         self.delta = Delta()
+        self._stats = {}
         self.state = {
             dc: DcState(self)
-            for dc in self.__dcs()
+            for dc in (self.__dcs() if dcs is None else dcs)
         }
-        self._stats = {}
+        # dcs which states are not shared with other storage states
+        self._owned_dcs = set(self.state)
         self.moved_groups = []
 
     @classmethod
@@ -1494,17 +1578,24 @@ class StorageState(object):
         return obj
 
     def copy(self):
-        obj = StorageState()
+        obj = StorageState(dcs=())
 
-        obj._stats = copy(self._stats)
+        obj._stats = self._stats
+        obj.state = copy(self.state)
 
-        for dc, dc_state in self.state.iteritems():
-            obj.state[dc] = dc_state.copy(obj)
+        # dc states are shared now, both states should copy them before modifying
+        self._owned_dcs = set()
 
         obj.delta.data_move_size = self.delta.data_move_size
 
         return obj
 
+    def _dc_state_for_update(self, dc):
+        if dc not in self._owned_dcs:
+            self.state[dc] = self.state[dc].copy(self)
+            self._owned_dcs.add(dc)
+        return self.state[dc]
+
     @property
     def mean_unc_percentage(self):
         unc_space = sum(dc_state.uncoupled_space for dc_state in self.state.itervalues())
@@ -1521,6 +1612,9 @@ class StorageState(object):
     def stats(self, group):
         return self._stats[group.group_id]
 
+    def group_total_space(self, group):
+        return self._stats[group.group_id].total_space
+
     @property
     def state_ms_error(self):
 
@@ -1568,9 +1662,12 @@ class StorageState(object):
 
         uncoupled_groups = [dst_group] + merged_groups
 
+        src_dc_state = self._dc_state_for_update(src_dc)
+        dst_dc_state = self._dc_state_for_update(dst_dc)
+
         # logger.info('{0}'.format(self.state))
-        self.state[src_dc].groups.remove(src_group)
-        self.state[dst_dc].groups.append(src_group)
+        src_dc_state.groups.remove(src_group)
+        dst_dc_state.groups.append(src_group)
 
         # do this only in case if no other group from this couple is located in src_dc
         for group in src_group.couple:
@@ -1582,14 +1679,14 @@ class StorageState(object):
             if group != src_group and dc == src_dc:
                 break
         else:
-            self.state[src_dc].couples.remove(src_group.couple)
+            src_dc_state.couples.remove(src_group.couple)
 
-        self.state[dst_dc].couples.add(src_group.couple)
+        dst_dc_state.couples.add(src_group.couple)
 
-        self.state[src_dc].uncoupled_space += self.stats(src_group).total_space
+        src_dc_state.uncoupled_space += self.stats(src_group).total_space
         for group in uncoupled_groups:
-            self.state[dst_dc].uncoupled_space -= self.stats(group).total_space
-            self.state[dst_dc].uncoupled_groups.remove(group)
+            dst_dc_state.uncoupled_space -= self.stats(group).total_space
+            dst_dc_state.uncoupled_groups.remove(group)
             # For now src_group is not swapped with dst_group but just replaces it
             # self.state[src_dc].uncoupled_groups.insert(dst_group)
 
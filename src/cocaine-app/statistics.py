@@ -52,17 +52,32 @@ class Statistics(object):
 
     @staticmethod
     def account_effective_memory(data, couple):
-        if couple.status not in storage.GOOD_STATUSES:
+        effective_space = Statistics.couple_effective_space(couple)
+        if effective_space is None:
             return
+        Statistics._account_effective_space(data, effective_space)
+
+    @staticmethod
+    def couple_effective_space(couple):
+        """Get couple's effective space and effective free space
+
+        Returns None if couple's effective space should not be accounted.
+        """
+        if couple.status not in storage.GOOD_STATUSES:
+            return None
         try:
             stat = couple.get_stat()
         except ValueError:
-            return
+            return None
         if not stat:
-            return
+            return None
 
-        data['effective_space'] += couple.effective_space
-        data['effective_free_space'] += couple.effective_free_space
+        return couple.effective_space, couple.effective_free_space
+
+    @staticmethod
+    def _account_effective_space(data, effective_space):
+        data['effective_space'] += effective_space[0]
+        data['effective_free_space'] += effective_space[1]
 
     def per_ns_statistics(self):
         ns_stats = {}
@@ -83,22 +98,39 @@ class Statistics(object):
 
     @staticmethod
     def account_keys(data, couple):
-        stats = []
+        keys = Statistics.couple_keys(couple)
+        if keys is None:
+            return
+        Statistics._account_keys(data, keys)
+
+    @staticmethod
+    def couple_keys(couple):
+        """Get total and removed keys count of a couple
+
+        Keys are counted by the group with the largest number of keys,
+        returns None if there are no statistics for any group.
+        """
+        keys = None
         for group in couple.groups:
-            try:
-                stats.append(
-                    reduce(lambda res, x: res + x,
-                           [nb.stat for nb in group.node_backends if nb.stat]))
-            except TypeError:
+            files, files_removed = 0, 0
+            has_stat = False
+            for nb in group.node_backends:
+                if not nb.stat:
+                    continue
+                has_stat = True
+                files += nb.stat.files
+                files_removed += nb.stat.files_removed
+            if not has_stat:
                 continue
-        if not stats:
-            return
-        files_stat = max(
-            stats,
-            key=lambda stat: (stat.files + stat.files_removed,
-                              stat.files_removed))
-        data['total_keys'] += files_stat.files + files_stat.files_removed
-        data['removed_keys'] += files_stat.files_removed
+            group_keys = (files + files_removed, files_removed)
+            if keys is None or group_keys > keys:
+                keys = group_keys
+        return keys
+
+    @staticmethod
+    def _account_keys(data, keys):
+        data['total_keys'] += keys[0]
+        data['removed_keys'] += keys[1]
 
     def per_entity_stat(self):
         def default():
@@ -129,7 +161,25 @@ class Statistics(object):
         ns_couple_map = defaultdict(set)
         ns_dc_couple_map = defaultdict(lambda: defaultdict(set))
 
-        for group in sorted(storage.groups, key=lambda g: not bool(g.couple)):
+        # keys and effective space depend only on a couple, so they are
+        # calculated once per couple and then accounted in every dc and
+        # namespace the couple belongs to, which makes statistics calculation
+        # a single pass over node backends
+        couples_keys = {}
+        couples_effective_space = {}
+
+        def account_couple(data, group, couple):
+            self.account_couples(data, group)
+            if couple not in couples_keys:
+                effective_space = self.couple_effective_space(couple)
+                couples_keys[couple] = self.couple_keys(couple)
+                couples_effective_space[couple] = effective_space
+            if couples_keys[couple] is not None:
+                self._account_keys(data, couples_keys[couple])
+            if couples_effective_space[couple] is not None:
+                self._account_effective_space(data, couples_effective_space[couple])
+
+        for group in storage.groups:
 
             try:
 
@@ -147,20 +197,16 @@ class Statistics(object):
                         continue
 
                     if couple not in dc_couple_map[dc]:
-                        self.account_couples(by_dc[dc], group)
                         if ns:
-                            self.account_keys(by_dc[dc], couple)
-                            self.account_effective_memory(by_dc[dc], couple)
+                            account_couple(by_dc[dc], group, couple)
+                        else:
+                            self.account_couples(by_dc[dc], group)
                         dc_couple_map[dc].add(couple)
                     if ns and couple not in ns_couple_map[ns]:
-                        self.account_couples(by_ns[ns], group)
-                        self.account_effective_memory(by_ns[ns], couple)
-                        self.account_keys(by_ns[ns], couple)
+                        account_couple(by_ns[ns], group, couple)
                         ns_couple_map[ns].add(couple)
                     if ns and couple not in ns_dc_couple_map[ns][dc]:
-                        self.account_couples(by_ns_dc[ns][dc], group)
-                        self.account_effective_memory(by_ns_dc[ns][dc], couple)
-                        self.account_keys(by_ns_dc[ns][dc], couple)
+                        account_couple(by_ns_dc[ns][dc], group, couple)
                         ns_dc_couple_map[ns][dc].add(couple)
 
                     if not node_backend.stat:
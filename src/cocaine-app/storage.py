@@ -375,6 +375,9 @@ class MultiRepository(object):
     def iteritems(self):
         return itertools.chain(*(r.iteritems() for r in self._repositories.itervalues()))
 
+    def __len__(self):
+        return sum(len(r) for r in self._repositories.itervalues())
+
 
 GROUPSET_REPLICAS = 'replicas'
 GROUPSET_LRC = 'lrc'
@@ -545,6 +548,19 @@ class NodeStat(object):
 
 
 class CommandsStat(object):
+
+    # storage keeps several commands stat objects per node backend,
+    # fixed slots make them several times smaller than dict-backed ones
+    __slots__ = (
+        'ts',
+        'ell_disk_read_time_cnt', 'ell_disk_write_time_cnt',
+        'ell_disk_read_size', 'ell_disk_write_size',
+        'ell_net_read_size', 'ell_net_write_size',
+        'ell_disk_read_time', 'ell_disk_write_time',
+        'ell_disk_read_rate', 'ell_disk_write_rate',
+        'ell_net_read_rate', 'ell_net_write_rate',
+    )
+
     def __init__(self):
         self.ts = None
 
@@ -699,6 +715,32 @@ class CommandsStat(object):
 
 
 class NodeBackendStat(object):
+
+    __slots__ = (
+        'node_stat',
+        'ts',
+        'free_space', 'total_space', 'used_space',
+        'vfs_free_space', 'vfs_total_space', 'vfs_used_space',
+        'commands_stat',
+        'last_read', 'last_write',
+        'read_rps', 'write_rps',
+        'max_read_rps', 'max_write_rps',
+        'fragmentation',
+        'files',
+        'files_removed', 'files_removed_size',
+        'fsid',
+        'defrag_state',
+        'want_defrag',
+        'blob_size_limit',
+        'max_blob_base_size',
+        'blob_size',
+        'start_stat_commit_err_count',
+        'cur_stat_commit_err_count',
+        'io_blocking_size',
+        'io_nonblocking_size',
+        'backend_start_ts',
+    )
+
     def __init__(self, node_stat):
         # TODO: not required anymore, remove (?)
         self.node_stat = node_stat
@@ -2708,3 +2750,18 @@ groupsets = Groupsets(
 
 # TODO: backward compatibility, remove
 couples = groupsets
+
+# version of storage entities bumped by handlers and tasks changing
+# entities outside of cluster update cycles
+_changes = itertools.count(1)
+changes_version = 0
+
+
+def entities_changed():
+    """Mark storage entities as changed by a handler or a task
+
+    Listings built from storage before the change are rebuilt
+    on the next request.
+    """
+    global changes_version
+    changes_version = next(_changes)
@@ -1,6 +1,7 @@
 from contextlib import contextmanager
 import logging
 from threading import Lock
+import time
 
 from sync.error import LockAlreadyAcquiredError
 
@@ -13,6 +14,7 @@ class SyncManager(object):
     def __init__(self, *args, **kwargs):
         self.locks = {}
         self.__locks_lock = Lock()
+        self.__watches = []
 
     @contextmanager
     def lock(self, lockid, blocking=True, timeout=None):
@@ -41,9 +43,11 @@ class SyncManager(object):
                                                holders_ids=[''])
             for lockid in locks:
                 self.locks[lockid].acquire()
+        self.__notify_watches(locks)
         return True
 
     def persistent_locks_release(self, locks, check=''):
+        start_ts = time.time()
         with self.__locks_lock:
             for lockid in locks:
                 lock = self.locks.get(lockid)
@@ -51,7 +55,29 @@ class SyncManager(object):
                     lock.release()
                 else:
                     logger.warn('Persistent lock {0} is already removed'.format(lockid))
+        self.__notify_watches(locks)
+        logger.info('Released {count} persistent locks, time: {time:.3f}'.format(
+            count=len(locks),
+            time=time.time() - start_ts,
+        ))
 
     def get_children_locks(self, lock_prefix):
         return [lock_id for lock_id in self.locks
                 if lock_id.startswith(lock_prefix)]
+
+    def watch_children_locks(self, lock_prefix, callback):
+        self.__watches.append((lock_prefix, callback))
+        callback(self.__locked_children(lock_prefix))
+
+    def is_connected(self):
+        return True
+
+    def __locked_children(self, lock_prefix):
+        with self.__locks_lock:
+            return [lock_id for lock_id, lock in self.locks.iteritems()
+                    if lock_id.startswith(lock_prefix) and lock.locked()]
+
+    def __notify_watches(self, locks):
+        for lock_prefix, callback in self.__watches:
+            if any(lockid.startswith(lock_prefix) for lockid in locks):
+                callback(self.__locked_children(lock_prefix))
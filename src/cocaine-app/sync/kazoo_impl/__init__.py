@@ -1,9 +1,10 @@
 from contextlib import contextmanager
 import logging
 import os.path
+import time
 import traceback
 
-from kazoo.client import KazooClient
+from kazoo.client import KazooClient, KazooState
 from kazoo.exceptions import (
     LockTimeout,
     NodeExistsError,
@@ -11,6 +12,7 @@ from kazoo.exceptions import (
     KazooException,
     ZookeeperError,
 )
+from kazoo.recipe.watchers import ChildrenWatch
 from kazoo.retry import KazooRetry, RetryFailedError
 from mastermind.utils.queue import LockingQueue
 from mastermind_core import helpers
@@ -33,6 +35,8 @@ class ZkSyncManager(object):
 
     RETRIES = 2
     LOCK_TIMEOUT = 3
+    # maximum number of lock nodes removed in a single transaction
+    RELEASE_BATCH_SIZE = 500
 
     def __init__(self, host='127.0.0.1:2181', lock_path_prefix='/mastermind/locks/'):
         self.client = KazooClient(host, timeout=3)
@@ -143,6 +147,28 @@ class ZkSyncManager(object):
         result = self.client.get_children(full_path)
         return ['{0}{1}'.format(lock_prefix, lock) for lock in result]
 
+    def watch_children_locks(self, lock_prefix, callback):
+        """Watch for children locks of @lock_prefix
+
+        @callback is called with the list of children locks right away
+        and on every change of children locks set.
+        """
+        full_path = self.lock_path_prefix + lock_prefix
+        self.client.ensure_path(os.path.normpath(full_path))
+
+        def on_children(children):
+            try:
+                callback(['{0}{1}'.format(lock_prefix, lock) for lock in children])
+            except Exception:
+                logger.exception('Children locks watch callback failed for {}'.format(
+                    lock_prefix))
+
+        ChildrenWatch(self.client, full_path, func=on_children)
+
+    def is_connected(self):
+        """Check if watches are guaranteed to be up-to-date"""
+        return self.client.state == KazooState.CONNECTED
+
     def persistent_locks_release(self, locks, check=''):
         try:
             retry = self._retry.copy()
@@ -158,6 +184,104 @@ class ZkSyncManager(object):
         return result
 
     def __inner_persistent_locks_release(self, locks, check):
+        start_ts = time.time()
+        # inconsistent locks are skipped, the rest of the locks are released
+        versions, inconsistent = self._persistent_locks_versions(locks, check)
+
+        batches = fallbacks = 0
+        lock_ids = list(versions)
+        for i in xrange(0, len(lock_ids), self.RELEASE_BATCH_SIZE):
+            batch = lock_ids[i:i + self.RELEASE_BATCH_SIZE]
+            batches += 1
+            if not self._persistent_locks_batch_release(batch, versions):
+                fallbacks += 1
+                inconsistent.extend(self._persistent_locks_single_release(batch, check))
+
+        logger.info(
+            'Released {count} persistent locks in {batches} batches '
+            '({fallbacks} fallen back to single lock release, {inconsistent} inconsistent '
+            'locks skipped), time: {time:.3f}'.format(
+                count=len(locks) - len(inconsistent),
+                batches=batches,
+                fallbacks=fallbacks,
+                inconsistent=len(inconsistent),
+                time=time.time() - start_ts,
+            )
+        )
+
+        if inconsistent:
+            lock_ids, holders_ids = zip(*inconsistent)
+            raise InconsistentLockError(
+                lock_id=lock_ids[0],
+                holder_id=holders_ids[0],
+                lock_ids=list(lock_ids),
+                holders_ids=list(holders_ids),
+            )
+        return True
+
+    def _persistent_locks_versions(self, locks, check):
+        """Get versions of existing lock nodes
+
+        Lock nodes data is fetched with pipelined requests and is checked against
+        @check if it is set. Lock versions are used on transactional release to
+        make sure that lock nodes were not modified after the check.
+        Returns dict of lock id -> lock node version (-1 if data is not checked)
+        and a list of (lock id, holder id) of locks with inconsistent data,
+        which are not included in the dict.
+        """
+        if not check:
+            return dict((lockid, -1) for lockid in locks), []
+
+        async_results = [
+            (lockid, self.client.get_async(self.lock_path_prefix + lockid))
+            for lockid in locks
+        ]
+        versions = {}
+        inconsistent = []
+        for lockid, async_result in async_results:
+            try:
+                data, stat = async_result.get()
+            except NoNodeError:
+                logger.warn('Persistent lock {0} is already removed'.format(lockid))
+                continue
+            if data != check:
+                logger.error(
+                    'Lock {lock_id} has inconsistent data: {current_data}, '
+                    'expected {expected_data}'.format(
+                        lock_id=lockid,
+                        current_data=data,
+                        expected_data=check,
+                    )
+                )
+                inconsistent.append((lockid, data))
+                continue
+            versions[lockid] = stat.version
+        return versions, inconsistent
+
+    def _persistent_locks_batch_release(self, locks, versions):
+        tr = self.client.transaction()
+        for lockid in locks:
+            tr.delete(self.lock_path_prefix + lockid, version=versions[lockid])
+        result = tr.commit()
+
+        errors = [res for res in result if isinstance(res, Exception)]
+        if errors:
+            # transaction is rolled back as a whole if any of the lock nodes
+            # is missing or was modified concurrently
+            logger.warn(
+                'Failed to release persistent locks {0} in a transaction, '
+                'result: {1}'.format(locks, result)
+            )
+            return False
+        return True
+
+    def _persistent_locks_single_release(self, locks, check):
+        """Release locks one by one
+
+        Returns a list of (lock id, holder id) of locks with inconsistent data,
+        such locks are not released.
+        """
+        inconsistent = []
         for lockid in locks:
             try:
                 if check:
@@ -171,12 +295,13 @@ class ZkSyncManager(object):
                                 expected_data=check,
                             )
                         )
-                        raise InconsistentLockError(lock_id=lockid, holder_id=data[0])
+                        inconsistent.append((lockid, data[0]))
+                        continue
                 self.client.delete(self.lock_path_prefix + lockid)
             except NoNodeError:
                 logger.warn('Persistent lock {0} is already removed'.format(lockid))
                 pass
-        return True
+        return inconsistent
 
 
 class ZkCacheTaskManager(object):
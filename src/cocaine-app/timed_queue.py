@@ -1,17 +1,26 @@
 # -*- coding: utf-8 -*-
+from collections import deque
+import errno
+import fcntl
 import threading
 import heapq
+import itertools
+import os
+import select
 import time
 
+from mastermind.utils.histogram import Histogram
+
 
 class Task(object):
 
-    def __init__(self, task_id, function, args, kwargs):
+    def __init__(self, task_id, function, args, kwargs, at=None):
         self.__id = task_id
         self.__function = function
         self.__args = args
         self.__kwargs = kwargs
         self.__done = False
+        self.at = at
 
     def execute(self):
         try:
@@ -25,16 +34,151 @@ class Task(object):
     def id(self):
         return self.__id
 
+    def name(self):
+        """Task name used for metrics aggregation
+
+        Task ids are often unique (e.g., contain job id), so tasks are
+        aggregated by the name of the function being executed.
+        """
+        function = self.__function
+        owner = getattr(function, '__self__', None)
+        name = getattr(function, '__name__', None) or type(function).__name__
+        if owner is not None:
+            return '{}.{}'.format(type(owner).__name__, name)
+        return name
+
+
+class TaskStats(object):
+    def __init__(self):
+        self.count = 0
+        self.hurried = 0
+        self.failed = 0
+        self.lateness = Histogram()
+        self.run_time = Histogram()
+
+    def dump(self):
+        return {
+            'count': self.count,
+            'hurried': self.hurried,
+            'failed': self.failed,
+            'lateness': self.lateness.dump(),
+            'run_time': self.run_time.dump(),
+        }
+
+
+class Scheduler(object):
+    """Shared timer of all timed queues
+
+    Scheduler thread sleeps until the nearest deadline of all scheduled tasks
+    (or until a task with an earlier deadline is scheduled) and hands due
+    tasks over to their queues. Queue threads block until they receive
+    a task, so idle queues do not wake up at all.
+
+    Scheduler thread blocks in select on a self-pipe instead of
+    threading.Condition.wait with timeout, which polls every 50ms
+    in python 2.7; a byte is written to the pipe to wake it up early.
+
+    Scheduler also accumulates lateness and run time metrics of executed
+    tasks aggregated by task name.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__wake_r, self.__wake_w = os.pipe()
+        for fd in (self.__wake_r, self.__wake_w):
+            fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+        self.__heap = []
+        self.__seq = itertools.count()
+        self.__thread = None
+        self.__stats_lock = threading.Lock()
+        self.__stats = {}
+
+    def schedule(self, at, queue, task):
+        with self.__lock:
+            entry = (at, next(self.__seq), queue, task)
+            heapq.heappush(self.__heap, entry)
+            if self.__thread is None:
+                self.__thread = threading.Thread(target=Scheduler.loop, args=(self,))
+                self.__thread.setDaemon(True)
+                self.__thread.start()
+            if self.__heap[0] is entry:
+                # deadline is earlier than the one scheduler thread waits for
+                self._wake_up()
+
+    def _wake_up(self):
+        try:
+            os.write(self.__wake_w, '\0')
+        except OSError as e:
+            # pipe is full, scheduler thread is going to wake up anyway
+            if e.errno != errno.EAGAIN:
+                raise
+
+    def _drain_wake_ups(self):
+        try:
+            while os.read(self.__wake_r, 4096):
+                pass
+        except OSError as e:
+            if e.errno != errno.EAGAIN:
+                raise
+
+    def loop(self):
+        while True:
+            with self.__lock:
+                timeout = None
+                if self.__heap:
+                    timeout = max(self.__heap[0][0] - time.time(), 0)
+                if timeout == 0:
+                    _, _, queue, task = heapq.heappop(self.__heap)
+                else:
+                    task = None
+            if task is not None:
+                queue._dispatch(task)
+                continue
+            # tasks scheduled after the lock is released write to the pipe,
+            # so select returns right away in this case
+            try:
+                select.select([self.__wake_r], [], [], timeout)
+            except select.error as e:
+                if e.args[0] != errno.EINTR:
+                    raise
+            self._drain_wake_ups()
+
+    def account(self, task, start_ts, end_ts, hurried=False, failed=False):
+        name = task.name()
+        with self.__stats_lock:
+            stats = self.__stats.get(name)
+            if stats is None:
+                stats = self.__stats[name] = TaskStats()
+            stats.count += 1
+            if hurried:
+                stats.hurried += 1
+            elif task.at is not None:
+                stats.lateness.add(max(start_ts - task.at, 0.0))
+            if failed:
+                stats.failed += 1
+            stats.run_time.add(end_ts - start_ts)
+
+    def dump_stats(self):
+        with self.__stats_lock:
+            return dict(
+                (name, stats.dump())
+                for name, stats in self.__stats.iteritems()
+            )
+
+
+scheduler = Scheduler()
+
 
 class TimedQueue(object):
 
     def __init__(self):
         self.__shutting_down = False
         self.__shutdown_lock = threading.Lock()
-        self.__heap = []
-        self.__hurry = []
+        self.__ready = deque()
+        self.__hurried = set()
         self.__task_by_id = {}
         self.__heap_lock = threading.Lock()
+        self.__ready_cond = threading.Condition(self.__heap_lock)
         self.__loop_thread = threading.Thread(target=TimedQueue.loop, args=(self,))
         self.__loop_thread.setDaemon(True)
 
@@ -50,30 +194,36 @@ class TimedQueue(object):
             shutting_down = self.__shutting_down
         return shutting_down
 
+    def _dispatch(self, task):
+        with self.__ready_cond:
+            self.__ready.append(task)
+            self.__ready_cond.notify()
+
     def loop(self):
         time.sleep(3)
         while not self._is_shutting_down():
-            task = None
-            with self.__heap_lock:
-                if self.__hurry:
-                    task = self.__hurry.pop()
-                elif self.__heap and time.time() >= self.__heap[0][0]:
-                    task = heapq.heappop(self.__heap)[1]
-
-            if task is None:
-                time.sleep(1)
-                continue
-
-            with self.__heap_lock:
+            with self.__ready_cond:
+                while not self.__ready and not self._is_shutting_down():
+                    self.__ready_cond.wait()
+                if not self.__ready:
+                    break
+                task = self.__ready.popleft()
                 id_ = task.id()
-                self.__task_by_id.pop(id_, None)
+                if self.__task_by_id.get(id_) is task:
+                    del self.__task_by_id[id_]
+                hurried = task in self.__hurried
+                self.__hurried.discard(task)
+
             if not task.done():
+                start_ts = time.time()
+                failed = False
                 try:
                     task.execute()
                 except Exception:
                     # Task should handle its exceptions. If it doesn't, will lose it here.
                     # The loop should not stop because of it.
-                    pass
+                    failed = True
+                scheduler.account(task, start_ts, time.time(), hurried=hurried, failed=failed)
 
     def add_task_in(self, task_id, secs, function, *args, **kwargs):
         self.add_task_at(task_id, time.time() + secs, function, *args, **kwargs)
@@ -84,18 +234,23 @@ class TimedQueue(object):
         with self.__heap_lock:
             if task_id in self.__task_by_id:
                 raise ValueError("Task with ID %s already exists" % task_id)
-            task = Task(task_id, function, args, kwargs)
-            heapq.heappush(self.__heap, (at, task))
+            task = Task(task_id, function, args, kwargs, at=at)
             self.__task_by_id[task_id] = task
+        scheduler.schedule(at, self, task)
 
     def hurry(self, task_id):
-        with self.__heap_lock:
+        with self.__ready_cond:
             if task_id in self.__task_by_id:
-                self.__hurry.append(self.__task_by_id[task_id])
+                task = self.__task_by_id[task_id]
+                self.__hurried.add(task)
+                self.__ready.appendleft(task)
+                self.__ready_cond.notify()
                 return True
         return False
 
     def shutdown(self):
         with self.__shutdown_lock:
             self.__shutting_down = True
+        with self.__ready_cond:
+            self.__ready_cond.notify()
         self.__loop_thread.join()
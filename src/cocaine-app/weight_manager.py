@@ -1,6 +1,7 @@
 import itertools
 import math
 import random
+import time
 
 from config import config
 from infrastructure import infrastructure
@@ -27,6 +28,9 @@ class WeightManager(object):
         self.couples_by_disk = {}
         self.couples_by_net = {}
         self.weights = {}
+        # ns id -> (input signature, ns weights, claimed resources)
+        self._ns_results = {}
+        self.stats = {}
 
     def update(self, storage):
         self.update_resources(storage)
@@ -65,8 +69,11 @@ class WeightManager(object):
                         )
                     )
 
-                    couples_by_disk.setdefault(disk_key, set()).add(couple)
-                    couples_by_net.setdefault(nb_hostname, set()).add(couple)
+                    # couples are rebucketed only among the couples of the same
+                    # namespace and size, so the index is partitioned accordingly
+                    partition = (couple.namespace, len(couple.groups))
+                    couples_by_disk.setdefault(partition + (disk_key,), set()).add(couple)
+                    couples_by_net.setdefault(partition + (nb_hostname,), set()).add(couple)
                 groups_res.append(GroupResources(nbs_res))
             couples[couple] = CoupleResources(couple, groups_res)
 
@@ -78,9 +85,10 @@ class WeightManager(object):
 
     def calculate_weights(self, storage):
         try:
+            start_ts = time.time()
             weights = {}
-            min_couple_res_units = WeightCalculator.min_couple_resources()
-            zero_res_units = WeightCalculator.zero_resources()
+            ns_results = {}
+            reused = 0
             for ns in self.namespaces(storage):
                 ns_weights = {}
                 ns_sizes = {}
@@ -88,6 +96,7 @@ class WeightManager(object):
                 ns_settings = infrastructure.ns_settings[ns]
                 ns_min_units = ns_settings.get('min-units', self.MIN_NS_UNITS)
                 ns_add_units = ns_settings.get('add-units', self.ADD_NS_UNITS)
+                ns_groups_count = infrastructure.ns_settings[ns]['groups-count']
 
                 for couple in ns.couples:
                     ns_weights.setdefault(len(couple.groups), [])
@@ -104,48 +113,39 @@ class WeightManager(object):
                     required_units
                 ))
 
-                for ns_size, couples_res in ns_sizes.iteritems():
-                    buckets = CouplesBuckets(couples_res)
-                    claimed_units = WeightCalculator.zero_resources()
-
-                    ns_weights[ns_size] = []
-                    skip_couples = set()
-
-                    for couple_res in buckets:
-                        logger.debug('Ns {}, calculating weight for couple {}'.format(
-                            ns.id,
-                            couple_res.couple
-                        ))
-                        # count couple weight, accumulate it
-                        weight, couple_res_units = WeightCalculator.calculate_resources(couple_res)
-                        # change the state of resources
-                        if required_units - claimed_units > zero_res_units:
-                            claim_res_units = min(
-                                couple_res_units,
-                                required_units - claimed_units
-                            )
-                        else:
-                            claim_res_units = min_couple_res_units
-                        self.__claim(couple_res, claim_res_units)
-                        # mark couples with shared resources
-                        claimed_units += claim_res_units
-                        logger.debug('Ns {}, acc claimed resources: {}'.format(
-                            ns.id,
-                            claimed_units
-                        ))
-                        skip_couples.add(couple_res.couple)
-                        self.__rebucket(buckets, couple_res, skip_couples, ns_size)
-                        ns_weights[ns_size].append((
-                            couple_res.couple.as_tuple(),
-                            weight,
-                            couple_res.couple.effective_free_space
-                        ))
-                        enough_couples = len(ns_weights[ns_size]) >= ns_min_units + ns_add_units
-                        if claimed_units >= required_units and enough_couples:
-                            # claimed enough resouce units for namespace
-                            break
+                signature = self._ns_signature(
+                    (ns_min_units, ns_add_units, ns_groups_count),
+                    required_units,
+                    ns_weights,
+                    ns_sizes,
+                )
+                prev_result = self._ns_results.get(ns.id)
+                if prev_result and prev_result[0] == signature:
+                    # inputs of the namespace (including the state of the resources
+                    # shared with previously processed namespaces) have not changed,
+                    # the same resources are claimed to keep the state of
+                    # the resources consistent for the following namespaces
+                    _, ns_weights, claims = prev_result
+                    for couple, claim_res_units in claims:
+                        self.__claim(self.couples[couple], claim_res_units)
+                    reused += 1
+                else:
+                    claims = []
+                    self._calculate_ns_weights(
+                        ns,
+                        ns_weights,
+                        ns_sizes,
+                        required_units,
+                        ns_min_units + ns_add_units,
+                        claims,
+                    )
+                if not self._all_couples_weighted(ns_weights, ns_sizes):
+                    # couples are picked from shuffled buckets, when only a part of
+                    # the couples gets weights the choice is redone on every
+                    # calculation to spread the load among all namespace couples
+                    signature = None
+                ns_results[ns.id] = (signature, ns_weights, claims)
 
-                ns_groups_count = infrastructure.ns_settings[ns]['groups-count']
                 found_couples = len(ns_weights.get(ns_groups_count, []))
                 if found_couples < ns_min_units:
                     logger.error(
@@ -161,23 +161,126 @@ class WeightManager(object):
                     weights[ns.id] = ns_weights
 
             self.weights = weights
+            self._ns_results = ns_results
+            self.stats = {
+                'namespaces': len(ns_results),
+                'reused': reused,
+                'calculated': len(ns_results) - reused,
+                'time': time.time() - start_ts,
+            }
+            logger.info(
+                'Weights calculated for {calculated} namespaces, reused for {reused} '
+                'namespaces, time: {time:.3f}'.format(**self.stats)
+            )
         except Exception:
             logger.exception('Failed to calculate weights')
             pass
 
+    def _calculate_ns_weights(self,
+                              ns,
+                              ns_weights,
+                              ns_sizes,
+                              required_units,
+                              enough_units,
+                              claims):
+        min_couple_res_units = WeightCalculator.min_couple_resources()
+        zero_res_units = WeightCalculator.zero_resources()
+
+        for ns_size, couples_res in ns_sizes.iteritems():
+            buckets = CouplesBuckets(couples_res)
+            claimed_units = WeightCalculator.zero_resources()
+
+            ns_weights[ns_size] = []
+            skip_couples = set()
+
+            for couple_res in buckets:
+                logger.debug('Ns {}, calculating weight for couple {}'.format(
+                    ns.id,
+                    couple_res.couple
+                ))
+                # count couple weight, accumulate it
+                weight, couple_res_units = WeightCalculator.calculate_resources(couple_res)
+                # change the state of resources
+                if required_units - claimed_units > zero_res_units:
+                    claim_res_units = min(
+                        couple_res_units,
+                        required_units - claimed_units
+                    )
+                else:
+                    claim_res_units = min_couple_res_units
+                self.__claim(couple_res, claim_res_units)
+                claims.append((couple_res.couple, claim_res_units))
+                # mark couples with shared resources
+                claimed_units += claim_res_units
+                logger.debug('Ns {}, acc claimed resources: {}'.format(
+                    ns.id,
+                    claimed_units
+                ))
+                skip_couples.add(couple_res.couple)
+                self.__rebucket(buckets, couple_res, skip_couples, ns_size)
+                ns_weights[ns_size].append((
+                    couple_res.couple.as_tuple(),
+                    weight,
+                    couple_res.couple.effective_free_space
+                ))
+                enough_couples = len(ns_weights[ns_size]) >= enough_units
+                if claimed_units >= required_units and enough_couples:
+                    # claimed enough resouce units for namespace
+                    break
+
+    @staticmethod
+    def _all_couples_weighted(ns_weights, ns_sizes):
+        return all(
+            len(ns_weights.get(ns_size, [])) == len(couples_res)
+            for ns_size, couples_res in ns_sizes.iteritems()
+        )
+
+    @staticmethod
+    def _ns_signature(ns_params, required_units, ns_weights, ns_sizes):
+        """Get the signature of all inputs of namespace weights calculation"""
+        couples = []
+        for couples_res in ns_sizes.itervalues():
+            for couple_res in couples_res:
+                couple = couple_res.couple
+                couples.append((
+                    couple.as_tuple(),
+                    couple.effective_space,
+                    couple.effective_free_space,
+                    tuple(
+                        tuple(
+                            (
+                                nb_res.disk_res.key,
+                                nb_res.disk_util,
+                                nb_res.is_defragmentation_running,
+                                nb_res.node_res.key,
+                                nb_res.net_write_rate,
+                                nb_res.net_read_rate,
+                                nb_res.io_blocking_queue_size,
+                                nb_res.io_nonblocking_queue_size,
+                            )
+                            for nb_res in group_res.node_backends_res
+                        )
+                        for group_res in couple_res.groups_res
+                    ),
+                ))
+        couples.sort()
+        return (
+            ns_params,
+            (required_units.disk_util, required_units.net_rate),
+            tuple(sorted(ns_weights)),
+            tuple(couples),
+        )
+
     def __rebucket(self, buckets, couple_res, skip_couples, couple_size):
         disk_keys = couple_res.disks_keys()
         net_keys = couple_res.net_keys()
 
         couples_to_rebucket = set()
+        partition = (couple_res.couple.namespace, couple_size)
 
         def populate_neighbours(keys, couples_by_key_container, neighbours):
             for key in keys:
-                for couple in couples_by_key_container.get(key, []):
-                    if couple.namespace != couple_res.couple.namespace:
-                        continue
-                    if len(couple.groups) != couple_size:
-                        continue
+                for couple in couples_by_key_container.get(partition + (key,), []):
                     if couple in skip_couples:
                         continue
                     neighbours.add(couple)
@@ -413,6 +516,12 @@ class CouplesBuckets(object):
 
     @staticmethod
     def is_base(couple_res):
+        if logger.isEnabledFor(logging.DEBUG):
+            CouplesBuckets._log_couple_res(couple_res)
+        return not CouplesBuckets.utilized(couple_res) and not couple_res.on_defragmenting_disk
+
+    @staticmethod
+    def _log_couple_res(couple_res):
         logger.debug(
             'Couple {couple}: disk_util: {disk_util}, net_write_rate {net_write_rate}, '
             'net_read_rate {net_read_rate}, nbr_res {nbr_res}'.format(
@@ -427,7 +536,6 @@ class CouplesBuckets(object):
                 ],
             )
         )
-        return not CouplesBuckets.utilized(couple_res) and not couple_res.on_defragmenting_disk
 
     @staticmethod
     def is_on_defragmenting_disk(couple_res):
@@ -7,8 +7,66 @@ import zlib
 import msgpack
 from tornado import gen
 from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+from tornado.httputil import HTTPHeaders
 
 from mastermind.pool import PoolWorker
+from mastermind.utils.json_stream import JsonObjectStreamExtractor
+
+
+class MonitorStatStreamParser(object):
+    """Decode monitor stat response body as it is received
+
+    Response body is inflated and decoded by chunks, only fields
+    matching @fields specification are extracted (see
+    `mastermind.utils.json_stream.extract_fields`).
+    Should be set as header and streaming callbacks of http request.
+    """
+
+    def __init__(self, fields):
+        self._headers = HTTPHeaders()
+        self._headers_checked = False
+        self._decompressor = None
+        self._extractor = JsonObjectStreamExtractor(fields)
+        self._error = None
+
+    def header_callback(self, line):
+        if line.startswith('HTTP/'):
+            # status line of a new response (e.g., after "100 Continue")
+            self._headers = HTTPHeaders()
+            return
+        if line.strip():
+            self._headers.parse_line(line)
+
+    def streaming_callback(self, chunk):
+        if self._error is not None:
+            return
+        try:
+            self._check_headers()
+            if self._decompressor:
+                chunk = self._decompressor.decompress(chunk)
+            self._extractor.feed(chunk)
+        except Exception as e:
+            self._error = e
+
+    def _check_headers(self):
+        if self._headers_checked:
+            return
+        content_type = self._headers.get('Content-Type')
+        if content_type != 'application/json':
+            raise ValueError(
+                'unsupported content-type "{}"'.format(content_type)
+            )
+        if self._headers.get('Content-Encoding') == 'deflate':
+            self._decompressor = zlib.decompressobj()
+        self._headers_checked = True
+
+    def result(self):
+        if self._error is not None:
+            raise self._error
+        self._check_headers()
+        if self._decompressor:
+            self._extractor.feed(self._decompressor.flush())
+        return self._extractor.close()
 
 
 class MonitorStatParseWorker(PoolWorker):
@@ -23,6 +81,10 @@ class MonitorStatParseWorker(PoolWorker):
         monitor_port: elliptics monitor port;
         connect_timeout: timeout for initial connection in seconds;
         request_timeout: timeout for entire request in seconds;
+        extract_fields: monitor stat fields specification (see
+            `mastermind.utils.json_stream.extract_fields`), if set response
+            is decoded while being received and only the specified fields
+            are returned, otherwise the whole response is decoded;
         **kwds: passed through to base PoolWorker class;
     """
 
@@ -35,12 +97,14 @@ class MonitorStatParseWorker(PoolWorker):
                  monitor_port=10025,
                  connect_timeout=5.0,
                  request_timeout=5.0,
+                 extract_fields=None,
                  **kwds):
         super(MonitorStatParseWorker, self).__init__(ioloop=ioloop, **kwds)
         self._monitor_stat_categories = monitor_stat_categories
         self._monitor_port = monitor_port
         self._connect_timeout = connect_timeout
         self._request_timeout = request_timeout
+        self._extract_fields = extract_fields
         self.http_client = MonitorStatParseWorker.HTTPClient(
             self._ioloop,
             max_clients=max_http_clients,
@@ -55,32 +119,44 @@ class MonitorStatParseWorker(PoolWorker):
 
     @gen.coroutine
     def process(self, (host, port, family)):
+        parser = None
+        if self._extract_fields is not None:
+            parser = MonitorStatStreamParser(self._extract_fields)
         http_request = HTTPRequest(
             self.url(host=host),
             connect_timeout=self._connect_timeout,
             request_timeout=self._request_timeout,
+            header_callback=parser and parser.header_callback,
+            streaming_callback=parser and parser.streaming_callback,
         )
         response = yield self.http_client.fetch(http_request, raise_error=False)
-        result = self._parse_response(host, port, family, response)
+        result = self._parse_response(host, port, family, response, parser=parser)
 
         raise gen.Return(msgpack.packb(result))
 
-    def _parse_response(self, host, port, family, response):
+    @staticmethod
+    def _decode_content(response):
+        content_type = response.headers.get('Content-Type')
+        if content_type != 'application/json':
+            raise ValueError(
+                'unsupported content-type "{}"'.format(content_type)
+            )
+        content = response.body
+        if response.headers.get('Content-Encoding') == 'deflate':
+            content = zlib.decompress(content)
+        return json.loads(content)
+
+    def _parse_response(self, host, port, family, response, parser=None):
         error = None
         content = ''
         if response.error:
             error = str(response.error)
         else:
             try:
-                content_type = response.headers.get('Content-Type')
-                if content_type != 'application/json':
-                    raise ValueError(
-                        'unsupported content-type "{}"'.format(content_type)
-                    )
-                content = response.body
-                if response.headers.get('Content-Encoding') == 'deflate':
-                    content = zlib.decompress(content)
-                content = json.loads(content)
+                if parser is None:
+                    content = self._decode_content(response)
+                else:
+                    content = parser.result()
             except Exception as e:
                 error = 'Failed to parse json: {}'.format(e)
         return {
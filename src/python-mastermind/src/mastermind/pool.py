@@ -27,13 +27,24 @@ where:
     of results;
     - `func` is used by the original Pool implementation and is not
     supported, this is replaced by subclassing PoolWorker and
-    providing its `process` method;
+    providing its `process` method; instead this field is used
+    to pass the time the task was put to the task queue, so worker
+    can measure the time task has been waiting in the queue;
     - args and kwds are passed to `process` method of worker
     implementation.
 
 This format is not changed to retain support of ApplyResult-
 and IMapIterator-based result objects of standard implementation.
 
+Optionally byte string results can be passed to the client through
+shared memory instead of the result pipe. Each worker process gets
+its own ring buffer in anonymous shared memory (mapped before fork):
+worker copies the payload to the ring and sends only a small descriptor
+through the pipe, client copies the payload out and releases the space.
+This saves pickling the payload and copying it through the pipe.
+If the ring has no free space for a result, the result is sent through
+the pipe as usual (see `Pool` parameters).
+
 Due to the fact that this implementation redefines some "private"
 methods of `Pool` and `SimpleQueue` classes, it is heavily
 dependent on current implementation. This means that it should be
@@ -42,13 +53,16 @@ implementation changes.
 """
 
 from collections import Iterator
-from datetime import timedelta
 import logging
 from multiprocessing import TimeoutError
 from multiprocessing.pool import Pool as OriginalPool
 from multiprocessing.queues import SimpleQueue as OriginalSimpleQueue
 from multiprocessing.queues import Empty
 from multiprocessing.util import debug
+import itertools
+import mmap
+import struct
+import time
 
 from tornado import gen
 from tornado.ioloop import IOLoop
@@ -60,6 +74,12 @@ class PoolWorker(object):
     Fetches and processes tasks on asynchronous mode.
     Derived class should implement 'process' method.
 
+    Tasks are fetched as soon as task queue becomes readable. Tasks are
+    fetched in batches, batch size is doubled each time the whole batch
+    was available in the queue (up to @max_tasks_per_period) and is reset
+    when the queue is drained, so bursts of tasks are fetched at ioloop speed
+    while not starving already running tasks.
+
     NB: 'process' method implementation should minimize the usage
     of blocking operation except when it is necessary.
 
@@ -72,14 +92,16 @@ class PoolWorker(object):
 
     def __init__(self,
                  ioloop=None,
-                 tasks_fetch_period=0.1,
-                 max_tasks_per_period=1):
+                 tasks_fetch_period=None,
+                 max_tasks_per_period=1024):
+        # NB: 'tasks_fetch_period' is obsolete and is not used since tasks
+        # are fetched on task queue readiness, kept for backward compatibility
         self._task_queue = None
         self._result_queue = None
         self._ioloop = ioloop or IOLoop.current()
         self.logger = logging.getLogger('worker_pool')
-        self._tasks_fetch_period = timedelta(seconds=tasks_fetch_period)
         self._max_tasks_per_period = max_tasks_per_period
+        self._tasks_batch_size = 1
         self._state = PoolWorker.RUNNING
         self._executing = 0
 
@@ -93,7 +115,11 @@ class PoolWorker(object):
         assert self._task_queue, 'Task queue should be set'
         assert self._result_queue, 'Result queue should be set'
 
-        self._ioloop.add_callback(self._process_tasks)
+        self._ioloop.add_handler(
+            self._task_queue.fileno(),
+            self._process_tasks,
+            IOLoop.READ,
+        )
         self._ioloop.start()
 
     def process(self, *args, **kwargs):
@@ -156,39 +182,59 @@ class PoolWorker(object):
             self._executing -= 1
             self._check_stop()
 
-    def _process_tasks(self):
+    def _process_tasks(self, fd=None, events=None):
         """Fetch tasks from task queue if available and pass them for processing
 
-        This task is run periodically (because SimpleQueue does not provide
-        callbacks and/or asynchronous interface) and fetched tasks from task queue.
+        This task is run by ioloop when task queue's pipe becomes readable.
+        Task queue is shared among all pool workers, so the queue can
+        already be drained by other workers at this moment.
 
         Task format is described above.
         """
-        self.logger.info('Fetching tasks')
+        fetched = 0
+        max_queue_wait = 0.0
         try:
-            for _ in xrange(self._max_tasks_per_period):
+            while fetched < self._tasks_batch_size:
                 task = self._task_queue.get(block=False)
                 if task is None:
                     self._state = PoolWorker.STOPPED
+                    self._ioloop.remove_handler(self._task_queue.fileno())
                     self._check_stop()
                     return
 
-                job_id, task_id, _, args, kwds = task
+                job_id, task_id, enqueue_ts, args, kwds = task
+                queue_wait = time.time() - enqueue_ts if enqueue_ts else 0.0
+                max_queue_wait = max(max_queue_wait, queue_wait)
                 self.logger.debug(
-                    'Fetched task {args}, {kwds} (job {job_id}, task {task_id})'.format(
+                    'Fetched task {args}, {kwds} (job {job_id}, task {task_id}), '
+                    'queue wait time {queue_wait:.4f}s'.format(
                         args=args,
                         kwds=kwds,
                         job_id=job_id,
                         task_id=task_id,
+                        queue_wait=queue_wait,
                     )
                 )
+                fetched += 1
                 self._executing += 1
                 self._ioloop.add_callback(self._process_task, job_id, task_id, *args)
         except Empty:
             pass
         finally:
-            if self._state == PoolWorker.RUNNING:
-                self._ioloop.add_timeout(self._tasks_fetch_period, self._process_tasks)
+            if fetched:
+                self.logger.info(
+                    'Fetched {count} tasks, max queue wait time {queue_wait:.4f}s'.format(
+                        count=fetched,
+                        queue_wait=max_queue_wait,
+                    )
+                )
+            if fetched == self._tasks_batch_size:
+                self._tasks_batch_size = min(
+                    self._tasks_batch_size * 2,
+                    self._max_tasks_per_period
+                )
+            else:
+                self._tasks_batch_size = 1
 
     def _check_stop(self):
         """Check if all tasks have been processed
@@ -197,7 +243,101 @@ class PoolWorker(object):
             self._ioloop.stop()
 
 
-def run_worker(task_queue, result_queue, PoolWorker, initkwds=None):
+class SharedMemoryRing(object):
+    """Single producer, single consumer ring buffer in shared memory
+
+    Worker process is the only producer and client process is the only
+    consumer. Buffer header stores the consumer position (total number
+    of bytes released by the consumer) and the producer position (total
+    number of bytes placed by the producer), producer position is also
+    passed to the consumer along with each payload descriptor.
+    """
+
+    POSITION = struct.Struct('Q')
+    CONSUMER_POSITION_OFFSET = 0
+    PRODUCER_POSITION_OFFSET = POSITION.size
+    HEADER_SIZE = 2 * POSITION.size
+
+    def __init__(self, id, size):
+        self.id = id
+        self._mmap = mmap.mmap(-1, self.HEADER_SIZE + size)
+        self._capacity = size
+        self._head = 0
+
+    def _tail(self):
+        return self.POSITION.unpack_from(self._mmap, self.CONSUMER_POSITION_OFFSET)[0]
+
+    def drained(self):
+        """Check if all payloads placed by the producer have been released
+        """
+        head = self.POSITION.unpack_from(self._mmap, self.PRODUCER_POSITION_OFFSET)[0]
+        return self._tail() == head
+
+    def put(self, data):
+        """Copy data to the ring buffer (producer side)
+
+        Returns payload descriptor or None if there is not enough free space.
+        """
+        size = len(data)
+        head = self._head
+        offset = head % self._capacity
+        if offset + size > self._capacity:
+            # payload is always placed contiguously, skip the rest of the buffer
+            head += self._capacity - offset
+            offset = 0
+        if head + size - self._tail() > self._capacity:
+            return None
+        start = self.HEADER_SIZE + offset
+        self._mmap[start:start + size] = data
+        self._head = head + size
+        self.POSITION.pack_into(self._mmap, self.PRODUCER_POSITION_OFFSET, self._head)
+        return SharedMemoryPayload(self.id, start, size, self._head)
+
+    def get(self, payload):
+        """Copy payload data out of the ring buffer and release its space (consumer side)
+        """
+        data = self._mmap[payload.start:payload.start + payload.size]
+        self.POSITION.pack_into(self._mmap, self.CONSUMER_POSITION_OFFSET, payload.release_pos)
+        return data
+
+    def close(self):
+        self._mmap.close()
+
+
+class SharedMemoryPayload(object):
+    """Descriptor of a result payload placed to shared memory ring by a worker
+    """
+
+    def __init__(self, ring_id, start, size, release_pos):
+        self.ring_id = ring_id
+        self.start = start
+        self.size = size
+        self.release_pos = release_pos
+
+
+class SharedMemoryResultQueue(object):
+    """Result queue wrapper used by worker to pass results via shared memory
+
+    Byte string results with size of at least @min_size bytes are copied
+    to @ring, and only SharedMemoryPayload descriptor is put
+    to @result_queue.
+    """
+
+    def __init__(self, result_queue, ring, min_size):
+        self._result_queue = result_queue
+        self._ring = ring
+        self._min_size = min_size
+
+    def put(self, obj):
+        job_id, task_id, (success, result) = obj
+        if success and isinstance(result, str) and len(result) >= self._min_size:
+            payload = self._ring.put(result)
+            if payload is not None:
+                obj = (job_id, task_id, (success, payload))
+        self._result_queue.put(obj)
+
+
+def run_worker(task_queue, result_queue, PoolWorker, initkwds=None, shm=None):
     # Force 'logging' module's global lock release,
     # otherwise this can cause following bug:
     # - MainProcess-Thread1 acquires 'logging' module's global lock on getting
@@ -218,6 +358,9 @@ def run_worker(task_queue, result_queue, PoolWorker, initkwds=None):
         ioloop=ioloop,
         **initkwds
     )
+    if shm is not None:
+        ring, min_size = shm
+        result_queue = SharedMemoryResultQueue(result_queue, ring, min_size)
     worker.set_task_queue(task_queue)
     worker.set_result_queue(result_queue)
     worker.run()
@@ -236,6 +379,12 @@ class Pool(OriginalPool):
         worker: PoolWorker-based class that will be instanced in a worker process;
         w_initkwds: kwds that should be passed to worker on initialization
                     NB: *args is not supported;
+        shm_results: pass byte string results through shared memory
+                     instead of result pipe (keyword only);
+        shm_size: size of shared memory ring buffer of each worker
+                  in bytes (keyword only);
+        shm_min_size: minimal size of byte string result in bytes
+                      that is passed through shared memory (keyword only);
         *args, **kwargs: parameters to pass to original Pool base class.
     """
     def __init__(self, worker=PoolWorker, w_initkwds=None, *args, **kwargs):
@@ -245,33 +394,122 @@ class Pool(OriginalPool):
         self._worker = worker
         self._w_initkwds = w_initkwds
 
+        self._shm_results = kwargs.pop('shm_results', False)
+        self._shm_size = kwargs.pop('shm_size', 16 * 1024 * 1024)
+        self._shm_min_size = kwargs.pop('shm_min_size', 64 * 1024)
+        self._shm_rings = {}
+        # rings of cleanly exited workers which results are still in the result pipe
+        self._shm_exited_rings = {}
+        self._shm_ring_ids = itertools.count()
+
         super(Pool, self).__init__(*args, **kwargs)
 
     def _repopulate_pool(self):
         """Bring the number of pool processes up to the specified number,
         for use after reaping workers which have exited.
         """
+        shm = None
         for i in range(self._processes - len(self._pool)):
+            if self._shm_results:
+                ring = SharedMemoryRing(next(self._shm_ring_ids), self._shm_size)
+                shm = (ring, self._shm_min_size)
             w = self.Process(
                 target=run_worker,
                 args=(
                     self._inqueue,
                     self._outqueue,
                     self._worker,
-                    self._w_initkwds
+                    self._w_initkwds,
+                    shm,
                 )
             )
             self._pool.append(w)
             w.name = w.name.replace('Process', 'PoolWorker')
             w.daemon = True
             w.start()
+            if shm:
+                w.shm_ring = ring
+                self._shm_rings[ring.id] = ring
             debug('added worker')
 
+    def _join_exited_workers(self):
+        """Cleanup after any worker processes which have exited due to reaching
+        their specified lifetime.  Returns True if any workers were cleaned up.
+        """
+        exited = [w for w in self._pool if w.exitcode is not None]
+        cleaned = super(Pool, self)._join_exited_workers()
+        for w in exited:
+            ring = getattr(w, 'shm_ring', None)
+            if not ring:
+                continue
+            if w.exitcode != 0:
+                # results of abnormally exited worker that are still
+                # in the result pipe will be reported as failed
+                self._shm_rings.pop(ring.id, None)
+                continue
+            # ring is kept until results that worker has already put
+            # to the result pipe are loaded
+            self._shm_exited_rings[ring.id] = ring
+            self._release_drained_ring(self._shm_rings, self._shm_exited_rings, ring)
+        return cleaned
+
+    @staticmethod
+    def _release_drained_ring(rings, exited_rings, ring):
+        if ring.drained():
+            exited_rings.pop(ring.id, None)
+            rings.pop(ring.id, None)
+
     def _setup_queues(self):
         self._inqueue = SimpleQueue()
         self._outqueue = SimpleQueue()
-        self._quick_put = self._inqueue._writer.send
+        self._quick_put = self._timestamped_put(self._inqueue._writer.send)
         self._quick_get = self._outqueue._reader.recv
+        if self._shm_results:
+            self._quick_get = self._shm_get(
+                self._quick_get,
+                self._shm_rings,
+                self._shm_exited_rings,
+            )
+
+    @staticmethod
+    def _timestamped_put(put):
+        """Wrap task pipe's put to pass task enqueue time to workers
+
+        Enqueue time replaces unsupported `func` field of a task.
+        """
+        def timestamped_put(task):
+            if task is not None:
+                job, i, _, args, kwds = task
+                task = (job, i, time.time(), args, kwds)
+            put(task)
+        return timestamped_put
+
+    @staticmethod
+    def _shm_get(get, rings, exited_rings):
+        """Wrap result pipe's get to load results passed via shared memory
+
+        Rings of exited workers are released as soon as all their results
+        are loaded.
+        """
+        def shm_get():
+            task = get()
+            if task is None:
+                return task
+            job, i, (success, result) = task
+            if isinstance(result, SharedMemoryPayload):
+                ring_id = result.ring_id
+                try:
+                    result = rings[ring_id].get(result)
+                except Exception as e:
+                    success, result = False, RuntimeError(
+                        'Failed to load result from shared memory: {}'.format(e)
+                    )
+                ring = exited_rings.get(ring_id)
+                if ring:
+                    Pool._release_drained_ring(rings, exited_rings, ring)
+                task = (job, i, (success, result))
+            return task
+        return shm_get
 
 
 class SimpleQueue(OriginalSimpleQueue):
@@ -303,12 +541,26 @@ class SimpleQueue(OriginalSimpleQueue):
                 rrelease()
         self.get = get
 
+    def fileno(self):
+        """File descriptor that becomes readable when queue is not empty
+        """
+        return self._reader.fileno()
+
 
-def skip_exceptions(result, on_exc=None, timeout=None):
+def skip_exceptions(result, on_exc=None, timeout=None, deadline=None):
+    """Iterate over pool results skipping the ones that raised exceptions
+
+    @timeout limits waiting time for each result, @deadline (unix timestamp)
+    limits waiting time for all of the results and takes precedence over
+    @timeout. TimeoutError is raised if a result is not ready in time,
+    iteration can be resumed later with another call.
+    """
     if not isinstance(result, Iterator):
         raise TypeError('Iterator object is expected')
 
     while True:
+        if deadline is not None:
+            timeout = max(deadline - time.time(), 0)
         try:
             yield result.next(timeout)
         except StopIteration:
@@ -0,0 +1,77 @@
+import bisect
+
+
+class Histogram(object):
+    """Histogram of values (e.g., timings) with fixed bucket boundaries
+
+    Value is accounted in the first bucket which upper bound is not less
+    than the value, values greater than the last bound are accounted
+    in the overflow bucket. Percentiles are estimated by upper bounds
+    of buckets.
+
+    Arguments:
+        bounds: sorted upper bounds of buckets;
+    """
+
+    # timing buckets in seconds
+    DEFAULT_BOUNDS = (
+        0.001, 0.002, 0.005,
+        0.01, 0.02, 0.05,
+        0.1, 0.2, 0.5,
+        1.0, 2.0, 5.0,
+        10.0, 20.0, 50.0,
+    )
+
+    def __init__(self, bounds=DEFAULT_BOUNDS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        """Estimate @p-th percentile (0 < p <= 100)
+
+        Returns upper bound of the bucket containing the percentile,
+        maximum value is used as an upper bound of the last non-empty bucket.
+        """
+        if not self.count:
+            return None
+        rank = self.count * p / 100.0
+        accumulated = 0
+        for i, count in enumerate(self.counts):
+            accumulated += count
+            if accumulated >= rank and count:
+                if i == len(self.bounds):
+                    return self.max
+                return min(self.bounds[i], self.max)
+        return self.max
+
+    def dump(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'buckets': [
+                {
+                    # None stands for the overflow bucket
+                    'le': self.bounds[i] if i < len(self.bounds) else None,
+                    'count': count,
+                }
+                for i, count in enumerate(self.counts)
+            ],
+        }
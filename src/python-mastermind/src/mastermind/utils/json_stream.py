@@ -0,0 +1,255 @@
+try:
+    import simplejson as json
+except ImportError:
+    import json
+import re
+
+
+# matches any key of a json object, can be used in fields specification
+ANY_KEY = re.compile('', re.DOTALL)
+
+WHITESPACE = ' \t\n\r'
+
+
+def extract_fields(value, fields):
+    """Extract a subset of fields from decoded json value
+
+    Arguments:
+        value: decoded json value;
+        fields: fields specification, either True (whole value is required)
+            or a dict mapping object keys to the fields specification of
+            the corresponding values. Keys of a specification can be strings
+            or compiled regular expressions (see ANY_KEY); string keys are
+            looked up first.
+    """
+    return _extract(value, _Fields.compile(fields))
+
+
+class _Fields(object):
+    """Compiled fields specification"""
+
+    __slots__ = ['names', 'patterns']
+
+    def __init__(self, names, patterns):
+        self.names = names
+        self.patterns = patterns
+
+    @staticmethod
+    def compile(fields):
+        if fields is True or fields is None:
+            return fields
+        names = {}
+        patterns = []
+        for key, subfields in fields.iteritems():
+            if isinstance(key, basestring):
+                names[key] = _Fields.compile(subfields)
+            else:
+                patterns.append((key, _Fields.compile(subfields)))
+        return _Fields(names, patterns)
+
+    def match(self, key):
+        subfields = self.names.get(key)
+        if subfields is not None:
+            return subfields
+        for pattern, subfields in self.patterns:
+            if pattern.match(key):
+                return subfields
+        return None
+
+
+def _match_fields(fields, key):
+    if fields is None:
+        return None
+    return fields.match(key)
+
+
+def _extract(value, fields):
+    if fields is True or not isinstance(value, dict):
+        return value
+    res = {}
+    if not fields.patterns:
+        # lookup required keys only, value can have much more keys than required
+        for key, subfields in fields.names.iteritems():
+            if key in value:
+                res[key] = _extract(value[key], subfields)
+        return res
+    for key, subvalue in value.iteritems():
+        subfields = fields.match(key)
+        if subfields is None:
+            continue
+        res[key] = _extract(subvalue, subfields)
+    return res
+
+
+class _Frame(object):
+    __slots__ = ['fields', 'result', 'state', 'key']
+
+    OBJECT_START = 0
+    KEY = 1
+    COLON = 2
+    VALUE = 3
+    COMMA = 4
+
+    def __init__(self, fields):
+        self.fields = fields
+        self.result = {} if fields is not None else None
+        self.state = _Frame.OBJECT_START
+        self.key = None
+
+
+class JsonObjectStreamExtractor(object):
+    """Incremental decoder that extracts required fields from a json object
+
+    Json document is fed by chunks and is never held in memory as a whole:
+    object members up to the depth of @max_depth are split incrementally,
+    and each member value is decoded (by the json module's C decoder when
+    available) as soon as it is received completely. Values that are not
+    required according to @fields specification are dropped right away,
+    so memory consumption is limited by the size of the largest member
+    value at @max_depth level and not by the size of the whole document.
+
+    Arguments:
+        fields: fields specification (see `extract_fields`);
+        max_depth: maximum depth of nested objects that are split
+            into members incrementally;
+    """
+
+    # failed attempts to decode an incomplete value are retried only when
+    # the buffer grows by this factor to keep decoding cost linear
+    RETRY_GROWTH_FACTOR = 2
+
+    def __init__(self, fields, max_depth=2):
+        self._decoder = json.JSONDecoder()
+        self._max_depth = max_depth
+        self._buf = ''
+        self._pos = 0
+        self._chunks = []
+        self._chunks_size = 0
+        self._retry_size = 0
+        self._stack = [_Frame(_Fields.compile(fields))]
+        self._result = None
+        self._closed = False
+
+    def feed(self, data):
+        """Feed the next chunk of json document"""
+        if self._closed:
+            raise ValueError('Stream is already closed')
+        self._chunks.append(data)
+        self._chunks_size += len(data)
+        if len(self._buf) - self._pos + self._chunks_size >= self._retry_size:
+            self._join_chunks()
+            self._advance()
+
+    def close(self):
+        """Finish decoding and return extracted fields"""
+        self._closed = True
+        self._join_chunks()
+        self._advance()
+        if self._stack:
+            raise ValueError('Unexpected end of json document')
+        if self._buf[self._pos:].strip(WHITESPACE):
+            raise ValueError('Extra data after json document')
+        return self._result
+
+    def _join_chunks(self):
+        self._chunks.insert(0, self._buf[self._pos:])
+        self._buf = ''.join(self._chunks)
+        self._pos = 0
+        self._chunks = []
+        self._chunks_size = 0
+
+    def _skip_whitespace(self):
+        buf, pos = self._buf, self._pos
+        while pos < len(buf) and buf[pos] in WHITESPACE:
+            pos += 1
+        self._pos = pos
+        return pos < len(buf)
+
+    def _decode(self):
+        """Decode a complete json value at the current position
+
+        Returns a tuple (success, value).
+        """
+        try:
+            value, end = self._decoder.raw_decode(self._buf, self._pos)
+        except ValueError:
+            if self._closed:
+                raise
+            self._retry_size = (len(self._buf) - self._pos) * self.RETRY_GROWTH_FACTOR
+            return False, None
+        if end == len(self._buf) and not self._closed:
+            # scalar values (e.g. numbers) can be truncated by chunk boundary,
+            # member value should always be followed by a delimiter
+            return False, None
+        self._pos = end
+        self._retry_size = 0
+        return True, value
+
+    def _expect(self, char):
+        if self._buf[self._pos] != char:
+            raise ValueError('Expecting "{char}" at position {pos}'.format(
+                char=char,
+                pos=self._pos,
+            ))
+        self._pos += 1
+
+    def _pop_frame(self):
+        frame = self._stack.pop()
+        if not self._stack:
+            self._result = frame.result
+            return
+        parent = self._stack[-1]
+        if parent.result is not None and frame.result is not None:
+            parent.result[parent.key] = frame.result
+        parent.state = _Frame.COMMA
+
+    def _advance(self):
+        while self._stack and self._skip_whitespace():
+            frame = self._stack[-1]
+            char = self._buf[self._pos]
+
+            if frame.state == _Frame.OBJECT_START:
+                self._expect('{')
+                frame.state = _Frame.KEY
+
+            elif frame.state == _Frame.KEY:
+                if char == '}':
+                    self._pos += 1
+                    self._pop_frame()
+                    continue
+                if char != '"':
+                    raise ValueError('Expecting property name at position {}'.format(self._pos))
+                success, key = self._decode()
+                if not success:
+                    return
+                frame.key = key
+                frame.state = _Frame.COLON
+
+            elif frame.state == _Frame.COLON:
+                self._expect(':')
+                frame.state = _Frame.VALUE
+
+            elif frame.state == _Frame.VALUE:
+                subfields = _match_fields(frame.fields, frame.key)
+                if (char == '{' and
+                        subfields is not True and
+                        len(self._stack) < self._max_depth):
+                    # split nested object into members as well
+                    self._stack.append(_Frame(subfields))
+                    continue
+                success, value = self._decode()
+                if not success:
+                    return
+                if subfields is not None and frame.result is not None:
+                    frame.result[frame.key] = _extract(value, subfields)
+                frame.state = _Frame.COMMA
+
+            elif frame.state == _Frame.COMMA:
+                if char == '}':
+                    self._pos += 1
+                    self._pop_frame()
+                elif char == ',':
+                    self._pos += 1
+                    frame.state = _Frame.KEY
+                else:
+                    raise ValueError('Expecting "," delimiter at position {}'.format(self._pos))
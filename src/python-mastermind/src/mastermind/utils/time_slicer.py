@@ -0,0 +1,33 @@
+import time
+
+
+class TimeSlicer(object):
+    """Cooperative time slicing of a long running cpu-bound computation
+
+    Computation should call `tick` regularly (e.g., on every loop iteration).
+    Once the computation has been running for @time_slice seconds since the
+    last pause, the thread sleeps for @pause seconds releasing GIL for other
+    threads. Overall duration of the computation is therefore proportional
+    to the actual work: it grows by a factor of (1 + pause / time_slice)
+    at most.
+
+    Arguments:
+        time_slice: maximum duration of continuous work in seconds;
+        pause: duration of a pause in seconds;
+    """
+
+    def __init__(self, time_slice=0.1, pause=0.01):
+        self.time_slice = time_slice
+        self.pause = pause
+        self.pauses = 0
+        self.paused_time = 0.0
+        self._slice_start_ts = time.time()
+
+    def tick(self):
+        now = time.time()
+        if now - self._slice_start_ts < self.time_slice:
+            return
+        time.sleep(self.pause)
+        self._slice_start_ts = time.time()
+        self.pauses += 1
+        self.paused_time += self._slice_start_ts - now
@@ -0,0 +1,113 @@
+"""Benchmark of Statistics.per_entity_stat on a synthetic cluster
+
+Builds synthetic clusters of increasing size (number of couples is doubled
+on every step) and measures the time of dc, namespace and namespace-dc
+statistics calculation. Time per couple should stay about the same for all
+sizes since statistics are calculated in a single pass over node backends.
+
+Requires mastermind application environment (elliptics bindings and
+mastermind config).
+
+Usage:
+    PYTHONPATH=src/cocaine-app:src/python-mastermind/src \
+        python tests/benchmarks/bench_per_entity_stat.py \
+        [--couples 1000] [--steps 4] [--groups-per-couple 3] \
+        [--backends-per-group 1] [--dcs 3] [--namespaces 10] [--repeat 3]
+"""
+import argparse
+import itertools
+import time
+
+import statistics
+import storage
+from synthetic import (
+    SyntheticCouple,
+    SyntheticGroup,
+    SyntheticHost,
+    SyntheticNamespace,
+    SyntheticNode,
+    SyntheticNodeBackend,
+    make_node_backend_stat,
+)
+
+
+def make_stat(i):
+    return make_node_backend_stat(
+        total_space=1024 ** 4,
+        free_space=(i % 100) * 1024 ** 3,
+        files=i * 10,
+        files_removed=i,
+    )
+
+
+def make_cluster(couples, groups_per_couple, backends_per_group, dcs, namespaces):
+    hosts = [SyntheticHost(dc='dc{}'.format(i)) for i in xrange(dcs)]
+    nss = [SyntheticNamespace('ns{}'.format(i)) for i in xrange(namespaces)]
+    statuses = itertools.cycle([
+        storage.Status.OK,
+        storage.Status.OK,
+        storage.Status.FULL,
+        storage.Status.FROZEN,
+        storage.Status.BAD,
+    ])
+    group_ids = itertools.count(1)
+
+    groups = []
+    for couple_idx in xrange(couples):
+        couple_groups = []
+        for group_idx in xrange(groups_per_couple):
+            host = hosts[group_idx % dcs]
+            group_id = next(group_ids)
+            nbs = [
+                SyntheticNodeBackend(SyntheticNode(host), make_stat(group_id))
+                for _ in xrange(backends_per_group)
+            ]
+            couple_groups.append(SyntheticGroup(group_id, nbs))
+        SyntheticCouple(couple_groups, nss[couple_idx % namespaces], next(statuses))
+        groups.extend(couple_groups)
+    return groups
+
+
+def run(groups, repeat):
+    stats = statistics.Statistics(balancer=None)
+    storage.groups = groups
+    elapsed = []
+    for _ in xrange(repeat):
+        start = time.time()
+        stats.per_entity_stat()
+        elapsed.append(time.time() - start)
+    return min(elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--couples', type=int, default=1000)
+    parser.add_argument('--steps', type=int, default=4)
+    parser.add_argument('--groups-per-couple', type=int, default=3)
+    parser.add_argument('--backends-per-group', type=int, default=1)
+    parser.add_argument('--dcs', type=int, default=3)
+    parser.add_argument('--namespaces', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print '{:>10} {:>10} {:>12} {:>18}'.format('couples', 'groups', 'time, s', 'per couple, us')
+    for step in xrange(args.steps):
+        couples = args.couples * 2 ** step
+        groups = make_cluster(
+            couples=couples,
+            groups_per_couple=args.groups_per_couple,
+            backends_per_group=args.backends_per_group,
+            dcs=args.dcs,
+            namespaces=args.namespaces,
+        )
+        elapsed = run(groups, args.repeat)
+        print '{:>10} {:>10} {:>12.3f} {:>18.1f}'.format(
+            couples,
+            len(groups),
+            elapsed,
+            elapsed / couples * 10 ** 6,
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Benchmark of persistent locks acquisition and release
+
+Acquires and releases sets of persistent locks of increasing size (number
+of locks is doubled on every step) using the selected sync manager, e.g.
+local fake sync manager or zookeeper sync manager. Lock sets are similar
+to the ones acquired by move and lrc jobs.
+
+Requires mastermind application environment (mastermind config, kazoo
+for zookeeper sync manager).
+
+Usage:
+    PYTHONPATH=src/cocaine-app:src/python-mastermind/src \
+        python tests/benchmarks/bench_persistent_locks_release.py \
+        [--sync-class sync.fake_sync.SyncManager] [--host 127.0.0.1:2181] \
+        [--locks 100] [--steps 4] [--repeat 3]
+"""
+import argparse
+import time
+
+from importer import import_object
+
+
+LOCK_PREFIX = 'bench/'
+JOB_ID = 'bench-job'
+
+
+def make_locks(count):
+    return ['{}group-{}'.format(LOCK_PREFIX, i) for i in xrange(count)]
+
+
+def run(sync_manager, locks, repeat):
+    acquire_elapsed = []
+    release_elapsed = []
+    for _ in xrange(repeat):
+        start = time.time()
+        sync_manager.persistent_locks_acquire(locks, JOB_ID)
+        acquire_elapsed.append(time.time() - start)
+
+        start = time.time()
+        sync_manager.persistent_locks_release(locks, JOB_ID)
+        release_elapsed.append(time.time() - start)
+    return min(acquire_elapsed), min(release_elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sync-class', default='sync.fake_sync.SyncManager')
+    parser.add_argument('--host', default=None)
+    parser.add_argument('--locks', type=int, default=100)
+    parser.add_argument('--steps', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    kwargs = {}
+    if args.host:
+        kwargs['host'] = args.host
+    sync_manager = import_object(args.sync_class)(**kwargs)
+
+    print '{:>10} {:>12} {:>12} {:>18}'.format('locks', 'acquire, s', 'release, s', 'release per lock, us')
+    for step in xrange(args.steps):
+        locks = make_locks(args.locks * 2 ** step)
+        acquire_time, release_time = run(sync_manager, locks, args.repeat)
+        print '{:>10} {:>12.3f} {:>12.3f} {:>18.1f}'.format(
+            len(locks),
+            acquire_time,
+            release_time,
+            release_time / len(locks) * 10 ** 6,
+        )
+
+
+if __name__ == '__main__':
+    main()
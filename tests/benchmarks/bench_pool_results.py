@@ -0,0 +1,84 @@
+"""Benchmark of pool result transports: result pipe vs shared memory
+
+Runs a batch of tasks returning byte strings of the given size
+and measures the total time and client process cpu time spent
+on receiving the results.
+
+Usage:
+    PYTHONPATH=src/python-mastermind/src python tests/benchmarks/bench_pool_results.py \
+        [--processes 4] [--tasks 2000] [--size 1048576] [--shm-size 16777216]
+"""
+import argparse
+import os
+import time
+
+from tornado import gen
+
+from mastermind import pool
+
+
+class PayloadWorker(pool.PoolWorker):
+    """Returns byte string payload of requested size"""
+
+    def __init__(self, ioloop=None, **kwds):
+        super(PayloadWorker, self).__init__(ioloop=ioloop, **kwds)
+        self._payloads = {}
+
+    @gen.coroutine
+    def process(self, size):
+        if size not in self._payloads:
+            self._payloads[size] = 'x' * size
+        raise gen.Return(self._payloads[size])
+
+
+def run(processes, tasks, size, shm_results, shm_size):
+    p = pool.Pool(
+        processes=processes,
+        worker=PayloadWorker,
+        shm_results=shm_results,
+        shm_min_size=0,
+        shm_size=shm_size,
+    )
+    try:
+        # warm up worker processes
+        list(p.imap_unordered(None, [1] * processes))
+
+        start_ts = time.time()
+        start_cpu = sum(os.times()[:2])
+        received = 0
+        for result in p.imap_unordered(None, [size] * tasks):
+            received += len(result)
+        elapsed = time.time() - start_ts
+        cpu = sum(os.times()[:2]) - start_cpu
+    finally:
+        p.terminate()
+        p.join()
+
+    assert received == tasks * size
+    return elapsed, cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--tasks', type=int, default=2000)
+    parser.add_argument('--size', type=int, default=1024 * 1024)
+    parser.add_argument('--shm-size', type=int, default=16 * 1024 * 1024)
+    args = parser.parse_args()
+
+    print 'processes: {}, tasks: {}, result size: {} bytes'.format(
+        args.processes, args.tasks, args.size)
+    for mode, shm_results in (('pipe', False), ('shm', True)):
+        elapsed, cpu = run(
+            args.processes, args.tasks, args.size, shm_results, args.shm_size
+        )
+        print '{mode:>5}: {elapsed:.3f}s, client cpu {cpu:.3f}s, {rate:.1f} MB/s'.format(
+            mode=mode,
+            elapsed=elapsed,
+            cpu=cpu,
+            rate=args.tasks * args.size / elapsed / 2 ** 20,
+        )
+
+
+if __name__ == '__main__':
+    main()
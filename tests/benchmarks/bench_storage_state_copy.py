@@ -0,0 +1,127 @@
+"""Benchmark of planner StorageState copying on a synthetic cluster
+
+Builds a synthetic storage state with couples spread among dcs and runs
+a greedy search of the given depth: on every level the state is copied
+and a single group is moved to another dc, as the move candidates planner
+does. Time of copying and moving on every level is measured for clusters
+of increasing size (number of couples is doubled on every step). Copying
+cost should stay about the same for all cluster sizes, moving cost
+includes copying of the two dc states touched by the move.
+
+Requires mastermind application environment (elliptics bindings and
+mastermind config).
+
+Usage:
+    PYTHONPATH=src/cocaine-app:src/python-mastermind/src \
+        python tests/benchmarks/bench_storage_state_copy.py \
+        [--couples 1000] [--steps 4] [--dcs 3] [--uncoupled 1000] \
+        [--depth 5] [--copies 100]
+"""
+import argparse
+import itertools
+import time
+
+import planner
+from synthetic import (
+    SyntheticCouple,
+    SyntheticGroup,
+    SyntheticHost,
+    SyntheticNode,
+    SyntheticNodeBackend,
+)
+
+
+class SyntheticStat(object):
+    def __init__(self, total_space, used_space):
+        self.total_space = total_space
+        self.used_space = used_space
+
+
+def make_group(group_id, host):
+    return SyntheticGroup(group_id, [SyntheticNodeBackend(SyntheticNode(host))])
+
+
+def make_state(couples, dcs, uncoupled):
+    dc_names = ['dc{}'.format(i) for i in xrange(dcs)]
+    hosts = dict((dc, SyntheticHost(dc=dc)) for dc in dc_names)
+    state = planner.StorageState(dcs=dc_names)
+    group_ids = itertools.count(1)
+
+    for couple_idx in xrange(couples):
+        groups = []
+        # the last dc is left for the moved groups
+        for dc in dc_names[:-1]:
+            group = make_group(next(group_ids), hosts[dc])
+            state._stats[group.group_id] = SyntheticStat(
+                total_space=1024 ** 4,
+                used_space=(couple_idx % 100) * 1024 ** 3,
+            )
+            groups.append(group)
+        SyntheticCouple(groups)
+        for group in groups:
+            dc = group.node_backends[0].node.host.dc
+            state.state[dc].add_group(group)
+            state.state[dc].apply_stat(state.stats(group))
+
+    uncoupled_groups = []
+    for i in xrange(uncoupled):
+        dc = dc_names[i % dcs]
+        group = make_group(next(group_ids), hosts[dc])
+        state._stats[group.group_id] = SyntheticStat(total_space=1024 ** 4, used_space=0)
+        state.state[dc].add_uncoupled_group(group)
+        state.state[dc].apply_stat(state.stats(group))
+        uncoupled_groups.append(group)
+
+    return state, dc_names
+
+
+def run(state, dc_names, depth, copies):
+    dst_dc = dc_names[-1]
+    levels = []
+    for level in xrange(depth):
+        start = time.time()
+        for _ in xrange(copies):
+            candidate = state.copy()
+        copy_time = (time.time() - start) / copies
+
+        src_dc = dc_names[level % (len(dc_names) - 1)]
+        src_group = state.state[src_dc].groups[level]
+        dst_group = candidate.state[dst_dc].uncoupled_groups[level]
+
+        start = time.time()
+        for _ in xrange(copies):
+            candidate = state.copy()
+            candidate.move_group(src_dc, src_group, dst_dc, dst_group, [])
+        move_time = (time.time() - start) / copies - copy_time
+
+        levels.append((copy_time, move_time))
+        state = candidate
+    return levels
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--couples', type=int, default=1000)
+    parser.add_argument('--steps', type=int, default=4)
+    parser.add_argument('--dcs', type=int, default=3)
+    parser.add_argument('--uncoupled', type=int, default=1000)
+    parser.add_argument('--depth', type=int, default=5)
+    parser.add_argument('--copies', type=int, default=100)
+    args = parser.parse_args()
+
+    print '{:>10} {:>8} {:>16} {:>16}'.format('couples', 'level', 'copy, us', 'move, us')
+    for step in xrange(args.steps):
+        couples = args.couples * 2 ** step
+        state, dc_names = make_state(couples, args.dcs, args.uncoupled * 2 ** step)
+        for level, (copy_time, move_time) in enumerate(
+                run(state, dc_names, args.depth, args.copies)):
+            print '{:>10} {:>8} {:>16.1f} {:>16.1f}'.format(
+                couples,
+                level,
+                copy_time * 10 ** 6,
+                move_time * 10 ** 6,
+            )
+
+
+if __name__ == '__main__':
+    main()
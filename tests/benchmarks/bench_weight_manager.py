@@ -0,0 +1,188 @@
+"""Benchmark of WeightManager weights calculation on synthetic namespaces
+
+Builds synthetic clusters with increasing number of namespaces (doubled on
+every step) and measures the time of the first weights calculation and
+of the repeated calculation with unchanged inputs, when namespaces' results
+are reused. Fraction of namespaces with changed load can be set to measure
+partially changed clusters.
+
+Every cluster is measured twice: with default namespace settings and with
+namespaces required to weight all of their couples ('min-units' equal to
+the number of couples). Results are reused only for namespaces with all
+couples weighted, so the first setup shows the calculation without reuse
+that is typical for production settings and the second one shows the reuse
+path.
+
+Requires mastermind application environment (elliptics bindings and
+mastermind config).
+
+Usage:
+    PYTHONPATH=src/cocaine-app:src/python-mastermind/src \
+        python tests/benchmarks/bench_weight_manager.py \
+        [--namespaces 50] [--steps 4] [--couples-per-namespace 20] \
+        [--groups-per-couple 3] [--hosts 100] [--changed 0.1] [--repeat 3]
+"""
+import argparse
+import logging
+import random
+import time
+
+# storage has to be imported before infrastructure, which is imported by
+# storage itself
+import storage
+import infrastructure
+import load_manager
+from synthetic import (
+    SyntheticCouple,
+    SyntheticFs,
+    SyntheticGroup,
+    SyntheticHost,
+    SyntheticNamespace,
+    SyntheticNode,
+    SyntheticNodeBackend,
+    make_node_backend_stat,
+)
+import weight_manager
+
+
+class SyntheticStorage(object):
+    Status = storage.Status
+    Group = storage.Group
+
+    def __init__(self, namespaces, couples):
+        self.namespaces = dict((ns, ns) for ns in namespaces)
+        self.replicas_groupsets = couples
+
+
+def make_load(cls, **kwargs):
+    load = cls()
+    load.__dict__.update(kwargs)
+    return load
+
+
+def randomize_load(nb_hostname, disk_key):
+    load_manager.load_manager.net[nb_hostname] = make_load(
+        load_manager.NetLoad,
+        read_rate=random.uniform(0, 50) * 1024 ** 2,
+        write_rate=random.uniform(0, 50) * 1024 ** 2,
+        ell_write_rate=0.0,
+    )
+    load_manager.load_manager.disks[disk_key] = make_load(
+        load_manager.DiskLoad,
+        write_rate=random.uniform(0, 50) * 1024 ** 2,
+        ell_write_rate=0.0,
+        disk_util_read=random.uniform(0, 0.2),
+        disk_util_write=random.uniform(0, 0.2),
+    )
+
+
+def make_cluster(namespaces, couples_per_namespace, groups_per_couple, hosts, fully_weighted):
+    hosts = [SyntheticHost(hostname='host{}'.format(i)) for i in xrange(hosts)]
+    nss = []
+    couples = []
+    group_id = 0
+    lm = load_manager.load_manager
+    lm.namespaces, lm.node_backends, lm.net, lm.disks = {}, {}, {}, {}
+    infrastructure.infrastructure.ns_settings = {}
+    for ns_idx in xrange(namespaces):
+        ns = SyntheticNamespace('ns{}'.format(ns_idx))
+        nss.append(ns)
+        ns_settings = {
+            'groups-count': groups_per_couple,
+        }
+        if fully_weighted:
+            # results are reused only for namespaces with all couples
+            # weighted, so every couple of a namespace is required to get weight
+            ns_settings['min-units'] = couples_per_namespace
+            ns_settings['add-units'] = 0
+        infrastructure.infrastructure.ns_settings[ns] = ns_settings
+        infrastructure.infrastructure.ns_settings[ns.id] = ns_settings
+        lm.namespaces[ns] = make_load(
+            load_manager.NamespaceLoad,
+            net_write_rate=random.uniform(0, 100) * 1024 ** 2,
+            disk_util_write=random.uniform(0, 0.5),
+        )
+        for _ in xrange(couples_per_namespace):
+            groups = []
+            for _ in xrange(groups_per_couple):
+                group_id += 1
+                host = random.choice(hosts)
+                stat = make_node_backend_stat(
+                    total_space=1024 ** 4,
+                    free_space=random.randint(0, 1024 ** 4),
+                    defrag_state=0,
+                )
+                nb = SyntheticNodeBackend(SyntheticNode(host), stat=stat, fs=SyntheticFs(group_id % 10))
+                lm.node_backends[nb] = make_load(load_manager.NodeBackendLoad)
+                disk_key = (host.hostname, nb.fs.fsid)
+                if disk_key not in lm.disks:
+                    randomize_load(host.hostname, disk_key)
+                groups.append(SyntheticGroup(group_id, [nb]))
+            couple = SyntheticCouple(groups, ns)
+            ns.couples.append(couple)
+            couples.append(couple)
+    return SyntheticStorage(nss, couples)
+
+
+def change_load(cluster, changed):
+    for ns in cluster.namespaces:
+        if random.random() >= changed:
+            continue
+        load = load_manager.load_manager.namespaces[ns]
+        load.net_write_rate = random.uniform(0, 100) * 1024 ** 2
+
+
+def run(cluster, changed, repeat):
+    first, repeated = [], []
+    for _ in xrange(repeat):
+        wm = weight_manager.WeightManager()
+        start = time.time()
+        wm.update(cluster)
+        first.append(time.time() - start)
+
+        change_load(cluster, changed)
+        start = time.time()
+        wm.update(cluster)
+        repeated.append(time.time() - start)
+    return min(first), min(repeated), wm.stats['reused']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--namespaces', type=int, default=50)
+    parser.add_argument('--steps', type=int, default=4)
+    parser.add_argument('--couples-per-namespace', type=int, default=20)
+    parser.add_argument('--groups-per-couple', type=int, default=3)
+    parser.add_argument('--hosts', type=int, default=100)
+    parser.add_argument('--changed', type=float, default=0.1)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    # weights calculation logs every couple, exclude logging from measurements
+    logging.getLogger('mm.weights').setLevel(logging.ERROR)
+
+    print '{:>16} {:>12} {:>10} {:>10} {:>14} {:>10}'.format(
+        'settings', 'namespaces', 'couples', 'first, s', 'repeated, s', 'reused')
+    for step in xrange(args.steps):
+        namespaces = args.namespaces * 2 ** step
+        for settings, fully_weighted in (('default', False), ('fully weighted', True)):
+            cluster = make_cluster(
+                namespaces=namespaces,
+                couples_per_namespace=args.couples_per_namespace,
+                groups_per_couple=args.groups_per_couple,
+                hosts=args.hosts,
+                fully_weighted=fully_weighted,
+            )
+            first, repeated, reused = run(cluster, args.changed, args.repeat)
+            print '{:>16} {:>12} {:>10} {:>10.3f} {:>14.3f} {:>10}'.format(
+                settings,
+                namespaces,
+                len(cluster.replicas_groupsets),
+                first,
+                repeated,
+                reused,
+            )
+
+
+if __name__ == '__main__':
+    main()
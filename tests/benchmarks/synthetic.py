@@ -0,0 +1,101 @@
+"""Synthetic cluster entities shared by benchmarks
+
+Lightweight stand-ins for storage hosts, nodes, node backends, groups,
+couples and namespaces. Only attributes and methods used by the measured
+code are provided, synthetic clusters are built by the benchmarks
+themselves.
+
+Requires mastermind application environment (elliptics bindings and
+mastermind config).
+"""
+import time
+
+import storage
+
+
+class SyntheticHost(object):
+    def __init__(self, hostname=None, dc=None):
+        self.hostname = hostname
+        self.dc = dc
+
+
+class SyntheticNode(object):
+    def __init__(self, host):
+        self.host = host
+
+
+class SyntheticFs(object):
+    def __init__(self, fsid):
+        self.fsid = fsid
+
+
+class SyntheticNodeBackend(object):
+    def __init__(self, node, stat=None, fs=None):
+        self.node = node
+        self.stat = stat
+        self.fs = fs
+        self.group = None
+
+    @property
+    def effective_space(self):
+        return self.stat.total_space
+
+    @property
+    def free_effective_space(self):
+        return self.stat.free_space
+
+
+class SyntheticGroup(object):
+    def __init__(self, group_id, node_backends):
+        self.group_id = group_id
+        self.node_backends = node_backends
+        self.couple = None
+        for nb in node_backends:
+            nb.group = self
+
+    get_stat = storage.Group.get_stat.im_func
+
+
+class SyntheticCouple(object):
+    def __init__(self, groups, namespace=None, status=storage.Status.OK):
+        self.groups = groups
+        self.namespace = namespace
+        self.status = status
+        self.active_job = None
+        for group in groups:
+            group.couple = self
+
+    get_stat = storage.Couple.get_stat.im_func
+
+    @property
+    def effective_space(self):
+        return min(sum(nb.effective_space for nb in g.node_backends) for g in self.groups)
+
+    @property
+    def effective_free_space(self):
+        return min(sum(nb.free_effective_space for nb in g.node_backends) for g in self.groups)
+
+    def as_tuple(self):
+        return tuple(g.group_id for g in self.groups)
+
+    def __iter__(self):
+        return iter(self.groups)
+
+    def __str__(self):
+        return ':'.join(str(g.group_id) for g in self.groups)
+
+
+class SyntheticNamespace(object):
+    def __init__(self, ns_id):
+        self.id = ns_id
+        self.couples = []
+
+
+def make_node_backend_stat(total_space, free_space, **kwargs):
+    stat = storage.NodeBackendStat(storage.NodeStat())
+    stat.ts = time.time()
+    stat.total_space = total_space
+    stat.free_space = free_space
+    for attr, value in kwargs.iteritems():
+        setattr(stat, attr, value)
+    return stat
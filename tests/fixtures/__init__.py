@@ -1,4 +1,4 @@
-from pool_workers import delay_task_worker_pool
+from pool_workers import delay_task_worker_pool, shm_delay_task_worker_pool
 from util import ascii_data
 from monitor_stat_worker import (
     monitor_pool,
@@ -10,6 +10,7 @@ from monitor_stat_worker import (
 __all__ = [
     'ascii_data',
     'delay_task_worker_pool',
+    'shm_delay_task_worker_pool',
     'monitor_pool',
     'monitor_server',
     'monitor_port',
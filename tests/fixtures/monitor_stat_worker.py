@@ -14,7 +14,7 @@ from mastermind.monitor_pool import MonitorStatParseWorker
 
 
 @pytest.fixture
-def monitor_pool(monitor_port, request_timeout):
+def monitor_pool(monitor_port, request_timeout, extract_fields):
     """Pool of monitor stat workers"""
     pool = Pool(
         processes=1,
@@ -22,6 +22,7 @@ def monitor_pool(monitor_port, request_timeout):
         w_initkwds={
             'monitor_port': monitor_port,
             'request_timeout': request_timeout,
+            'extract_fields': extract_fields,
         }
     )
     return pool
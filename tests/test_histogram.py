@@ -0,0 +1,43 @@
+from mastermind.utils.histogram import Histogram
+
+
+class TestHistogram(object):
+    def test_empty(self):
+        h = Histogram()
+        assert h.count == 0
+        assert h.percentile(50) is None
+
+    def test_buckets(self):
+        h = Histogram(bounds=(1, 2, 5))
+        for value in (0.5, 1, 1.5, 3, 10):
+            h.add(value)
+        assert h.counts == [2, 1, 1, 1]
+        assert h.count == 5
+        assert h.sum == 16.0
+        assert h.min == 0.5
+        assert h.max == 10
+
+    def test_percentile(self):
+        h = Histogram(bounds=(1, 2, 5))
+        for _ in xrange(90):
+            h.add(0.5)
+        for _ in xrange(9):
+            h.add(3)
+        h.add(7)
+        assert h.percentile(50) == 1
+        assert h.percentile(90) == 1
+        assert h.percentile(99) == 5
+        assert h.percentile(100) == 7
+
+    def test_dump(self):
+        h = Histogram(bounds=(1, 2))
+        h.add(1.5)
+        h.add(4)
+        dump = h.dump()
+        assert dump['count'] == 2
+        assert dump['p50'] == 2
+        assert dump['buckets'] == [
+            {'le': 1, 'count': 0},
+            {'le': 2, 'count': 1},
+            {'le': None, 'count': 1},
+        ]
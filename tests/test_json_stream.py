@@ -0,0 +1,84 @@
+import json
+import re
+
+import pytest
+
+from mastermind.utils.json_stream import ANY_KEY, JsonObjectStreamExtractor, extract_fields
+from fixtures.util import parametrize
+
+
+DOC = {
+    'timestamp': {'tv_sec': 1, 'tv_usec': 2},
+    'skipped': [1, 2.5, {'a': 'b'}, None, True],
+    'backends': {
+        '1': {'backend_id': 1, 'size': 10 ** 12, 'name': u'\u0444', 'extra': {'x': 'y'}},
+        '2': {'backend_id': 2, 'size': -1.5e-3, 'name': 'b', 'extra': {}},
+    },
+    'stats': {
+        'eblob.1.disk.stat_commit.errors.30': {'count': 3, 'frequency': 1},
+        'eblob.1.disk.read': {'count': 1},
+    },
+}
+
+FIELDS = {
+    'timestamp': True,
+    'backends': {
+        ANY_KEY: {
+            'backend_id': True,
+            'size': True,
+            'name': True,
+        },
+    },
+    'stats': {
+        re.compile(r'^eblob\.\d+\.disk\.stat_commit\.errors\.'): {'count': True},
+    },
+}
+
+
+def stream_extract(data, fields, chunk_size):
+    extractor = JsonObjectStreamExtractor(fields)
+    for i in xrange(0, len(data), chunk_size):
+        extractor.feed(data[i:i + chunk_size])
+    return extractor.close()
+
+
+class TestExtractFields(object):
+    def test_extract(self):
+        assert extract_fields(DOC, FIELDS) == {
+            'timestamp': {'tv_sec': 1, 'tv_usec': 2},
+            'backends': {
+                '1': {'backend_id': 1, 'size': 10 ** 12, 'name': u'\u0444'},
+                '2': {'backend_id': 2, 'size': -1.5e-3, 'name': 'b'},
+            },
+            'stats': {
+                'eblob.1.disk.stat_commit.errors.30': {'count': 3},
+            },
+        }
+
+    def test_whole_value(self):
+        assert extract_fields(DOC, True) == DOC
+
+
+class TestJsonObjectStreamExtractor(object):
+
+    @parametrize(
+        'chunk_size, indent',
+        [(1, None), (3, 2), (64, None), (1024 * 1024, 2)],
+        arglabels={
+            'chunk_size': 'chunk size',
+        },
+    )
+    def test_extract(self, chunk_size, indent):
+        data = json.dumps(DOC, indent=indent)
+        assert stream_extract(data, FIELDS, chunk_size) == extract_fields(DOC, FIELDS)
+
+    def test_empty_object(self):
+        assert stream_extract('{}', FIELDS, 1) == {}
+
+    @parametrize(
+        'data',
+        ['{"a": 1', '{"a" 1}', '[1, 2]', '{"a": 1} 2', '{"a": 1,, "b": 2}'],
+    )
+    def test_malformed(self, data):
+        with pytest.raises(ValueError):
+            stream_extract(data, FIELDS, 1)
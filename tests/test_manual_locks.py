@@ -0,0 +1,64 @@
+"""Tests of manual host locks kept in memory by children locks watch
+
+Require mastermind application modules to be importable, e.g.:
+    PYTHONPATH=src/cocaine-app py.test tests/test_manual_locks.py
+"""
+import threading
+
+import pytest
+
+try:
+    import manual_locks
+    from sync.fake_sync import SyncManager
+except (ImportError, ValueError) as e:
+    pytest.skip('mastermind application is not available: {}'.format(e),
+                allow_module_level=True)
+
+
+class FakeHost(object):
+    def __init__(self, hostname):
+        self.hostname = hostname
+
+
+@pytest.fixture
+def locker(monkeypatch):
+    sync_manager = SyncManager()
+    monkeypatch.setattr(manual_locks, 'sync_manager', sync_manager)
+    monkeypatch.setattr(
+        manual_locks.storage,
+        'hosts',
+        [FakeHost('host-1'), FakeHost('host-2')],
+    )
+    return manual_locks.ManualLocker(), sync_manager
+
+
+def get_locked_hosts(locker, timeout=3.0):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(locker.get_locked_hosts()))
+    thread.daemon = True
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), 'get_locked_hosts is blocked'
+    return result[0]
+
+
+class TestManualLocker(object):
+    def test_get_locked_hosts_sets_watch(self, locker):
+        locker, sync_manager = locker
+        sync_manager.persistent_locks_acquire([locker.HOST_LOCK.format('host-1')])
+
+        hosts = get_locked_hosts(locker)
+
+        assert set(h.hostname for h in hosts) == set(['host-1'])
+        assert not locker.is_stale()
+
+    def test_get_locked_hosts_follows_watch(self, locker):
+        locker, sync_manager = locker
+        assert get_locked_hosts(locker) == frozenset()
+
+        lock_id = locker.HOST_LOCK.format('host-2')
+        sync_manager.persistent_locks_acquire([lock_id])
+        assert set(h.hostname for h in get_locked_hosts(locker)) == set(['host-2'])
+
+        sync_manager.persistent_locks_release([lock_id])
+        assert get_locked_hosts(locker) == frozenset()
@@ -22,12 +22,18 @@ from fixtures.util import parametrize
     (0.2,),
     arglabels={'request_timeout': 'request timeout'}
 )
+@parametrize(
+    'extract_fields',
+    (None, {'data': True}),
+    arglabels={'extract_fields': 'extract fields'}
+)
 class TestMonitorStatParseWorker(object):
     """Test MonitorStatParse worker
 
     This suit validates:
         - acting upon various http response statuses;
         - support of 'deflate' encoding;
+        - streaming decoding of the required fields;
         - timeout tolerance.
     """
     @parametrize(
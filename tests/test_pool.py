@@ -221,3 +221,120 @@ class TestPool(object):
         it = delay_task_worker_pool.imap(None, xrange(RESULTS_NUM))
         for i in xrange(RESULTS_NUM):
             assert it.next() == i
+
+    @parametrize(
+        'processes, task_delay',
+        [(2, 1.0)],
+        arglabels={
+            'task_delay': 'task delay'
+        },
+    )
+    def test_skip_exceptions_deadline(self, delay_task_worker_pool):
+        """Results iteration is interrupted on deadline and can be resumed"""
+        RESULTS_NUM = 4
+        results = delay_task_worker_pool.imap_unordered(None, xrange(RESULTS_NUM))
+        with pytest.raises(multiprocessing.TimeoutError):
+            list(pool.skip_exceptions(results, deadline=time.time() + 0.5))
+        assert sorted(
+            pool.skip_exceptions(results, deadline=time.time() + 5.0)
+        ) == range(RESULTS_NUM)
+
+    @parametrize(
+        'processes, task_delay',
+        [(2, 0.0)],
+        arglabels={
+            'task_delay': 'task delay'
+        },
+    )
+    def test_tasks_burst(self, delay_task_worker_pool):
+        """Burst of tasks is fetched by workers without delays"""
+        RESULTS_NUM = 5000
+        imap = TimingWrapper(
+            lambda: sorted(delay_task_worker_pool.imap_unordered(None, xrange(RESULTS_NUM)))
+        )
+        assert imap() == range(RESULTS_NUM)
+        assert imap.elapsed <= 5.0
+        delay_task_worker_pool.close()
+
+
+class TestSharedMemoryPool(object):
+    """Test passing results via shared memory
+    """
+
+    @parametrize(
+        'processes, shm_size, shm_min_size',
+        [(2, 4 * 1024 * 1024, 1024)],
+        arglabels={
+            'shm_size': 'shm size',
+            'shm_min_size': 'shm min size',
+        },
+    )
+    def test_results(self, shm_delay_task_worker_pool):
+        """Results of any size and type are passed back to the client"""
+        tasks = ['a' * 10, 'b' * 1024, 'c' * 1024 * 1024, 1, None]
+        res = shm_delay_task_worker_pool.imap(None, tasks * 10)
+        assert list(res) == tasks * 10
+        shm_delay_task_worker_pool.close()
+        shm_delay_task_worker_pool.join()
+
+    @parametrize(
+        'processes, shm_size, shm_min_size',
+        [(1, 1024, 0)],
+        arglabels={
+            'shm_size': 'shm size',
+            'shm_min_size': 'shm min size',
+        },
+    )
+    def test_ring_overflow(self, shm_delay_task_worker_pool):
+        """Results that do not fit into shared memory are passed through pipe"""
+        tasks = [chr(ord('a') + i % 26) * 300 for i in xrange(100)] + ['z' * 2048]
+        res = shm_delay_task_worker_pool.imap(None, tasks)
+        assert list(res) == tasks
+        shm_delay_task_worker_pool.close()
+        shm_delay_task_worker_pool.join()
+
+    @parametrize(
+        'processes, shm_size, shm_min_size, exitcode, kept',
+        [(1, 1024, 0, 0, True), (1, 1024, 0, 1, False)],
+        arglabels={
+            'shm_size': 'shm size',
+            'shm_min_size': 'shm min size',
+        },
+    )
+    def test_exited_worker_ring(self, shm_delay_task_worker_pool, exitcode, kept):
+        """Ring of cleanly exited worker is kept until its results are loaded"""
+
+        class ExitedWorker(object):
+            def __init__(self, ring):
+                self.exitcode = exitcode
+                self.shm_ring = ring
+
+            def join(self):
+                pass
+
+        p = shm_delay_task_worker_pool
+        ring = pool.SharedMemoryRing(-1, 1024)
+        ring.put('a' * 100)
+        p._shm_rings[ring.id] = ring
+        p._pool.append(ExitedWorker(ring))
+        p._join_exited_workers()
+
+        assert (ring.id in p._shm_rings) == kept
+        p.terminate()
+
+    def test_exited_worker_ring_is_released_when_drained(self):
+        """Ring of exited worker is released after all its results are loaded"""
+        ring = pool.SharedMemoryRing(0, 1024)
+        results = [
+            (0, task_id, (True, ring.put(data)))
+            for task_id, data in enumerate(['a' * 100, 'b' * 100])
+        ]
+        rings, exited_rings = {ring.id: ring}, {ring.id: ring}
+        get = pool.Pool._shm_get(lambda: results.pop(0), rings, exited_rings)
+
+        assert get() == (0, 0, (True, 'a' * 100))
+        assert ring.id in rings
+        assert get() == (0, 1, (True, 'b' * 100))
+        assert ring.id not in rings
+        assert ring.id not in exited_rings
+
@@ -0,0 +1,43 @@
+from mastermind.utils import time_slicer
+from mastermind.utils.time_slicer import TimeSlicer
+
+
+class FakeTime(object):
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, secs):
+        self.sleeps.append(secs)
+        self.now += secs
+
+
+class TestTimeSlicer(object):
+    def test_pauses_after_time_slice(self, monkeypatch):
+        fake_time = FakeTime()
+        monkeypatch.setattr(time_slicer, 'time', fake_time)
+
+        slicer = TimeSlicer(time_slice=0.1, pause=0.01)
+        for _ in xrange(10):
+            fake_time.now += 0.03
+            slicer.tick()
+
+        # work of 0.3 seconds is interrupted after every 0.1 seconds slice
+        assert fake_time.sleeps == [0.01, 0.01]
+        assert slicer.pauses == 2
+        assert abs(slicer.paused_time - 0.02) < 1e-9
+
+    def test_no_pause_within_time_slice(self, monkeypatch):
+        fake_time = FakeTime()
+        monkeypatch.setattr(time_slicer, 'time', fake_time)
+
+        slicer = TimeSlicer(time_slice=1.0, pause=0.01)
+        for _ in xrange(10):
+            fake_time.now += 0.01
+            slicer.tick()
+
+        assert fake_time.sleeps == []
+        assert slicer.pauses == 0